@@ -16,9 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from screener.views import ValueAreaCheckView
+from screener.views import MetricsView, ValueAreaCheckView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('value-area-check/', ValueAreaCheckView.as_view(), name='value_area_check'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
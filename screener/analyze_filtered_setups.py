@@ -1,17 +1,13 @@
-import json
 from datetime import datetime
 from collections import defaultdict, Counter
+from results_store import iter_setups
 
 def main():
     # Input file
     input_file = "results/filtered_setups_march_28_29.json"
     
-    # Load the JSON data
-    with open(input_file, 'r') as f:
-        data = json.load(f)
-    
-    # Get the filtered setups
-    setups = data['setups']
+    # Load the filtered setups (legacy JSON or streamed NDJSON results)
+    setups = list(iter_setups(input_file, nested=True))
     
     # Group setups by date
     setups_by_date = defaultdict(list)
@@ -1,22 +1,17 @@
-import json
 from datetime import datetime
 from collections import defaultdict, Counter
+from results_store import iter_setups, load_metadata
 
 def main():
     # Input files
     optimized_file = "results/optimized_coin_setups_20250329_121303.json"
     previous_file = "results/filtered_setups_march_28_29.json"
     
-    # Load the JSON data
-    with open(optimized_file, 'r') as f:
-        optimized_data = json.load(f)
+    # Load run metadata and setups (legacy JSON or streamed NDJSON results)
+    optimized_data = load_metadata(optimized_file)
     
-    with open(previous_file, 'r') as f:
-        previous_data = json.load(f)
-    
-    # Get the setups
-    optimized_setups = optimized_data['setups']
-    previous_setups = previous_data['setups']
+    optimized_setups = list(iter_setups(optimized_file, nested=True))
+    previous_setups = list(iter_setups(previous_file, nested=True))
     
     # Group setups by date
     opt_by_date = defaultdict(list)
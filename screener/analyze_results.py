@@ -0,0 +1,197 @@
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from results_store import RESULTS_EXTENSION, META_EXTENSION, TIMINGS_EXTENSION, iter_setup_frames, load_metadata
+
+# Columns needed for the breakdowns; everything else is skipped while loading
+ANALYSIS_COLUMNS = ["symbol", "type", "fvg_5m_timestamp", "fvg_1h_timestamp"]
+
+# Group keys of the per-run count cube every breakdown is derived from
+CUBE_KEYS = ["run", "date_5m", "symbol", "type", "date_1h"]
+
+RUN_TIMESTAMP_PATTERN = re.compile(r"(\d{8}_\d{6})")
+
+
+def expand_paths(patterns):
+    """Expand file paths and glob patterns into a sorted list of result files."""
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isdir(path):
+                matches_in_dir = glob.glob(os.path.join(path, f"*{RESULTS_EXTENSION}"))
+                matches_in_dir += glob.glob(os.path.join(path, "*.json"))
+                paths.update(matches_in_dir)
+            else:
+                paths.add(path)
+    return sorted(path for path in paths if not path.endswith((META_EXTENSION, TIMINGS_EXTENSION)))
+
+
+def get_run_time(path):
+    """Get when a run happened, from its file name or its metadata."""
+    match = RUN_TIMESTAMP_PATTERN.search(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+    try:
+        timestamp = load_metadata(path).get("timestamp")
+        if timestamp:
+            return pd.Timestamp(timestamp).to_pydatetime()
+    except Exception:
+        pass
+    return datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+
+
+def run_names(paths):
+    """
+    Unique name per run: its path relative to the directory all runs share, without extension.
+
+    Runs from one directory are named by their file name, while same-named
+    runs from different directories keep the directories telling them apart.
+    The extension is only kept where two formats of one run would collide.
+    """
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    relative = [os.path.relpath(os.path.abspath(path), root) for path in paths]
+    names = [os.path.splitext(path)[0] for path in relative]
+    return [path if names.count(name) > 1 else name for name, path in zip(names, relative)]
+
+
+def count_run(path, run=None):
+    """
+    Reduce one result run to setup counts per 5M date, symbol, type and 1H date.
+
+    Runs are read in chunks so memory stays bounded by the chunk size and the
+    number of distinct groups, not by the number of setups.
+    """
+    if run is None:
+        run = os.path.splitext(os.path.basename(path))[0]
+    counts = []
+    try:
+        for chunk in iter_setup_frames(path, columns=ANALYSIS_COLUMNS):
+            chunk = pd.DataFrame({
+                "date_5m": chunk["fvg_5m_timestamp"].dt.strftime("%Y-%m-%d"),
+                "symbol": chunk["symbol"].astype(str),
+                "type": chunk["type"].astype(str),
+                "date_1h": chunk["fvg_1h_timestamp"].dt.strftime("%Y-%m-%d"),
+            })
+            counts.append(chunk.value_counts(dropna=False).rename("setups").reset_index())
+    except Exception as e:
+        print(f"Error reading {path}: {e}")
+        return None
+
+    if not counts:
+        return pd.DataFrame(columns=CUBE_KEYS + ["setups"])
+
+    cube = pd.concat(counts, ignore_index=True)
+    cube = cube.groupby(CUBE_KEYS[1:], dropna=False, observed=True)["setups"].sum().reset_index()
+    cube.insert(0, "run", run)
+    return cube
+
+
+def load_runs(paths, max_workers=None):
+    """Count every run in parallel and stack them into one count cube, keyed by run_names()."""
+    if max_workers is None:
+        max_workers = min(os.cpu_count(), 4)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        cubes = [cube for cube in executor.map(count_run, paths, run_names(paths)) if cube is not None]
+
+    if not cubes:
+        return pd.DataFrame(columns=CUBE_KEYS + ["setups"])
+
+    cube = pd.concat(cubes, ignore_index=True)
+    for column in CUBE_KEYS:
+        cube[column] = cube[column].astype("category")
+    cube["setups"] = cube["setups"].astype("int64")
+    return cube
+
+
+def breakdown(cube, key):
+    """Total setups per value of one key, across all runs."""
+    return (cube.groupby(key, observed=True)["setups"].sum()
+            .sort_values(ascending=False))
+
+
+def run_diffs(cube, key, runs):
+    """Setup counts per run for one key, with the change from the previous run."""
+    counts = cube.pivot_table(index=key, columns="run", values="setups",
+                              aggfunc="sum", fill_value=0, observed=True)
+    counts = counts.reindex(columns=runs, fill_value=0)
+    diffs = counts.diff(axis=1).iloc[:, 1:].add_prefix("diff_")
+    return pd.concat([counts, diffs], axis=1)
+
+
+def print_table(title, frame):
+    print(f"\n=== {title} ===")
+    if len(frame) == 0:
+        print("No setups")
+        return
+    print(frame.to_string())
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze setups across any number of screener result runs")
+    parser.add_argument("paths", nargs="*", default=["results"],
+                        help="Result files, directories or glob patterns (default: results)")
+    parser.add_argument("--since", type=parse_date, help="Only include runs from this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=parse_date, help="Only include runs before this date (YYYY-MM-DD)")
+    parser.add_argument("--diff", action="store_true", help="Show run-to-run differences")
+    parser.add_argument("--top", type=int, default=50, help="Rows to show per breakdown")
+    parser.add_argument("--csv", help="Directory to write the breakdowns to as CSV files")
+    args = parser.parse_args()
+
+    # Select runs, ordered by when they happened
+    runs = [(get_run_time(path), path) for path in expand_paths(args.paths)]
+    runs = [
+        (run_time, path) for run_time, path in runs
+        if (args.since is None or run_time >= args.since) and (args.until is None or run_time < args.until)
+    ]
+    runs.sort()
+    paths = [path for _, path in runs]
+
+    if not paths:
+        print("No result files found")
+        return
+
+    print(f"Loading {len(paths)} result runs...")
+    cube = load_runs(paths)
+    names = run_names(paths)
+
+    tables = {
+        "setups_by_5m_date": breakdown(cube, "date_5m").sort_index(),
+        "setups_by_coin": breakdown(cube, "symbol"),
+        "setups_by_type": breakdown(cube, "type"),
+        "setups_by_1h_date": breakdown(cube, "date_1h").sort_index(),
+        "setups_by_run": breakdown(cube, "run").reindex(names, fill_value=0),
+    }
+    if args.diff and len(names) > 1:
+        tables["diff_by_5m_date"] = run_diffs(cube, "date_5m", names)
+        tables["diff_by_coin"] = run_diffs(cube, "symbol", names)
+        tables["diff_by_type"] = run_diffs(cube, "type", names)
+
+    print("\n===== RESULT RUNS SUMMARY =====")
+    print(f"Runs: {len(names)}")
+    print(f"Total setups: {int(cube['setups'].sum())}")
+    for name, table in tables.items():
+        print_table(name.replace("_", " ").title(), table.head(args.top))
+
+    if args.csv:
+        if not os.path.exists(args.csv):
+            os.makedirs(args.csv)
+        for name, table in tables.items():
+            table.to_csv(os.path.join(args.csv, f"{name}.csv"))
+        print(f"\nBreakdowns saved to: {args.csv}")
+
+if __name__ == "__main__":
+    main()
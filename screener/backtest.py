@@ -0,0 +1,246 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from candle_store import read_candles, timeframe_to_ms
+from results_store import iter_setup_frames
+from analyze_results import expand_paths
+
+# Columns a setup batch needs; fvg_5m_timestamp is the middle candle of the 5M gap
+SETUP_COLUMNS = ["symbol", "type", "stop_loss", "risk_reward", "fvg_5m_timestamp"]
+
+WIN = "win"
+LOSS = "loss"
+OPEN = "open"
+INVALID = "invalid"
+
+
+def build_range_max_table(values):
+    """
+    Build a sparse table of range maxima.
+
+    Level k holds max(values[i:i + 2**k]) for every i where that window fits,
+    which lets first-hit searches jump over whole blocks of candles at once.
+    """
+    table = [np.asarray(values, dtype="f8")]
+    step = 1
+    while step * 2 <= len(values):
+        previous = table[-1]
+        table.append(np.maximum(previous[:-step], previous[step:]))
+        step *= 2
+    return table
+
+
+def first_hit(table, starts, thresholds):
+    """
+    Find, for every search at once, the first index >= start whose value reaches its threshold.
+
+    Uses binary lifting over the range-max table: each level either skips a
+    block of 2**k candles whose maximum stays below the threshold or stops,
+    so all searches finish in log2(n) vectorized steps.
+
+    Args:
+        table (list): Output of build_range_max_table
+        starts (np.ndarray): Start index per search
+        thresholds (np.ndarray): Threshold per search
+
+    Returns:
+        np.ndarray: First hit index per search, or len(values) if never hit
+    """
+    n = len(table[0])
+    position = np.asarray(starts, dtype="i8").copy()
+    for level in range(len(table) - 1, -1, -1):
+        step = 1 << level
+        can_jump = position + step <= n
+        jump_index = np.flatnonzero(can_jump)
+        block_max = table[level][position[jump_index]]
+        position[jump_index[block_max < thresholds[jump_index]]] += step
+    return position
+
+
+def backtest_symbol(setups, candles, timeframe_ms, max_bars=None):
+    """
+    Resolve all setups of one symbol against its candles.
+
+    Entry is the close of the candle that completes the 5M gap (the one after
+    the middle candle). Every later candle is checked for the stop and the
+    risk_reward target; when both are touched in the same candle the stop is
+    assumed to have been hit first.
+
+    Returns:
+        pd.DataFrame: Outcome columns aligned with the setups index
+    """
+    count = len(setups)
+    outcome = np.full(count, INVALID, dtype=object)
+    entry = np.full(count, np.nan)
+    target = np.full(count, np.nan)
+    r_multiple = np.full(count, np.nan)
+    resolved_at = np.full(count, np.datetime64("NaT"), dtype="datetime64[ms]")
+    bars_to_resolution = np.full(count, np.nan)
+
+    result = pd.DataFrame(index=setups.index)
+    if len(candles) == 0 or count == 0:
+        result["outcome"] = outcome
+        return result.assign(entry=entry, target=target, r_multiple=r_multiple,
+                             resolved_at=resolved_at, bars_to_resolution=bars_to_resolution)
+
+    timestamps = candles["timestamp"]
+    highs = np.asarray(candles["high"], dtype="f8")
+    lows = np.asarray(candles["low"], dtype="f8")
+    closes = np.asarray(candles["close"], dtype="f8")
+    n = len(candles)
+
+    # Locate the candle completing each gap with a single searchsorted
+    gap_ms = setups["fvg_5m_timestamp"].to_numpy(dtype="datetime64[ms]").astype("i8")
+    entry_index = np.searchsorted(timestamps, gap_ms + timeframe_ms, side="left")
+    has_entry = entry_index < n
+    has_entry[has_entry] &= timestamps[entry_index[has_entry]] == gap_ms[has_entry] + timeframe_ms
+    entry[has_entry] = closes[entry_index[has_entry]]
+
+    bullish = (setups["type"].astype(str) == "bullish").to_numpy()
+    stop = setups["stop_loss"].to_numpy(dtype="f8")
+    reward = setups["risk_reward"].fillna(2).to_numpy(dtype="f8")
+
+    # Stops on the wrong side of entry make the risk undefined
+    risk = np.where(bullish, entry - stop, stop - entry)
+    valid = has_entry & (risk > 0)
+    target[valid] = np.where(bullish, entry + reward * risk, entry - reward * risk)[valid]
+
+    starts = entry_index + 1
+    limit = np.full(count, n, dtype="i8")
+    if max_bars is not None:
+        limit = np.minimum(limit, starts + max_bars)
+
+    # Bullish: stop when low <= stop, target when high >= target.
+    # Bearish mirrors this, so searches are run on highs and negated lows.
+    high_table = build_range_max_table(highs)
+    low_table = build_range_max_table(-lows)
+
+    target_hit = np.full(count, n, dtype="i8")
+    stop_hit = np.full(count, n, dtype="i8")
+    for is_bullish, target_table, stop_table, sign in ((True, high_table, low_table, 1), (False, low_table, high_table, -1)):
+        selected = np.flatnonzero(valid & (bullish == is_bullish))
+        if len(selected) == 0:
+            continue
+        target_hit[selected] = first_hit(target_table, starts[selected], sign * target[selected])
+        stop_hit[selected] = first_hit(stop_table, starts[selected], -sign * stop[selected])
+
+    target_hit = np.where(target_hit < limit, target_hit, n)
+    stop_hit = np.where(stop_hit < limit, stop_hit, n)
+
+    won = valid & (target_hit < stop_hit)
+    lost = valid & (stop_hit <= target_hit) & (stop_hit < n)
+    outcome[valid] = OPEN
+    outcome[won] = WIN
+    outcome[lost] = LOSS
+    r_multiple[won] = reward[won]
+    r_multiple[lost] = -1.0
+
+    hit_index = np.where(won, target_hit, stop_hit)
+    resolved = won | lost
+    resolved_at[resolved] = timestamps[hit_index[resolved]].astype("datetime64[ms]")
+    bars_to_resolution[resolved] = hit_index[resolved] - entry_index[resolved]
+
+    result["outcome"] = outcome
+    return result.assign(entry=entry, target=target, r_multiple=r_multiple,
+                         resolved_at=pd.to_datetime(resolved_at, utc=True),
+                         bars_to_resolution=bars_to_resolution)
+
+
+def backtest_setups(setups, timeframe="5m", max_bars=None, store_dir=None):
+    """
+    Check every setup against stored candles for whether it reached target or stop first.
+
+    Args:
+        setups (pd.DataFrame): Flattened setups with at least SETUP_COLUMNS
+        timeframe (str): Timeframe of the candles the setups were found on
+        max_bars (int, optional): Leave setups open if unresolved after this many candles
+        store_dir (str, optional): Candle store directory
+
+    Returns:
+        pd.DataFrame: The setups with outcome, entry, target, r_multiple,
+            resolved_at, bars_to_resolution and hours_to_resolution columns
+    """
+    timeframe_ms = timeframe_to_ms(timeframe)
+    store_kwargs = {} if store_dir is None else {"store_dir": store_dir}
+
+    outcomes = []
+    for symbol, symbol_setups in setups.groupby(setups["symbol"].astype(str), sort=False):
+        first_gap = symbol_setups["fvg_5m_timestamp"].min()
+        since = int(first_gap.timestamp() * 1000)
+        candles = read_candles(symbol, timeframe, since=since, **store_kwargs)
+        outcomes.append(backtest_symbol(symbol_setups, candles, timeframe_ms, max_bars))
+
+    if not outcomes:
+        return setups.assign(outcome=pd.Series(dtype=object))
+
+    result = setups.join(pd.concat(outcomes))
+    result["hours_to_resolution"] = result["bars_to_resolution"] * timeframe_ms / 3_600_000
+    return result
+
+
+def summarize_outcomes(results, by=("symbol", "type")):
+    """
+    Win rate, expectancy and time to resolution per group.
+
+    Win rate and expectancy (mean R per trade) only count resolved setups.
+    """
+    results = results.assign(
+        win=results["outcome"] == WIN,
+        loss=results["outcome"] == LOSS,
+        open=results["outcome"] == OPEN,
+        invalid=results["outcome"] == INVALID,
+    )
+    keys = [results[key].astype(str) for key in by] if by else [pd.Series("all", index=results.index, name="group")]
+    grouped = results.groupby(keys)
+    summary = grouped.agg(
+        setups=("outcome", "size"),
+        wins=("win", "sum"),
+        losses=("loss", "sum"),
+        open=("open", "sum"),
+        invalid=("invalid", "sum"),
+        expectancy_r=("r_multiple", "mean"),
+        median_hours_to_resolution=("hours_to_resolution", "median"),
+    )
+    resolved = summary["wins"] + summary["losses"]
+    summary.insert(5, "win_rate", (summary["wins"] / resolved.where(resolved > 0)).round(4))
+    return summary.sort_values("setups", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest screener setups against the local candle store")
+    parser.add_argument("paths", nargs="+", help="Result files, directories or glob patterns")
+    parser.add_argument("--timeframe", default="5m", help="Timeframe the setups were found on")
+    parser.add_argument("--max-bars", type=int, help="Give up on setups unresolved after this many candles")
+    parser.add_argument("--output", help="CSV file to write per-setup outcomes to")
+    args = parser.parse_args()
+
+    paths = expand_paths(args.paths)
+    frames = [frame for path in paths for frame in iter_setup_frames(path, columns=SETUP_COLUMNS)]
+    if not frames:
+        print("No setups found")
+        return
+
+    setups = pd.concat(frames, ignore_index=True).dropna(subset=["fvg_5m_timestamp", "stop_loss"])
+    print(f"Backtesting {len(setups)} setups from {len(paths)} result files...")
+
+    results = backtest_setups(setups, args.timeframe, args.max_bars)
+
+    print("\n=== Overall ===")
+    print(summarize_outcomes(results, by=()).to_string())
+    print("\n=== By Type ===")
+    print(summarize_outcomes(results, by=("type",)).to_string())
+    print("\n=== By Symbol and Type ===")
+    print(summarize_outcomes(results).to_string())
+
+    if args.output:
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        results.to_csv(args.output, index=False)
+        print(f"\nOutcomes saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import os
+import sqlite3
+import threading
+import time
+from multiprocessing import util
+
+# OHLCV cache files and their manifest
+CACHE_DIR = "cache"
+MANIFEST_NAME = "manifest.sqlite3"
+
+# Disk budget for cached OHLCV files; least recently used symbols are evicted beyond it
+CACHE_MAX_BYTES = int(os.getenv("SCREENER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Seconds the open tail of a cached range (bars not closed at fetch time) stays valid
+OPEN_TAIL_TTL = 3600
+
+# Seconds between last_used updates of one entry, so hot lookups stay read-only
+TOUCH_INTERVAL = 60
+
+# Seconds between writes of the hit counters a process batches
+HIT_FLUSH_INTERVAL = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    path TEXT NOT NULL,
+    covered_since INTEGER NOT NULL,
+    covered_until INTEGER NOT NULL,
+    closed_until INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    checksum INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (symbol, timeframe)
+);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Counters kept in the stats table
+STAT_NAMES = ("hits", "incremental", "misses", "bytes_saved", "bytes_fetched", "evictions", "bytes_evicted",
+              "corrupt", "repaired")
+
+_local = threading.local()
+
+
+class CacheManifest:
+    """
+    Index of the OHLCV cache files, shared by every process using a cache directory.
+
+    Each (symbol, timeframe) entry records the covered range [covered_since,
+    covered_until) and closed_until, the open time of the bar that was still
+    open when the data was fetched. Bars before closed_until never change,
+    so only the open tail expires: a stale entry is extended from
+    closed_until instead of being downloaded again. Files are evicted a
+    whole symbol at a time, least recently used first, once they exceed the
+    disk budget.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # The exit flush may run on another thread than the one that opened the manifest
+        self.connection = sqlite3.connect(os.path.join(cache_dir, MANIFEST_NAME), timeout=30,
+                                          check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(entries)")]
+            if "checksum" not in columns:
+                # Manifests from before checksums: their files fail verification and get repaired
+                self.connection.execute("ALTER TABLE entries ADD COLUMN checksum INTEGER NOT NULL DEFAULT -1")
+        self.pending_hits = {"hits": 0, "bytes_saved": 0}
+        self.flushed_at = time.time()
+        # Pool workers exit without running atexit hooks, but they do run multiprocessing finalizers
+        util.Finalize(self, self.flush_hits, exitpriority=10)
+
+    def lookup(self, symbol, timeframe):
+        """Manifest entry for a symbol and timeframe as a dict, or None."""
+        row = self.connection.execute(
+            "SELECT * FROM entries WHERE symbol = ? AND timeframe = ?", (symbol, timeframe)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def plan(self, entry, since, now=None):
+        """
+        How to serve a request for candles from `since` up to now.
+
+        Returns:
+            str: "hit" (serve the file), "incremental" (keep the closed bars,
+                fetch from closed_until) or "miss" (fetch everything)
+        """
+        if entry is None or entry["covered_since"] > since or entry["covered_until"] <= since:
+            return "miss"
+        now = time.time() if now is None else now
+        if now - entry["fetched_at"] < OPEN_TAIL_TTL:
+            return "hit"
+        return "incremental"
+
+    def record_hit(self, entry, now=None):
+        """
+        Count a request served from the cache and mark the symbol as used.
+
+        Hit counters are kept in the process and written with the next
+        touch, every HIT_FLUSH_INTERVAL seconds, before stats() and at exit.
+        """
+        now = time.time() if now is None else now
+        self.pending_hits["hits"] += 1
+        self.pending_hits["bytes_saved"] += entry["bytes"]
+        touch = now - entry["last_used"] >= TOUCH_INTERVAL
+        if not touch and now - self.flushed_at < HIT_FLUSH_INTERVAL:
+            return
+        with self.connection:
+            self._flush_hits(now)
+            if touch:
+                self.connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE symbol = ? AND timeframe = ?",
+                    (now, entry["symbol"], entry["timeframe"]),
+                )
+
+    def flush_hits(self):
+        """Write the hit counters batched by record_hit()."""
+        if self.pending_hits["hits"]:
+            with self.connection:
+                self._flush_hits(time.time())
+
+    def _flush_hits(self, now):
+        self._add_stats(**self.pending_hits)
+        self.pending_hits = {"hits": 0, "bytes_saved": 0}
+        self.flushed_at = now
+
+    def record_fetch(self, symbol, timeframe, path, covered_since, covered_until, closed_until,
+                     rows, nbytes, checksum, kept_rows=0, previous=None):
+        """
+        Register a file just written for a symbol and timeframe, then enforce the budget.
+
+        Args:
+            covered_since (int): Start of the requested range in epoch ms
+            covered_until (int): End of the last cached bar in epoch ms
+            closed_until (int): Open time of the bar still open at fetch time
+            rows (int): Candles in the file
+            nbytes (int): File size
+            checksum (int): CRC-32 of the file, verified on every read
+            kept_rows (int): Candles reused from the previous file (incremental fetch)
+            previous (dict, optional): Entry the file replaces
+
+        Returns:
+            list: Symbols evicted to stay within the budget
+        """
+        now = time.time()
+        saved = previous["bytes"] * kept_rows // previous["rows"] if previous and previous["rows"] else 0
+        with self.connection:
+            if kept_rows:
+                self._add_stats(incremental=1, bytes_saved=saved, bytes_fetched=nbytes - saved)
+            else:
+                self._add_stats(misses=1, bytes_fetched=nbytes)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (symbol, timeframe, path, covered_since, covered_until, "
+                "closed_until, rows, bytes, checksum, fetched_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (symbol, timeframe, path, covered_since, covered_until, closed_until, rows, nbytes, checksum, now, now),
+            )
+            return self._evict(keep=symbol)
+
+    def _evict(self, keep=None):
+        """Drop least recently used symbols until the files fit max_bytes (inside a transaction)."""
+        total = self.connection.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return []
+        evicted = []
+        symbols = self.connection.execute(
+            "SELECT symbol, SUM(bytes) FROM entries GROUP BY symbol ORDER BY MAX(last_used)"
+        ).fetchall()
+        for symbol, nbytes in symbols:
+            if total <= self.max_bytes:
+                break
+            if symbol == keep:
+                continue
+            paths = self.connection.execute("SELECT path FROM entries WHERE symbol = ?", (symbol,)).fetchall()
+            self.connection.execute("DELETE FROM entries WHERE symbol = ?", (symbol,))
+            for (path,) in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._add_stats(evictions=1, bytes_evicted=nbytes)
+            total -= nbytes
+            evicted.append(symbol)
+        return evicted
+
+    def record_corrupt(self, entry, repaired):
+        """
+        Drop the entry of a file that failed verification.
+
+        Args:
+            entry (dict): The entry, looked up under the key's lock
+            repaired (bool): Whether its closed bars could be rebuilt without downloading
+        """
+        with self.connection:
+            self._add_stats(corrupt=1, repaired=int(repaired))
+            self.connection.execute(
+                "DELETE FROM entries WHERE symbol = ? AND timeframe = ?", (entry["symbol"], entry["timeframe"])
+            )
+
+    def _add_stats(self, **counts):
+        self.connection.executemany(
+            "INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [(name, value) for name, value in counts.items() if value],
+        )
+
+    def stats(self, baseline=None):
+        """
+        Cache counters and disk use.
+
+        Args:
+            baseline (dict, optional): Earlier stats(); counters are reported
+                relative to it, e.g. for a single run
+
+        Returns:
+            dict: Counters from STAT_NAMES plus hit_rate, entries, symbols,
+                bytes and max_bytes
+        """
+        # Hits batched by other processes are written within HIT_FLUSH_INTERVAL
+        self.flush_hits()
+        values = dict(self.connection.execute("SELECT name, value FROM stats").fetchall())
+        stats = {name: values.get(name, 0) - (baseline or {}).get(name, 0) for name in STAT_NAMES}
+        requests = stats["hits"] + stats["incremental"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / requests if requests else 0.0
+        entries, symbols, nbytes = self.connection.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT symbol), COALESCE(SUM(bytes), 0) FROM entries"
+        ).fetchone()
+        stats.update(entries=entries, symbols=symbols, bytes=nbytes, max_bytes=self.max_bytes)
+        return stats
+
+
+def cache_manifest(cache_dir=CACHE_DIR):
+    """The manifest of a cache directory, opened once per process and thread."""
+    manifests = getattr(_local, "manifests", None)
+    if manifests is None or _local.pid != os.getpid():
+        # Connections must not cross a fork
+        manifests = _local.manifests = {}
+        _local.pid = os.getpid()
+    if cache_dir not in manifests:
+        manifests[cache_dir] = CacheManifest(cache_dir)
+    return manifests[cache_dir]
@@ -0,0 +1,552 @@
+import copy
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ccxt
+import numpy as np
+import pandas as pd
+import requests
+
+try:
+    from screener.concurrency import request_slot, get_controller
+    from screener.memory_cache import cached, key_lock
+except ImportError:
+    from concurrency import request_slot, get_controller
+    from memory_cache import cached, key_lock
+
+# Directory holding the long-lived candle history, one file per (symbol, timeframe)
+STORE_DIR = "candles"
+
+# On-disk record layout: epoch-ms open time plus OHLCV
+CANDLE_DTYPE = np.dtype([
+    ("timestamp", "i8"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+])
+
+FRAME_COLUMNS = {"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+
+# Binance weeks open on Monday; the epoch (1970-01-01) was a Thursday
+WEEK_OFFSET_MS = 4 * 24 * 60 * 60 * 1000
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Candles per request when filling the store from the exchange
+FETCH_LIMIT = 1000
+
+# Seconds load_candles results that include the still-open bar stay in memory
+OPEN_RANGE_TTL = 60
+
+# First candle the exchange has per store file, kept in the store directory
+HEADS_NAME = "heads.json"
+
+
+def timeframe_to_ms(timeframe):
+    """Length of one candle of a ccxt timeframe string in milliseconds."""
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+def store_path(symbol, timeframe, store_dir=STORE_DIR):
+    """Path of the store file for a symbol and timeframe."""
+    clean_symbol = symbol.replace('/', '_').replace(':', '_')
+    return os.path.join(store_dir, f"{clean_symbol}_{timeframe}.npy")
+
+
+def to_candles(data):
+    """
+    Convert OHLCV data into a sorted candle record array.
+
+    Args:
+        data: ccxt list of [timestamp, open, high, low, close, volume] rows,
+            a DataFrame indexed by timestamp with Open/High/Low/Close(/Volume)
+            columns, or an existing candle record array
+
+    Returns:
+        np.ndarray: Records with CANDLE_DTYPE
+    """
+    if isinstance(data, np.ndarray) and data.dtype == CANDLE_DTYPE:
+        return data
+
+    if isinstance(data, pd.DataFrame):
+        candles = np.empty(len(data), dtype=CANDLE_DTYPE)
+        index = pd.DatetimeIndex(data.index)
+        if index.tz is None:
+            index = index.tz_localize("UTC")
+        candles["timestamp"] = index.asi8 // 1_000_000
+        for field, column in FRAME_COLUMNS.items():
+            candles[field] = data[column].to_numpy(dtype="f8") if column in data.columns else np.nan
+        return candles
+
+    rows = np.asarray(data, dtype="f8").reshape(-1, 6)
+    candles = np.empty(len(rows), dtype=CANDLE_DTYPE)
+    candles["timestamp"] = rows[:, 0].astype("i8")
+    for position, field in enumerate(FRAME_COLUMNS, start=1):
+        candles[field] = rows[:, position]
+    return candles
+
+
+def to_frame(candles):
+    """Convert candle records into the DataFrame shape used across the screeners."""
+    df = pd.DataFrame(
+        {column: candles[field] for field, column in FRAME_COLUMNS.items()},
+        index=pd.to_datetime(candles["timestamp"], unit="ms", utc=True),
+    )
+    df.index.name = "Timestamp"
+    return df
+
+
+def merge_candles(existing, new):
+    """Merge two candle arrays, sorted by time, with new rows replacing old ones."""
+    if existing is None or len(existing) == 0:
+        merged = new
+    else:
+        merged = np.concatenate([new, existing])
+    # np.unique keeps the first occurrence, which is the newer row
+    _, first = np.unique(merged["timestamp"], return_index=True)
+    return merged[first]
+
+
+def bucket_starts(timestamps, timeframe):
+    """
+    Open time of the `timeframe` candle containing each timestamp, in epoch ms.
+
+    Months follow the calendar and weeks start on Monday, like exchange
+    candles; every other timeframe is a fixed multiple of the epoch.
+    """
+    timestamps = np.asarray(timestamps, dtype="i8")
+    if timeframe.endswith("M"):
+        months = timestamps.astype("datetime64[ms]").astype("datetime64[M]")
+        return months.astype("datetime64[ms]").astype("i8")
+    timeframe_ms = timeframe_to_ms(timeframe)
+    offset = WEEK_OFFSET_MS if timeframe.endswith("w") else 0
+    return (timestamps - offset) // timeframe_ms * timeframe_ms + offset
+
+
+def bucket_ends(starts, timeframe):
+    """Close time (exclusive) of the candles opening at `starts`."""
+    starts = np.asarray(starts, dtype="i8")
+    if timeframe.endswith("M"):
+        months = starts.astype("datetime64[ms]").astype("datetime64[M]") + 1
+        return months.astype("datetime64[ms]").astype("i8")
+    return starts + timeframe_to_ms(timeframe)
+
+
+def resample_candles(candles, timeframe, source_timeframe=None):
+    """
+    Aggregate candles into a higher timeframe with vectorized reductions.
+
+    Without `source_timeframe` every bucket is kept, and the last one may be
+    incomplete like the still-open candle an exchange returns. With it, only
+    complete bars are kept: buckets holding every source candle they span,
+    so bars with holes or that had not closed yet are dropped.
+
+    Args:
+        candles (np.ndarray): Candle records of a lower timeframe, sorted by time
+        timeframe (str): Target ccxt timeframe, e.g. "4h", "1d" or "1M"
+        source_timeframe (str, optional): Timeframe of `candles`
+
+    Returns:
+        np.ndarray: Candle records with CANDLE_DTYPE
+    """
+    if len(candles) == 0:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+
+    buckets = bucket_starts(candles["timestamp"], timeframe)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(candles)] - 1
+
+    resampled = np.empty(len(starts), dtype=CANDLE_DTYPE)
+    resampled["timestamp"] = buckets[starts]
+    resampled["open"] = candles["open"][starts]
+    resampled["high"] = np.maximum.reduceat(candles["high"], starts)
+    resampled["low"] = np.minimum.reduceat(candles["low"], starts)
+    resampled["close"] = candles["close"][ends]
+    resampled["volume"] = np.add.reduceat(candles["volume"], starts)
+
+    if source_timeframe is not None:
+        expected = (bucket_ends(resampled["timestamp"], timeframe) - resampled["timestamp"]) // timeframe_to_ms(source_timeframe)
+        resampled = resampled[ends - starts + 1 == expected]
+    return resampled
+
+
+def missing_ranges(candles, timeframe, since, until):
+    """
+    Ranges of [since, until) without stored candles, as (start, end) epoch ms pairs.
+
+    Covers a missing head, holes between stored candles and a missing tail.
+    """
+    timeframe_ms = timeframe_to_ms(timeframe)
+    timestamps = np.asarray(candles["timestamp"], dtype="i8")
+    # Candle open times bounding every stretch that could hold missing candles
+    opens = np.r_[since - timeframe_ms, timestamps, until]
+    holes = np.flatnonzero(np.diff(opens) > timeframe_ms)
+    return [(int(opens[i] + timeframe_ms), int(opens[i + 1])) for i in holes
+            if opens[i] + timeframe_ms < until]
+
+
+def read_candles(symbol, timeframe, since=None, until=None, store_dir=STORE_DIR, mmap=True):
+    """
+    Read stored candles for a symbol in [since, until).
+
+    Args:
+        symbol (str): Trading pair symbol
+        timeframe (str): ccxt timeframe, e.g. "5m"
+        since (int, optional): Start time in epoch ms
+        until (int, optional): End time in epoch ms (exclusive)
+        store_dir (str): Store directory
+        mmap (bool): Memory-map the file instead of reading it into memory
+
+    Returns:
+        np.ndarray: Candle records, empty if nothing is stored
+    """
+    path = store_path(symbol, timeframe, store_dir)
+    if not os.path.exists(path):
+        return np.empty(0, dtype=CANDLE_DTYPE)
+
+    try:
+        candles = np.load(path, mmap_mode="r" if mmap else None)
+    except (ValueError, OSError):
+        return np.empty(0, dtype=CANDLE_DTYPE)
+
+    start = 0 if since is None else np.searchsorted(candles["timestamp"], since, side="left")
+    end = len(candles) if until is None else np.searchsorted(candles["timestamp"], until, side="left")
+    return candles[start:end]
+
+
+def write_candles(symbol, timeframe, data, store_dir=STORE_DIR):
+    """
+    Merge candles into the store for a symbol and timeframe.
+
+    Candles that have not closed yet are left out, so everything in the
+    store is final and only missing ranges ever need fetching again.
+
+    The read-merge-replace holds the file's lock, so writers of the same
+    file in other threads and processes add to each other's candles
+    instead of replacing them. Callers must not hold that lock already
+    (key_lock is not reentrant).
+
+    Returns:
+        int: Number of candles stored for the symbol afterwards
+    """
+    new = to_candles(data)
+    new = new[bucket_ends(new["timestamp"], timeframe) <= int(time.time() * 1000)]
+    if len(new) == 0:
+        return 0
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+
+    path = store_path(symbol, timeframe, store_dir)
+    with key_lock(("candle_file", os.path.abspath(path))):
+        existing = read_candles(symbol, timeframe, store_dir=store_dir, mmap=False)
+        merged = merge_candles(existing, new)
+
+        # Replace the file instead of rewriting it, so memory-mapped readers
+        # (and arrays held in memory caches) keep a consistent view
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, merged)
+        os.replace(temp_path, path)
+    return len(merged)
+
+
+def list_stored_symbols(timeframe, store_dir=STORE_DIR):
+    """
+    List symbols that have candles stored for a timeframe.
+
+    File names only keep the symbol parts, so "BTC_USDT" maps back to
+    "BTC/USDT" and "BTC_USDT_USDT" to "BTC/USDT:USDT".
+    """
+    if not os.path.exists(store_dir):
+        return []
+
+    suffix = f"_{timeframe}.npy"
+    symbols = []
+    for name in sorted(os.listdir(store_dir)):
+        if not name.endswith(suffix):
+            continue
+        parts = name[:-len(suffix)].split("_")
+        symbol = f"{parts[0]}/{parts[1]}" if len(parts) > 1 else parts[0]
+        if len(parts) > 2:
+            symbol += ":" + "_".join(parts[2:])
+        symbols.append(symbol)
+    return symbols
+
+
+def stored_timeframes(symbol, store_dir=STORE_DIR):
+    """Timeframes with candles stored for a symbol."""
+    if not os.path.exists(store_dir):
+        return []
+
+    prefix = os.path.basename(store_path(symbol, "", store_dir))[:-len(".npy")]
+    timeframes = []
+    for name in os.listdir(store_dir):
+        if not name.startswith(prefix) or not name.endswith(".npy"):
+            continue
+        timeframe = name[len(prefix):-len(".npy")]
+        # "BTC_USDT_" is also a prefix of "BTC_USDT_USDT_1h.npy"
+        if "_" not in timeframe:
+            timeframes.append(timeframe)
+    return timeframes
+
+
+def can_resample(source_timeframe, timeframe):
+    """Whether candles of `source_timeframe` aggregate exactly into `timeframe`."""
+    source_ms = timeframe_to_ms(source_timeframe)
+    if timeframe.endswith(("M", "w")):
+        return source_ms <= DAY_MS and DAY_MS % source_ms == 0
+    target_ms = timeframe_to_ms(timeframe)
+    return source_ms < target_ms and target_ms % source_ms == 0
+
+
+def read_heads(store_dir=STORE_DIR):
+    """Recorded first candles, as {store file name: epoch ms}."""
+    try:
+        with open(os.path.join(store_dir, HEADS_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def stored_head(symbol, timeframe, store_dir=STORE_DIR):
+    """Open time of the first candle the exchange has for a symbol and timeframe, if known."""
+    return read_heads(store_dir).get(os.path.basename(store_path(symbol, timeframe, store_dir)))
+
+
+def record_head(symbol, timeframe, head, store_dir=STORE_DIR):
+    """
+    Remember that the exchange has no candles before `head`, e.g. before listing.
+
+    Ranges before it are left out of missing_ranges from then on, so they
+    are not requested again by every process.
+    """
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, HEADS_NAME)
+    with key_lock(("candle_heads", os.path.abspath(path))):
+        heads = read_heads(store_dir)
+        heads[os.path.basename(store_path(symbol, timeframe, store_dir))] = int(head)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(heads, f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+
+def fillable_ranges(symbol, timeframe, candles, since, until, store_dir=STORE_DIR):
+    """missing_ranges of [since, until) that the exchange can fill, i.e. after the recorded head."""
+    head = stored_head(symbol, timeframe, store_dir)
+    if head is not None:
+        since = max(since, head)
+    return missing_ranges(candles, timeframe, since, until) if since < until else []
+
+
+def fetch_pages(ranges, timeframe):
+    """Requests needed to download `ranges` of a timeframe."""
+    return sum(len(page_segments(start, end, timeframe)) for start, end in ranges)
+
+
+def resample_source(symbol, timeframe, since, until, store_dir=STORE_DIR):
+    """
+    Timeframe to build `timeframe` bars in [since, until) from: the one needing the fewest requests.
+
+    Candidates are the stored timeframes that aggregate into `timeframe`
+    plus `timeframe` itself, each costed by the pages its fillable missing
+    ranges would take. A fine series with large holes therefore loses to a
+    coarser one, or to fetching `timeframe` directly, instead of having the
+    holes downloaded at the fine resolution. Ties go to the finer timeframe.
+    """
+    candidates = {tf for tf in stored_timeframes(symbol, store_dir) if can_resample(tf, timeframe)}
+    candidates.add(timeframe)
+    costs = []
+    for source in candidates:
+        stored = read_candles(symbol, source, since, until, store_dir=store_dir)
+        pages = fetch_pages(fillable_ranges(symbol, source, stored, since, until, store_dir), source)
+        costs.append((pages, timeframe_to_ms(source), source))
+    return min(costs)[2]
+
+
+def fetch_candles(exchange, symbol, timeframe, since, until):
+    """
+    Download candles in [since, until) from the exchange, paging forward.
+
+    Pages continue until a request comes back empty or `until` is reached,
+    not just until one is shorter than asked for: exchanges cap the page
+    size below the requested limit (Binance returns at most 500 bars to
+    requests without one, 1000 on spot).
+    """
+    batches = []
+    while since < until:
+        with request_slot(exchange) as controller:
+            limit = controller.page_limit(FETCH_LIMIT)
+            ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        if not ohlcv:
+            break
+        batch = to_candles(ohlcv)
+        batches.append(batch)
+        next_since = int(bucket_ends(batch["timestamp"][-1:], timeframe)[0])
+        if next_since <= since:
+            break
+        since = next_since
+
+    if not batches:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    candles = merge_candles(None, np.concatenate(batches))
+    return candles[candles["timestamp"] < until]
+
+
+def page_segments(since, until, timeframe, limit=FETCH_LIMIT):
+    """
+    Split [since, until) into consecutive ranges of at most `limit` candles.
+
+    Boundaries fall on candle open times, so segments fetched independently
+    neither overlap nor leave holes. Monthly candles are irregular and few,
+    so they stay in one segment.
+    """
+    since = int(bucket_starts([since], timeframe)[0])
+    if since >= until:
+        return []
+    if timeframe.endswith("M"):
+        return [(since, until)]
+    step = limit * timeframe_to_ms(timeframe)
+    return [(int(start), int(min(start + step, until))) for start in np.arange(since, until, step)]
+
+
+def download_range(exchange, symbol, timeframe, since, until=None, store_dir=STORE_DIR, max_threads=None):
+    """
+    Download a deep range of candles with concurrent page-aligned requests.
+
+    [since, until) is split into FETCH_LIMIT-candle segments, fetched by up
+    to as many threads as the shared concurrency window allows (each thread
+    on its own copy of the exchange, all drawing from the shared weight
+    budget), then reassembled in order. Duplicate rows are dropped, holes
+    the exchange did not fill are reported, and closed candles are written
+    to the store.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange to download from
+        symbol (str): Trading pair symbol
+        timeframe (str): Any ccxt timeframe
+        since (int): Start time in epoch ms
+        until (int, optional): End time in epoch ms (exclusive), default now
+        store_dir (str): Store directory, or None to skip writing
+        max_threads (int, optional): Thread cap, default the concurrency window
+
+    Returns:
+        tuple: (candle records, {"segments", "duplicates", "gaps"}) where
+            gaps are (start, end) epoch ms ranges without candles
+    """
+    now_ms = exchange.milliseconds()
+    until = now_ms if until is None else min(until, now_ms)
+    segments = page_segments(since, until, timeframe)
+    if max_threads is None:
+        max_threads = int(get_controller(exchange).stats()["window"])
+    threads = max(1, min(max_threads, len(segments)))
+
+    if threads == 1:
+        batches = [fetch_candles(exchange, symbol, timeframe, start, end) for start, end in segments]
+    else:
+        local = threading.local()
+
+        def fetch_segment(segment):
+            # ccxt instances and their HTTP sessions are not thread-safe
+            if not hasattr(local, "exchange"):
+                local.exchange = copy.copy(exchange)
+                local.exchange.session = requests.Session()
+            return fetch_candles(local.exchange, symbol, timeframe, *segment)
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            batches = list(pool.map(fetch_segment, segments))
+
+    batches = [batch for batch in batches if len(batch)]
+    if not batches:
+        return np.empty(0, dtype=CANDLE_DTYPE), {"segments": len(segments), "duplicates": 0, "gaps": [(since, until)]}
+
+    joined = np.concatenate(batches)
+    candles = merge_candles(None, joined)
+    report = {
+        "segments": len(segments),
+        "duplicates": len(joined) - len(candles),
+        "gaps": missing_ranges(candles, timeframe, int(bucket_starts([since], timeframe)[0]), until),
+    }
+    if store_dir is not None:
+        write_candles(symbol, timeframe, candles, store_dir)
+    return candles, report
+
+
+def load_candles(exchange, symbol, timeframe, since, until=None, include_open=True, store_dir=STORE_DIR):
+    """
+    Candles for any timeframe, built from the store and fetched only where it has gaps.
+
+    Bars are resampled from the stored timeframe that needs the fewest
+    requests to cover the range (see resample_source). Only ranges missing
+    from that timeframe are downloaded, and the closed candles among them are
+    written back, so 1D and 4H requests after a 1H/5M screen usually cost one
+    small tail request. Heads the exchange cannot fill, like the time before
+    a listing, are recorded and not requested again.
+    Results are kept in the process memory cache (memory_cache), and
+    concurrent requests for the same range share one build.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange used for missing ranges
+        symbol (str): Trading pair symbol
+        timeframe (str): ccxt timeframe, e.g. "4h", "1d" or "1M"
+        since (int): Start time in epoch ms
+        until (int, optional): End time in epoch ms (exclusive), default now
+        include_open (bool): Keep the still-open bar, like fetch_ohlcv does;
+            otherwise only complete bars are returned
+        store_dir (str): Store directory
+
+    Returns:
+        np.ndarray: Candle records with CANDLE_DTYPE
+    """
+    now_ms = exchange.milliseconds()
+    until = now_ms if until is None else min(until, now_ms)
+    if not include_open:
+        # Complete bars never need candles from the bar still open
+        until = min(until, int(bucket_starts([now_ms], timeframe)[0]))
+    since = int(bucket_starts([since], timeframe)[0])
+
+    # Ranges of closed bars never change; ranges reaching the open bar are
+    # shared under one key for a short while
+    if until <= int(bucket_starts([now_ms], timeframe)[0]):
+        key, ttl = ("candles", store_dir, symbol, timeframe, since, until, include_open), None
+    else:
+        key, ttl = ("candles", store_dir, symbol, timeframe, since, None, include_open), OPEN_RANGE_TTL
+    return cached(key, lambda: build_candles(exchange, symbol, timeframe, since, until, include_open, now_ms, store_dir), ttl)
+
+
+def build_candles(exchange, symbol, timeframe, since, until, include_open, now_ms, store_dir=STORE_DIR):
+    """load_candles without the memory cache, for a normalized [since, until) range."""
+    source = resample_source(symbol, timeframe, since, until, store_dir)
+
+    candles = np.asarray(read_candles(symbol, source, since, until, store_dir=store_dir))
+    if fillable_ranges(symbol, source, candles, since, until, store_dir):
+        with key_lock(("candles", store_dir, symbol, source)):
+            # Another worker may have filled the gaps while this one waited
+            candles = np.asarray(read_candles(symbol, source, since, until, store_dir=store_dir))
+            ranges = fillable_ranges(symbol, source, candles, since, until, store_dir)
+            fetched = [download_range(exchange, symbol, source, start, end, store_dir=None)[0]
+                       for start, end in ranges]
+            # A first range with nothing stored before it that the exchange only partly
+            # filled ends before its first candle: there is no older data to ask for
+            known = [int(batch["timestamp"][0]) for batch in fetched if len(batch)]
+            known += [int(candles["timestamp"][0])] if len(candles) else []
+            if ranges and known and min(known) > ranges[0][0] and \
+                    len(read_candles(symbol, source, until=ranges[0][1], store_dir=store_dir)) == 0:
+                record_head(symbol, source, min(known), store_dir)
+            fetched = [batch for batch in fetched if len(batch)]
+            if fetched:
+                new = np.concatenate(fetched)
+                write_candles(symbol, source, new, store_dir)
+                candles = merge_candles(candles, new)
+
+    if source == timeframe:
+        if not include_open:
+            candles = candles[bucket_ends(candles["timestamp"], timeframe) <= now_ms]
+        return candles
+    return resample_candles(candles, timeframe, None if include_open else source)
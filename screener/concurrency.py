@@ -0,0 +1,243 @@
+import itertools
+import os
+import struct
+import time
+from contextlib import contextmanager
+
+import ccxt
+
+try:
+    from screener.rate_limit import RATE_LIMIT_DIR, WEIGHT_LIMITS, update_shared_state
+except ImportError:
+    from rate_limit import RATE_LIMIT_DIR, WEIGHT_LIMITS, update_shared_state
+
+# Requests in flight across all processes (AIMD window)
+MIN_WINDOW = 1
+MAX_WINDOW = 16
+INITIAL_WINDOW = 4
+DECREASE_FACTOR = 0.5
+
+# A response slower than this stops the window from growing
+LATENCY_TARGET = 1.5  # seconds
+LATENCY_SMOOTHING = 0.2  # EWMA weight of the newest response
+
+# Back off once X-MBX-USED-WEIGHT-1M reaches this share of the pool's cap
+WEIGHT_HIGH_WATER = 0.9
+
+# Pause for everyone after a 429/418 without a Retry-After header
+THROTTLED_PAUSE = 10  # seconds
+
+# A slot held longer than this is reclaimed, in case its holder hung or its pid was reused;
+# slots of processes that no longer exist are reclaimed right away
+LEASE_SECONDS = 120
+
+# Klines page size while the window is below INITIAL_WINDOW: USDT-M weighs
+# 2 per 499 candles against 5 per 1000, so smaller pages spend less weight
+PRESSURE_PAGE_LIMIT = 499
+
+WAIT_INTERVAL = 0.05  # seconds between checks for a free slot
+
+# window, latency EWMA, used weight share, used weight, backoff until, last decrease,
+# then one (pid, token, taken at) lease per slot, pid 0 when free
+HEADER_FIELDS = 6
+LEASE_FIELDS = 3
+STATE = struct.Struct(f"<{HEADER_FIELDS + LEASE_FIELDS * MAX_WINDOW}d")
+INITIAL_STATE = (INITIAL_WINDOW, 0.0, 0.0, 0, 0.0, 0.0) + (0.0,) * (LEASE_FIELDS * MAX_WINDOW)
+
+# Lease tokens of this process
+_tokens = itertools.count(1)
+
+
+def request_pool(url):
+    """Weight pool of a Binance request URL."""
+    if url and "fapi" in url:
+        return "futures"
+    if url and "dapi" in url:
+        return "delivery"
+    return "spot"
+
+
+def process_exists(pid):
+    """Whether a process with this pid is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lease_offsets(values):
+    """Offsets of the lease records in a state list."""
+    return range(HEADER_FIELDS, len(values), LEASE_FIELDS)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for requests in flight to one exchange, shared across processes.
+
+    The window grows by about one slot per window of healthy responses and
+    halves (at most once per round trip) on 429/418 responses or when the
+    exchange reports used weight close to the cap. Its state lives in a
+    small file like the rate limiter buckets, so every worker sees one
+    window, one set of slots and one pause after throttling. Each slot taken
+    is a lease recording its holder's pid, so slots of killed processes are
+    reclaimed rather than leaked.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _update(self, update):
+        def locked(values, now):
+            # A state file of another layout starts over
+            values = list(values or INITIAL_STATE)
+            for offset in lease_offsets(values):
+                pid, _, taken_at = values[offset:offset + LEASE_FIELDS]
+                if pid and (now - taken_at > LEASE_SECONDS or not process_exists(int(pid))):
+                    values[offset:offset + LEASE_FIELDS] = (0.0, 0.0, 0.0)
+            return values, update(values, now)
+
+        return update_shared_state(self.path, STATE, locked)
+
+    def acquire(self):
+        """
+        Wait for a free slot in the window and take it.
+
+        Returns:
+            tuple: (lease to pass to release(), seconds spent waiting)
+        """
+        lease = (os.getpid(), next(_tokens))
+
+        def take(values, now):
+            if now < values[4]:
+                return values[4] - now
+            held = [offset for offset in lease_offsets(values) if values[offset]]
+            if len(held) < int(values[0]):
+                offset = next(offset for offset in lease_offsets(values) if not values[offset])
+                values[offset:offset + LEASE_FIELDS] = (*lease, now)
+                return 0.0
+            return WAIT_INTERVAL
+
+        waited = 0.0
+        while True:
+            delay = self._update(take)
+            if delay == 0.0:
+                return lease, waited
+            time.sleep(delay)
+            waited += delay
+
+    def release(self, lease, latency, used_weight=None, weight_limit=None, throttled=False, retry_after=None):
+        """
+        Give back a slot and adjust the window from the response.
+
+        Args:
+            lease (tuple): Returned by acquire(); a lease reclaimed in the
+                meantime is not released twice
+            latency (float): Seconds the request took
+            used_weight (int, optional): X-MBX-USED-WEIGHT-1M of the response
+            weight_limit (int, optional): Per-minute cap of the request's pool
+            throttled (bool): The exchange answered 429 or 418
+            retry_after (float, optional): Retry-After of a throttled response
+        """
+        def update(values, now):
+            for offset in lease_offsets(values):
+                if tuple(values[offset:offset + 2]) == lease:
+                    values[offset:offset + LEASE_FIELDS] = (0.0, 0.0, 0.0)
+                    break
+            values[1] = latency if values[1] == 0 else (
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * values[1])
+            if used_weight is not None and weight_limit:
+                values[2] = used_weight / weight_limit
+                values[3] = used_weight
+
+            if throttled:
+                values[4] = max(values[4], now + (retry_after or THROTTLED_PAUSE))
+            if throttled or values[2] >= WEIGHT_HIGH_WATER:
+                # Halve once per round trip, not once per response in flight
+                if now - values[5] >= values[1]:
+                    values[0] = max(MIN_WINDOW, values[0] * DECREASE_FACTOR)
+                    values[5] = now
+            elif latency <= LATENCY_TARGET:
+                values[0] = min(MAX_WINDOW, values[0] + 1 / values[0])
+
+        self._update(update)
+
+    def stats(self):
+        """Current window, requests in flight, latency and observed weight usage."""
+        def read(values, now):
+            return {
+                "window": values[0],
+                "in_flight": sum(1 for offset in lease_offsets(values) if values[offset]),
+                "latency": values[1],
+                "used_weight": int(values[3]),
+                "used_weight_share": values[2],
+                "paused_for": max(values[4] - now, 0.0),
+            }
+
+        return self._update(read)
+
+    def page_limit(self, default):
+        """Klines page size for the next request, smaller while backing off."""
+        window = self.stats()["window"]
+        return default if window >= INITIAL_WINDOW else min(default, PRESSURE_PAGE_LIMIT)
+
+
+# Controllers used by this process, by state path
+_controllers = {}
+
+
+def get_controller(exchange, state_dir=RATE_LIMIT_DIR):
+    """Shared concurrency controller for an exchange."""
+    path = os.path.join(state_dir, f"concurrency_{exchange.id}.state")
+    controller = _controllers.get(path)
+    if controller is None:
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir, exist_ok=True)
+        controller = AdaptiveConcurrency(path)
+        _controllers[path] = controller
+    return controller
+
+
+def pool_workers(exchange, cpu_workers, state_dir=RATE_LIMIT_DIR):
+    """
+    Size of a process pool whose workers each send one request at a time.
+
+    At least `cpu_workers`, and as many as the shared window currently
+    allows, so the window rather than the CPU count bounds the requests in
+    flight. Pools built per chunk of symbols follow the window as it moves.
+    """
+    return max(cpu_workers, int(get_controller(exchange, state_dir).stats()["window"]))
+
+
+@contextmanager
+def request_slot(exchange, state_dir=RATE_LIMIT_DIR):
+    """
+    Run one exchange request inside the shared concurrency window.
+
+    Waits for a slot, then feeds the response time, the used weight header
+    and any 429/418 back to the controller.
+    """
+    controller = get_controller(exchange, state_dir)
+    lease, _ = controller.acquire()
+    exchange.last_response_headers = None
+    throttled = False
+    start = time.time()
+    try:
+        yield controller
+    except (ccxt.RateLimitExceeded, ccxt.DDoSProtection):
+        throttled = True
+        raise
+    finally:
+        headers = exchange.last_response_headers or {}
+        used_weight = headers.get("X-MBX-USED-WEIGHT-1M")
+        retry_after = headers.get("Retry-After")
+        controller.release(
+            lease,
+            time.time() - start,
+            used_weight=int(used_weight) if used_weight else None,
+            weight_limit=WEIGHT_LIMITS[request_pool(exchange.last_request_url)],
+            throttled=throttled,
+            retry_after=float(retry_after) if retry_after else None,
+        )
@@ -0,0 +1,271 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+
+from candle_store import read_candles, resample_candles, can_resample, timeframe_to_ms, list_stored_symbols
+from detection import detect_gaps, lines_in_ranges
+from results_store import ResultsWriter
+from thresholds import PINESCRIPT_MIN_1H_GAP_PERCENT as MIN_1H_GAP_PERCENT
+from thresholds import PINESCRIPT_MIN_5M_GAP_PERCENT as MIN_5M_GAP_PERCENT
+
+# Timeframes from highest to lowest; each gap must sit on a gap of the level above
+DEFAULT_CHAIN = ["1d", "4h", "1h", "5m"]
+
+
+def default_lookback_days(timeframe, lowest):
+    """How far back gaps are searched on a level unless given explicitly."""
+    if lowest:
+        return 7
+    return 365 if timeframe_to_ms(timeframe) >= timeframe_to_ms("1d") else 90
+
+
+def default_min_gap_percent(lowest):
+    """The 2025 screener thresholds: the 1H one for zones, the 5M one for entries."""
+    return MIN_5M_GAP_PERCENT if lowest else MIN_1H_GAP_PERCENT
+
+
+def load_chain(symbol, timeframes, as_of_ms, lookbacks_ms, store_dir=None):
+    """
+    Read closed candles for every level of a chain as of a point in time.
+
+    A timeframe without stored candles is resampled from the nearest lower
+    timeframe of the chain that is stored and divides it, so 1D and 4H zones
+    come from the 1H history the screeners already keep.
+
+    Returns:
+        tuple: (list of candle arrays, list of source descriptions), one per level
+    """
+    store_kwargs = {} if store_dir is None else {"store_dir": store_dir}
+    levels, sources = [], []
+    for position, timeframe in enumerate(timeframes):
+        timeframe_ms = timeframe_to_ms(timeframe)
+        since = as_of_ms - lookbacks_ms[position]
+        candles = read_candles(symbol, timeframe, since=since, until=as_of_ms - timeframe_ms + 1, **store_kwargs)
+        source = timeframe
+
+        if len(candles) == 0:
+            for lower in timeframes[position + 1:]:
+                if not can_resample(lower, timeframe):
+                    continue
+                lower_candles = read_candles(symbol, lower, since=since, until=as_of_ms, **store_kwargs)
+                if len(lower_candles) == 0:
+                    continue
+                # Complete bars only: the one still open at as_of_ms is dropped
+                candles = resample_candles(lower_candles, timeframe, lower)
+                source = f"{lower} resampled"
+                break
+
+        levels.append(candles)
+        sources.append(source)
+    return levels, sources
+
+
+def find_confluences(gaps, timeframes, containing_price=None, same_direction=False):
+    """
+    Resolve gap confluence top-down through a chain of timeframes.
+
+    Each level is a range query against the level above: the 1H-over-5M rule
+    of the 2025 screener (a bullish gap must contain the lower line of a gap
+    above it, a bearish gap the upper line) is applied between every pair of
+    adjacent levels. Only gaps still on a surviving path are queried, and a
+    gap can only sit on gaps that had completed before it, so each extra
+    level costs one sort and a searchsorted instead of another nested loop.
+
+    Args:
+        gaps (list): detect_gaps results, highest timeframe first
+        timeframes (list): ccxt timeframes matching `gaps`
+        containing_price (float, optional): Only start from top-level gaps
+            containing this price, like the daily check in is_price_within_fvg
+        same_direction (bool): Require every gap on a path to share a direction
+
+    Returns:
+        np.ndarray: Gap indices with shape (paths, levels)
+    """
+    known = [
+        level["timestamp"] + 2 * timeframe_to_ms(timeframe)
+        for level, timeframe in zip(gaps, timeframes)
+    ]
+
+    top = gaps[0]
+    start = np.ones(len(top["bullish"]), dtype=bool)
+    if containing_price is not None:
+        start = (top["lower_line"] < containing_price) & (containing_price < top["upper_line"])
+    paths = np.flatnonzero(start)[:, None]
+
+    for level in range(1, len(gaps)):
+        if len(paths) == 0:
+            break
+        parent, child = gaps[level - 1], gaps[level]
+        tips = np.unique(paths[:, -1])
+
+        edge_parent, edge_child = [], []
+        for is_bullish, line_field in ((True, "lower_line"), (False, "upper_line")):
+            selected = np.flatnonzero(child["bullish"] == is_bullish)
+            ranges, lines = lines_in_ranges(parent[line_field][tips],
+                                            child["lower_line"][selected],
+                                            child["upper_line"][selected])
+            edge_parent.append(tips[lines])
+            edge_child.append(selected[ranges])
+        edge_parent = np.concatenate(edge_parent)
+        edge_child = np.concatenate(edge_child)
+
+        keep = known[level - 1][edge_parent] <= known[level][edge_child]
+        if same_direction:
+            keep &= parent["bullish"][edge_parent] == child["bullish"][edge_child]
+        edge_parent, edge_child = edge_parent[keep], edge_child[keep]
+
+        # Join paths to edges on their tip: a tip is a zero-width range over edge parents
+        tip = paths[:, -1].astype("f8")
+        path_index, edge_index = lines_in_ranges(edge_parent.astype("f8"), tip, tip)
+        paths = np.column_stack([paths[path_index], edge_child[edge_index]])
+
+    if paths.shape[1] < len(gaps):
+        return np.empty((0, len(gaps)), dtype="i8")
+    return paths
+
+
+def _gap_record(gaps, index):
+    return {
+        "type": "bullish" if gaps["bullish"][index] else "bearish",
+        "upper_line": gaps["upper_line"][index],
+        "lower_line": gaps["lower_line"][index],
+        "middle_candle_high": gaps["middle_high"][index],
+        "middle_candle_low": gaps["middle_low"][index],
+        "gap_percent": gaps["gap_percent"][index],
+        "timestamp": pd.Timestamp(gaps["timestamp"][index], unit="ms", tz="UTC")
+    }
+
+
+def confluence_setups(symbol, timeframes, gaps, paths, current_price):
+    """Build one setup per path, with a nested fvg_<timeframe> dict per level."""
+    entry = gaps[-1]
+    setups = []
+    for path in paths:
+        i = path[-1]
+        is_bullish = bool(entry["bullish"][i])
+        setup = {
+            "symbol": symbol,
+            "type": "bullish" if is_bullish else "bearish",
+            "current_price": current_price,
+            "chain": ",".join(timeframes),
+        }
+        for timeframe, level, index in zip(timeframes, gaps, path):
+            setup[f"fvg_{timeframe}"] = _gap_record(level, index)
+        setup[f"fvg_{timeframes[-1]}"]["gap_size"] = entry["upper_line"][i] - entry["lower_line"][i]
+        setup["stop_loss"] = entry["middle_low"][i] if is_bullish else entry["middle_high"][i]
+        setup["risk_reward"] = 2
+        setup["alignment_type"] = "lower" if is_bullish else "upper"
+        setups.append(setup)
+    return setups
+
+
+def screen_confluence(symbol, timeframes, as_of_ms, lookbacks_ms, min_gap_percents,
+                      store_dir=None, price_in_top=False, same_direction=False):
+    """
+    Screen one symbol for gaps stacked across a chain of timeframes.
+
+    Args:
+        symbol (str): Trading pair symbol
+        timeframes (list): ccxt timeframes, highest first, e.g. ["1d", "4h", "1h", "5m"]
+        as_of_ms (int): Only candles closed by this epoch ms are used
+        lookbacks_ms (list): How far back gaps are searched on each level, in ms
+        min_gap_percents (list): Minimum gap size in % on each level
+        store_dir (str, optional): Candle store directory
+        price_in_top (bool): Require the current price inside the top-level gap
+        same_direction (bool): Require every gap on a path to share a direction
+
+    Returns:
+        list: Setups, one per confluence path
+    """
+    levels, _ = load_chain(symbol, timeframes, as_of_ms, lookbacks_ms, store_dir)
+    if any(len(candles) < 3 for candles in levels):
+        return []
+
+    gaps = [detect_gaps(candles, min_gap) for candles, min_gap in zip(levels, min_gap_percents)]
+    current_price = float(levels[-1]["close"][-1])
+    paths = find_confluences(gaps, timeframes, current_price if price_in_top else None, same_direction)
+    return confluence_setups(symbol, timeframes, gaps, paths, current_price)
+
+
+def confluence_task(data):
+    """Screen one symbol - for parallel processing."""
+    symbol, args = data
+    try:
+        return screen_confluence(symbol, *args)
+    except Exception as e:
+        print(f"\rProcessing symbol {symbol} - Error: {str(e)}", end="")
+        return []
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def parse_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen stored candles for FVG confluence across a chain of timeframes")
+    parser.add_argument("--chain", type=parse_list, default=DEFAULT_CHAIN, help="Comma separated timeframes, highest first")
+    parser.add_argument("--min-gap", type=parse_list, help="Comma separated minimum gap %% per timeframe")
+    parser.add_argument("--lookback-days", type=parse_list, help="Comma separated lookback in days per timeframe")
+    parser.add_argument("--as-of", type=parse_date, help="Screen as of this time (default: now)")
+    parser.add_argument("--price-in-top", action="store_true", help="Require the current price inside the top-level gap")
+    parser.add_argument("--same-direction", action="store_true", help="Require all gaps of a setup to share a direction")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to screen (default: every symbol with stored candles for the lowest timeframe)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    chain = args.chain
+    if len(chain) < 2:
+        parser.error("--chain needs at least two timeframes")
+    lowest = [position == len(chain) - 1 for position in range(len(chain))]
+    min_gaps = [float(value) for value in args.min_gap] if args.min_gap else [default_min_gap_percent(last) for last in lowest]
+    lookbacks = ([float(value) for value in args.lookback_days] if args.lookback_days
+                 else [default_lookback_days(timeframe, last) for timeframe, last in zip(chain, lowest)])
+    if len(min_gaps) != len(chain) or len(lookbacks) != len(chain):
+        parser.error("--min-gap and --lookback-days need one value per timeframe in --chain")
+
+    as_of = args.as_of or datetime.now(timezone.utc)
+    as_of_ms = int(as_of.timestamp() * 1000)
+    lookbacks_ms = [int(timedelta(days=days).total_seconds() * 1000) for days in lookbacks]
+
+    symbols = args.symbols or list_stored_symbols(chain[-1])
+    if not symbols:
+        print(f"No symbols with stored {chain[-1]} candles")
+        return
+
+    print(f"Screening {len(symbols)} symbols for {' > '.join(chain)} confluence as of {as_of.isoformat()}")
+    for timeframe, min_gap, days in zip(chain, min_gaps, lookbacks):
+        print(f"- {timeframe}: gaps >= {min_gap}% over the last {days:g} days")
+
+    writer = ResultsWriter("results", "confluence", {
+        "coins_analyzed": symbols,
+        "chain": chain,
+        "as_of": as_of.isoformat(),
+        "min_gap_thresholds": dict(zip(chain, min_gaps)),
+        "lookback_days": dict(zip(chain, lookbacks)),
+        "price_in_top": args.price_in_top,
+        "same_direction": args.same_direction
+    })
+
+    task_args = (chain, as_of_ms, lookbacks_ms, min_gaps, None, args.price_in_top, args.same_direction)
+    max_workers = args.workers or os.cpu_count()
+    with writer:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            tasks = [(symbol, task_args) for symbol in symbols]
+            for done, setups in enumerate(executor.map(confluence_task, tasks), start=1):
+                writer.write_setups(setups)
+                print(f"\rProcessed {done}/{len(symbols)} symbols, found {writer.total_setups} setups so far...", end="")
+    print()
+
+    print(f"Total setups found: {writer.total_setups}")
+    print(f"\nResults saved to: {writer.path}")
+
+if __name__ == "__main__":
+    main()
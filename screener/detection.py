@@ -0,0 +1,189 @@
+import numpy as np
+
+# Columnar gap layout shared by the vectorized detectors. Index fields point
+# at candles in the array the gaps were detected on.
+GAP_FIELDS = (
+    "bullish",            # bool: gap direction
+    "upper_line",         # upper boundary of the gap
+    "lower_line",         # lower boundary of the gap
+    "middle_high",        # middle candle high/low, used for stops
+    "middle_low",
+    "gap_percent",        # gap size as % of the middle candle close
+    "timestamp",          # epoch ms of the middle candle
+    "index",              # index of the middle candle
+)
+
+
+def empty_gaps():
+    return {
+        "bullish": np.empty(0, dtype=bool),
+        "upper_line": np.empty(0),
+        "lower_line": np.empty(0),
+        "middle_high": np.empty(0),
+        "middle_low": np.empty(0),
+        "gap_percent": np.empty(0),
+        "timestamp": np.empty(0, dtype="i8"),
+        "index": np.empty(0, dtype="i8"),
+    }
+
+
+def detect_gaps(candles, min_gap_percent=0.0):
+    """
+    Detect PineScript-style FVGs on a whole candle array at once.
+
+    Same rules as custom_process_symbol: a bullish gap needs a non-bearish
+    middle candle and the current low above the high two candles back; a
+    bearish gap needs a bearish middle candle and the current high below the
+    low two candles back. Gap percent is relative to the middle candle close.
+
+    Args:
+        candles (np.ndarray): Candle records (see candle_store.CANDLE_DTYPE)
+        min_gap_percent (float): Drop gaps smaller than this; 0 keeps every candidate
+
+    Returns:
+        dict: Arrays keyed by GAP_FIELDS, ordered by time
+    """
+    if len(candles) < 3:
+        return empty_gaps()
+
+    opens = np.asarray(candles["open"], dtype="f8")
+    highs = np.asarray(candles["high"], dtype="f8")
+    lows = np.asarray(candles["low"], dtype="f8")
+    closes = np.asarray(candles["close"], dtype="f8")
+
+    # Align current (i), middle (i-1) and first (i-2) candles
+    current_high, current_low = highs[2:], lows[2:]
+    middle_high, middle_low, middle_close = highs[1:-1], lows[1:-1], closes[1:-1]
+    first_high, first_low = highs[:-2], lows[:-2]
+    middle_bearish = opens[1:-1] > closes[1:-1]
+
+    bullish = ~middle_bearish & (current_low > first_high)
+    bearish = middle_bearish & (current_high < first_low)
+    found = bullish | bearish
+
+    upper_line = np.where(bullish, current_low, first_low)
+    lower_line = np.where(bullish, first_high, current_high)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap_percent = (upper_line - lower_line) / middle_close * 100
+
+    keep = found & (gap_percent >= min_gap_percent)
+    middle_index = np.flatnonzero(keep) + 1
+    return {
+        "bullish": bullish[keep],
+        "upper_line": upper_line[keep],
+        "lower_line": lower_line[keep],
+        "middle_high": middle_high[keep],
+        "middle_low": middle_low[keep],
+        "gap_percent": gap_percent[keep],
+        "timestamp": np.asarray(candles["timestamp"], dtype="i8")[middle_index],
+        "index": middle_index,
+    }
+
+
+def lines_in_ranges(lines, lows, highs):
+    """
+    Find every (range, line) pair where a line lies inside a range.
+
+    Lines are sorted once and each range becomes one searchsorted interval,
+    so the pairs come out without a nested loop.
+
+    Args:
+        lines (np.ndarray): Price lines
+        lows (np.ndarray): Lower bound of each range (inclusive)
+        highs (np.ndarray): Upper bound of each range (inclusive)
+
+    Returns:
+        tuple: (range_index, line_index) arrays, one entry per pair
+    """
+    order = np.argsort(lines, kind="stable")
+    sorted_lines = lines[order]
+    start = np.searchsorted(sorted_lines, lows, side="left")
+    end = np.searchsorted(sorted_lines, highs, side="right")
+    counts = np.maximum(end - start, 0)
+
+    range_index = np.repeat(np.arange(len(lows)), counts)
+    # Offset of each pair within its range's block of matching lines
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    line_index = order[np.repeat(start, counts) + offsets]
+    return range_index, line_index
+
+
+def detect_three_candle_gaps(candles):
+    """
+    Detect gaps with the three-candle rules of utils.process_symbol, unfiltered.
+
+    For every middle candle i, a bullish gap has the high of i-1 below the
+    low of i+1 and a bearish gap has the high of i+1 above the low of i-1.
+    Both can hold for the same candle. Gap percent is relative to the close
+    of candle i-1.
+
+    Returns:
+        dict: {"bullish": {...}, "bearish": {...}}, each with arrays "index"
+            (middle candle), "gap_size", "gap_percent" and "timestamp"
+    """
+    result = {}
+    if len(candles) < 3:
+        for direction in ("bullish", "bearish"):
+            result[direction] = {
+                "index": np.empty(0, dtype="i8"),
+                "gap_size": np.empty(0),
+                "gap_percent": np.empty(0),
+                "timestamp": np.empty(0, dtype="i8"),
+            }
+        return result
+
+    highs = np.asarray(candles["high"], dtype="f8")
+    lows = np.asarray(candles["low"], dtype="f8")
+    closes = np.asarray(candles["close"], dtype="f8")
+    timestamps = np.asarray(candles["timestamp"], dtype="i8")
+
+    before_high, before_low, before_close = highs[:-2], lows[:-2], closes[:-2]
+    after_high, after_low = highs[2:], lows[2:]
+
+    for direction, found, gap_size in (
+        ("bullish", before_high < after_low, after_low - before_high),
+        ("bearish", after_high > before_low, after_high - before_low),
+    ):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gap_percent = gap_size / before_close * 100
+        middle_index = np.flatnonzero(found) + 1
+        result[direction] = {
+            "index": middle_index,
+            "gap_size": gap_size[found],
+            "gap_percent": gap_percent[found],
+            "timestamp": timestamps[middle_index],
+        }
+    return result
+
+
+def detect_price_gaps(candles, min_gap=0.0):
+    """
+    Gaps with the rules of check_fvg and is_price_within_fvg.
+
+    For every middle candle i, a gap runs from the high of i-1 up to the low
+    of i when that low is at least `min_gap` higher; otherwise from the low
+    of i up to the low of i+1 when that one is at least `min_gap` higher.
+
+    Args:
+        candles (np.ndarray): Candle records (see candle_store.CANDLE_DTYPE)
+        min_gap (float): Minimum gap size in price units
+
+    Returns:
+        dict: Arrays "lower", "upper" and "reference" (close of candle i),
+            one entry per gap in time order
+    """
+    if len(candles) < 3:
+        return {"lower": np.empty(0), "upper": np.empty(0), "reference": np.empty(0)}
+
+    highs = np.asarray(candles["high"], dtype="f8")
+    lows = np.asarray(candles["low"], dtype="f8")
+    closes = np.asarray(candles["close"], dtype="f8")
+
+    prev_high, curr_low, next_low = highs[:-2], lows[1:-1], lows[2:]
+    above_prev = (curr_low > prev_high) & (curr_low - prev_high >= min_gap)
+    found = above_prev | ((next_low > curr_low) & (next_low - curr_low >= min_gap))
+    return {
+        "lower": np.where(above_prev, prev_high, curr_low)[found],
+        "upper": np.where(above_prev, curr_low, next_low)[found],
+        "reference": closes[1:-1][found],
+    }
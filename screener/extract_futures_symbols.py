@@ -2,6 +2,7 @@ import ccxt
 import json
 import os
 from datetime import datetime, timezone
+from symbol_registry import load_registry
 
 def extract_futures_symbols():
     # Initialize exchange
@@ -16,12 +17,8 @@ def extract_futures_symbols():
     # Load markets
     print("Loading markets...")
     try:
-        # Get futures tickers directly
-        tickers = exchange.fapiPublicGetTickerPrice()
-        valid_futures = [ticker['symbol'].replace('USDT', '/USDT') for ticker in tickers]
-        
-        # Sort symbols alphabetically
-        valid_futures.sort()
+        # Linear perpetuals currently trading, from the shared markets snapshot
+        valid_futures = load_registry(exchange).futures_pairs()
         
         # Create results directory if it doesn't exist
         results_dir = "results"
@@ -2,17 +2,15 @@ import json
 import os
 from datetime import datetime
 import pytz
+from results_store import iter_setups, load_metadata
 
 def main():
     # Input file
     input_file = "results/specific_coins_fvg_setups_20250329_111203.json"
     
-    # Load the JSON data
-    with open(input_file, 'r') as f:
-        data = json.load(f)
-    
-    # Get the original setups
-    original_setups = data['setups']
+    # Load run metadata and setups (legacy JSON or streamed NDJSON results)
+    data = load_metadata(input_file)
+    original_setups = list(iter_setups(input_file, nested=True))
     
     # Filter for setups where the 5M FVG timestamp is from March 28 or 29, 2025
     filtered_setups = []
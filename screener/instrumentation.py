@@ -0,0 +1,195 @@
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    from screener.profiling import run_profiled, stage_peaks
+except ImportError:
+    from profiling import run_profiled, stage_peaks
+
+# Pipeline stages timed by the screeners. Stages may nest (array_build runs
+# inside ohlcv_fetch), so their times are inclusive and do not add up to
+# the symbol's wall time. ohlcv_fetch is split by cache outcome, e.g.
+# "ohlcv_fetch.hit", "ohlcv_fetch.incremental" or "ohlcv_fetch.miss".
+STAGES = ("ticker_fetch", "ohlcv_fetch", "array_build", "fvg_detection", "value_area", "alignment", "result_writing")
+
+PERCENTILES = (50, 90, 99)
+
+# Slowest symbols listed in a run report
+SLOWEST_SYMBOLS = 10
+
+
+class Timer:
+    """Handle yielded by timed(); a stage may be relabelled before it finishes."""
+
+    __slots__ = ("stage",)
+
+    def __init__(self, stage):
+        self.stage = stage
+
+
+class StageRecorder:
+    """Durations and counters recorded in this process since the last reset."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.durations = defaultdict(list)  # stage -> [seconds per call]
+        self.counters = Counter()
+
+    def record(self, stage, seconds):
+        self.durations[stage].append(seconds)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+
+# Shared by everything in this process; pool workers get their own copy
+recorder = StageRecorder()
+
+
+@contextmanager
+def timed(stage):
+    """
+    Time the enclosed block as one call of `stage`.
+
+    Example:
+        with timed("ohlcv_fetch") as timer:
+            ...
+            timer.stage = "ohlcv_fetch.hit"
+    """
+    timer = Timer(stage)
+    # Peak allocations per stage are only tracked under profile_session(memory=True)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        stage_peaks.start()
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        recorder.record(timer.stage, time.perf_counter() - start)
+        if tracing:
+            stage_peaks.finish(timer.stage)
+
+
+def count(name, amount=1):
+    """Add to a counter of this process, e.g. count("setups", len(setups))."""
+    recorder.count(name, amount)
+
+
+def measured(function, data):
+    """
+    Run function(data) for one symbol and collect what it recorded.
+
+    Used with ProcessPoolExecutor.map(measured, itertools.repeat(function),
+    items), where each item starts with the symbol, so worker functions keep
+    their own return values. Under a profiling.profile_session() the call
+    is profiled as well.
+
+    Returns:
+        tuple: (function's result, sample dict with symbol, seconds,
+            durations and counters)
+    """
+    recorder.reset()
+    start = time.perf_counter()
+    try:
+        result = run_profiled(function, data)
+    finally:
+        sample = {
+            "symbol": data[0],
+            "seconds": time.perf_counter() - start,
+            "durations": dict(recorder.durations),
+            "counters": dict(recorder.counters),
+        }
+        recorder.reset()
+    return result, sample
+
+
+def summarize(values):
+    """Call count, total, mean, percentiles and maximum of durations in seconds."""
+    values = np.asarray(values, dtype="f8")
+    if len(values) == 0:
+        return {"calls": 0, "total": 0.0}
+    summary = {"calls": len(values), "total": float(values.sum()), "mean": float(values.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}"] = float(value)
+    summary["max"] = float(values.max())
+    return summary
+
+
+class RunTimings:
+    """
+    Timings of one screening run, aggregated per run and per symbol.
+
+    Symbol samples come from measured() in the workers; stages timed in the
+    parent process itself (bulk tickers, result writing) are taken from its
+    recorder when the report is built.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.samples = []
+        recorder.reset()
+
+    def add(self, sample, outcome=None):
+        """Add a symbol's sample, optionally with the stage that discarded it."""
+        if outcome is not None:
+            sample = {**sample, "outcome": outcome}
+        self.samples.append(sample)
+
+    def report(self):
+        """
+        Run report for the timings file.
+
+        Returns:
+            dict: wall_seconds, symbols, stages ({stage: summarize() over all
+                calls}), counters, symbol_seconds (summarize() over symbols),
+                slowest symbols and per-symbol stage totals
+        """
+        durations = defaultdict(list)
+        counters = Counter(recorder.counters)
+        for stage, values in recorder.durations.items():
+            durations[stage].extend(values)
+        for sample in self.samples:
+            for stage, values in sample["durations"].items():
+                durations[stage].extend(values)
+            counters.update(sample["counters"])
+
+        symbols = [
+            {
+                "symbol": sample["symbol"],
+                "seconds": sample["seconds"],
+                "outcome": sample.get("outcome"),
+                "stages": {stage: sum(values) for stage, values in sample["durations"].items()},
+                "counters": sample["counters"],
+            }
+            for sample in self.samples
+        ]
+        slowest = sorted(symbols, key=lambda symbol: symbol["seconds"], reverse=True)[:SLOWEST_SYMBOLS]
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "symbols": len(symbols),
+            "stages": {stage: summarize(values) for stage, values in sorted(durations.items())},
+            "counters": dict(counters),
+            "symbol_seconds": summarize([symbol["seconds"] for symbol in symbols]),
+            "slowest": [{"symbol": symbol["symbol"], "seconds": symbol["seconds"]} for symbol in slowest],
+            "per_symbol": symbols,
+        }
+
+
+def format_stages(report):
+    """Printable lines of a report's stage summary, slowest total first."""
+    stages = sorted(report["stages"].items(), key=lambda item: item[1]["total"], reverse=True)
+    lines = [f"Run wall time {report['wall_seconds']:.1f}s over {report['symbols']} symbols"]
+    for stage, summary in stages:
+        if not summary["calls"]:
+            continue
+        lines.append(
+            f"- {stage}: {summary['total']:.2f}s in {summary['calls']} calls "
+            f"(p50 {summary['p50'] * 1000:.1f}ms, p90 {summary['p90'] * 1000:.1f}ms, max {summary['max'] * 1000:.1f}ms)"
+        )
+    return lines
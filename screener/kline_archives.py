@@ -0,0 +1,178 @@
+import io
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    from screener.candle_store import CANDLE_DTYPE, STORE_DIR, bucket_starts, merge_candles, missing_ranges, write_candles
+except ImportError:
+    from candle_store import CANDLE_DTYPE, STORE_DIR, bucket_starts, merge_candles, missing_ranges, write_candles
+
+# Binance kline archives (data.binance.vision), monthly or daily:
+# BTCUSDT-5m-2024-01.zip / BTCUSDT-5m-2024-01-15.zip, each holding one CSV
+ARCHIVE_NAME = re.compile(
+    r"^(?P<market_id>[A-Z0-9]+)-(?P<timeframe>\d+[smhdwM])-(?P<period>\d{4}-\d{2}(?:-\d{2})?)\.zip$"
+)
+
+# Quote currencies recognized when turning an exchange id into a "BASE/QUOTE" symbol
+QUOTES = ("USDT", "USDC", "FDUSD", "BUSD", "TUSD", "BTC", "ETH", "BNB")
+
+# open_time, open, high, low, close, volume; later columns are not stored
+KLINE_COLUMNS = 6
+
+# Open times in microseconds (spot archives from 2025) are above this
+MICROSECONDS_THRESHOLD = 10 ** 14
+
+
+def archive_market(path, default="spot"):
+    """
+    Market type of an archive from its path in a data.binance.vision mirror.
+
+    Returns:
+        str: "spot" below spot/, "futures" below futures/um/ (USDT-M),
+            None for other markets (COIN-M, options), or `default` when the
+            path does not say
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    for index, part in enumerate(parts):
+        if part == "spot":
+            return "spot"
+        if part == "futures":
+            return "futures" if parts[index + 1:index + 2] == ["um"] else None
+        if part == "option":
+            return None
+    return default
+
+
+def archive_symbol(market_id, market_type="spot"):
+    """
+    Screener symbol for an exchange id in a market.
+
+    Example:
+        "BTCUSDT" -> "BTC/USDT" (spot) or "BTC/USDT:USDT" (futures), the
+        symbols the screeners read the candle store under
+    """
+    for quote in QUOTES:
+        if market_id.endswith(quote) and len(market_id) > len(quote):
+            symbol = f"{market_id[:-len(quote)]}/{quote}"
+            return f"{symbol}:{quote}" if market_type == "futures" else symbol
+    return None
+
+
+def find_archives(directory, symbols=None, timeframes=None, default_market="spot"):
+    """
+    Kline archives below a directory, grouped by (symbol, timeframe).
+
+    The market of each archive comes from its path (spot/ or futures/um/),
+    so a mirror holding both markets yields separate "BTC/USDT" and
+    "BTC/USDT:USDT" groups rather than one mixed series.
+
+    Args:
+        directory (str): Directory searched recursively, e.g. a mirror of
+            data.binance.vision
+        symbols (iterable, optional): Only these symbols ("BTC/USDT", "BTC/USDT:USDT")
+        timeframes (iterable, optional): Only these timeframes
+        default_market (str): Market of archives whose path names none
+
+    Returns:
+        dict: {(symbol, timeframe): [archive paths, sorted]}
+    """
+    symbols = set(symbols) if symbols else None
+    timeframes = set(timeframes) if timeframes else None
+    groups = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            match = ARCHIVE_NAME.match(name)
+            if not match:
+                continue
+            market_type = archive_market(os.path.relpath(os.path.join(root, name), directory), default_market)
+            if market_type is None:
+                continue
+            symbol = archive_symbol(match.group("market_id"), market_type)
+            timeframe = match.group("timeframe")
+            if symbol is None or (symbols and symbol not in symbols) or (timeframes and timeframe not in timeframes):
+                continue
+            groups.setdefault((symbol, timeframe), []).append(os.path.join(root, name))
+    return {key: sorted(paths) for key, paths in sorted(groups.items())}
+
+
+def read_archive(path):
+    """
+    Candle records from one kline archive.
+
+    Handles CSVs with and without a header row and open times in
+    milliseconds or microseconds.
+    """
+    batches = []
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.namelist():
+            if not member.endswith(".csv"):
+                continue
+            data = archive.read(member)
+            has_header = not data[:1].isdigit()
+            rows = pd.read_csv(
+                io.BytesIO(data), header=0 if has_header else None,
+                usecols=range(KLINE_COLUMNS), dtype="f8", engine="c",
+            ).to_numpy()
+            candles = np.empty(len(rows), dtype=CANDLE_DTYPE)
+            timestamps = rows[:, 0].astype("i8")
+            candles["timestamp"] = np.where(timestamps >= MICROSECONDS_THRESHOLD, timestamps // 1000, timestamps)
+            for position, field in enumerate(("open", "high", "low", "close", "volume"), start=1):
+                candles[field] = rows[:, position]
+            batches.append(candles)
+    if not batches:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    return np.concatenate(batches)
+
+
+def import_archives(symbol, timeframe, paths, store_dir=STORE_DIR):
+    """
+    Import the archives of one symbol and timeframe into the candle store.
+
+    Overlapping monthly and daily archives are merged, candles not aligned
+    to the timeframe are dropped, and holes inside the covered span are
+    counted.
+
+    Returns:
+        dict: Summary with files, candles, duplicates, misaligned, gaps,
+            first/last open time and stored count
+    """
+    summary = {"symbol": symbol, "timeframe": timeframe, "files": len(paths), "candles": 0,
+               "duplicates": 0, "misaligned": 0, "gaps": [], "errors": [], "stored": 0}
+    batches = []
+    for path in paths:
+        try:
+            batches.append(read_archive(path))
+        except (zipfile.BadZipFile, ValueError, OSError) as e:
+            summary["errors"].append(f"{os.path.basename(path)}: {e}")
+    batches = [batch for batch in batches if len(batch)]
+    if not batches:
+        return summary
+
+    joined = np.concatenate(batches)
+    aligned = bucket_starts(joined["timestamp"], timeframe) == joined["timestamp"]
+    summary["misaligned"] = int(np.count_nonzero(~aligned))
+    candles = merge_candles(None, joined[aligned])
+    summary["duplicates"] = int(np.count_nonzero(aligned)) - len(candles)
+    summary["candles"] = len(candles)
+    if len(candles) == 0:
+        return summary
+
+    first, last = int(candles["timestamp"][0]), int(candles["timestamp"][-1])
+    summary["first"], summary["last"] = first, last
+    summary["gaps"] = missing_ranges(candles, timeframe, first, last)
+    summary["stored"] = write_candles(symbol, timeframe, candles, store_dir)
+    return summary
+
+
+def import_group(data):
+    """import_archives for ProcessPoolExecutor.map: (symbol, timeframe, paths, store_dir)."""
+    symbol, timeframe, paths, store_dir = data
+    try:
+        return import_archives(symbol, timeframe, paths, store_dir)
+    except Exception as e:
+        return {"symbol": symbol, "timeframe": timeframe, "files": len(paths), "candles": 0,
+                "duplicates": 0, "misaligned": 0, "gaps": [], "errors": [str(e)], "stored": 0}
@@ -1,72 +1,86 @@
 import json
 import os
+from datetime import datetime, timezone
 from django.core.management.base import BaseCommand
 from django.conf import settings
 import ccxt
+from screener.markets_snapshot import refresh_markets, diff_symbols
+from screener.symbol_registry import SymbolRegistry
+from screener.metrics import job_metrics, record
+from screener.profiling import add_profile_arguments, profile_session
 
 class Command(BaseCommand):
     help = 'Fetches spot and futures markets and saves them to JSON files'
 
-    def handle(self, *args, **kwargs):
-        try:
-            # Initialize Binance exchange with API key and secret from environment variables
-            exchange = ccxt.binance({
-                "apiKey": settings.BINANCE_API_KEY,
-                "secret": settings.BINANCE_API_SECRET,
-            })
-
-            # Fetch markets
-            markets = exchange.load_markets()
+    def add_arguments(self, parser):
+        add_profile_arguments(parser)
 
-            # Define the quotes to filter
-            valid_quotes = {"USDT"}
-
-            # Filter for futures markets with valid quotes
-            futures_symbols = [
-                symbol for symbol in markets
-                if markets[symbol]["quote"] in valid_quotes and markets[symbol]["type"] == "swap"
-            ]
+    def handle(self, *args, **kwargs):
+        # Markets snapshot, rate limit state and the metrics sink the /metrics view reads
+        cache_dir = os.path.join(settings.BASE_DIR, 'cache')
+        profile_dir = os.path.join(settings.BASE_DIR, 'results', 'profiles')
+        with profile_session('fetch_markets', kwargs['profile'], kwargs['profile_memory'], profile_dir), \
+                job_metrics('fetch_markets', cache_dir) as run:
+            try:
+                # Initialize Binance exchange with API key and secret from environment variables
+                exchange = ccxt.binance({
+                    "apiKey": settings.BINANCE_API_KEY,
+                    "secret": settings.BINANCE_API_SECRET,
+                })
 
-            # Filter for spot markets with valid quotes
-            spot_symbols = [
-                symbol for symbol in markets
-                if markets[symbol]["quote"] in valid_quotes and markets[symbol]["type"] == "spot"
-            ]
+                # Fetch markets and refresh the snapshot every other entry point preloads
+                markets = refresh_markets(exchange, cache_dir)
 
-            # Extract base symbols from spot markets
-            spot_base_symbols = set()
-            for symbol in spot_symbols:
-                base_symbol = symbol.split('/')[0]
-                spot_base_symbols.add(base_symbol)
+                # Index the markets once; symbols, spot pairing and listing status come from the registry
+                registry = SymbolRegistry.from_markets(markets)
+                futures_symbols = registry.symbols("swap", quote="USDT")
+                spot_symbols = registry.symbols("spot", quote="USDT")
+                record(cache_dir, "set", "screener_symbols_screened", len(futures_symbols) + len(spot_symbols),
+                       job='fetch_markets')
 
-            # List of delisted coins
-            delisted_coins = {"CVC", "BTCST", "SC", "RAY", "FTT"}
+                # Futures whose asset (without a 1000-style multiplier) trades on spot, minus delisted coins
+                matching_futures_symbols = registry.matching_futures_symbols(quote="USDT")
 
-            # Find matching futures markets and filter out delisted coins
-            matching_futures_symbols = [
-                symbol for symbol in futures_symbols
-                if symbol.split('/')[0].replace('1000', '') in spot_base_symbols and symbol.split('/')[0] not in delisted_coins
-            ]
+                # Define file paths
+                data_dir = os.path.join(settings.BASE_DIR, 'screener', 'data')
+                changes_file_path = os.path.join(data_dir, 'markets_changes.ndjson')
+                now = datetime.now(timezone.utc).isoformat()
 
-            # Define file paths
-            futures_file_path = os.path.join(settings.BASE_DIR, 'screener', 'data', 'futures_markets.json')
-            spot_file_path = os.path.join(settings.BASE_DIR, 'screener', 'data', 'spot_markets.json')
-            matching_file_path = os.path.join(settings.BASE_DIR, 'screener', 'data', 'matching_futures_markets.json')
+                # Only rewrite files whose market list changed, recording what was listed and delisted
+                for file_name, symbols in (
+                    ('futures_markets.json', futures_symbols),
+                    ('spot_markets.json', spot_symbols),
+                    ('matching_futures_markets.json', matching_futures_symbols),
+                ):
+                    file_path = os.path.join(data_dir, file_name)
+                    previous_symbols = None
+                    if os.path.exists(file_path):
+                        try:
+                            with open(file_path, 'r') as existing_file:
+                                previous_symbols = json.load(existing_file)
+                        except ValueError:
+                            previous_symbols = None
 
-            # Save futures markets to JSON file
-            with open(futures_file_path, 'w') as futures_file:
-                json.dump(futures_symbols, futures_file, indent=4)
-            self.stdout.write(self.style.SUCCESS('Successfully saved futures markets to futures_markets.json'))
+                    # Same markets in a different order still count as unchanged
+                    if previous_symbols is not None and set(previous_symbols) == set(symbols):
+                        self.stdout.write(f'No changes in {file_name}')
+                        continue
 
-            # Save spot markets to JSON file
-            with open(spot_file_path, 'w') as spot_file:
-                json.dump(spot_symbols, spot_file, indent=4)
-            self.stdout.write(self.style.SUCCESS('Successfully saved spot markets to spot_markets.json'))
+                    with open(file_path, 'w') as output_file:
+                        json.dump(symbols, output_file, indent=4)
+                    self.stdout.write(self.style.SUCCESS(f'Successfully saved {file_name}'))
+                    record(cache_dir, "inc", "screener_results_written_total", job='fetch_markets')
 
-            # Save matching futures markets to JSON file
-            with open(matching_file_path, 'w') as matching_file:
-                json.dump(matching_futures_symbols, matching_file, indent=4)
-            self.stdout.write(self.style.SUCCESS('Successfully saved matching futures markets to matching_futures_markets.json'))
+                    if previous_symbols is not None:
+                        changes = diff_symbols(previous_symbols, symbols)
+                        if changes['listed'] or changes['delisted']:
+                            with open(changes_file_path, 'a') as changes_file:
+                                changes_file.write(json.dumps({"timestamp": now, "file": file_name, **changes}) + "\n")
+                            self.stdout.write(
+                                f"{file_name}: listed {', '.join(changes['listed']) or 'none'}; "
+                                f"delisted {', '.join(changes['delisted']) or 'none'}"
+                            )
 
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f'Error fetching markets: {e}'))
\ No newline at end of file
+            except Exception as e:
+                run.failed = True
+                self.stderr.write(self.style.ERROR(f'Error fetching markets: {e}'))
\ No newline at end of file
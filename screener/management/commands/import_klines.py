@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from screener.kline_archives import find_archives, import_group
+
+class Command(BaseCommand):
+    help = 'Imports Binance kline archives (zipped CSVs) into the candle store without API calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory holding kline archives, searched recursively')
+        parser.add_argument('--symbols', nargs='+', help='Only these symbols, e.g. BTC/USDT or BTC/USDT:USDT')
+        parser.add_argument('--market', choices=['spot', 'futures'], default='spot',
+                            help='Market of archives whose path has no spot/ or futures/um/ directory')
+        parser.add_argument('--timeframes', nargs='+', help='Only these timeframes, e.g. 5m 1h')
+        parser.add_argument('--store-dir', default=os.path.join(settings.BASE_DIR, 'candles'),
+                            help='Candle store directory')
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count(), 4),
+                            help='Worker processes')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['directory']):
+            raise CommandError(f"Directory not found: {options['directory']}")
+
+        groups = find_archives(options['directory'], options['symbols'], options['timeframes'], options['market'])
+        if not groups:
+            self.stdout.write('No kline archives found')
+            return
+        self.stdout.write(f"Importing {sum(len(paths) for paths in groups.values())} archives "
+                          f"for {len(groups)} symbol/timeframe pairs")
+
+        tasks = [(symbol, timeframe, paths, options['store_dir']) for (symbol, timeframe), paths in groups.items()]
+        imported = 0
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            for summary in executor.map(import_group, tasks):
+                name = f"{summary['symbol']} {summary['timeframe']}"
+                for error in summary['errors']:
+                    self.stderr.write(self.style.ERROR(f"{name}: {error}"))
+                if not summary['candles']:
+                    continue
+                imported += summary['candles']
+
+                first = datetime.fromtimestamp(summary['first'] / 1000, tz=timezone.utc).isoformat()
+                last = datetime.fromtimestamp(summary['last'] / 1000, tz=timezone.utc).isoformat()
+                self.stdout.write(
+                    f"{name}: {summary['candles']} candles from {summary['files']} files ({first} to {last}), "
+                    f"{summary['stored']} stored, {summary['duplicates']} duplicates, "
+                    f"{summary['misaligned']} misaligned"
+                )
+                if summary['gaps']:
+                    self.stdout.write(self.style.WARNING(
+                        f"{name}: {len(summary['gaps'])} gaps, first at "
+                        f"{datetime.fromtimestamp(summary['gaps'][0][0] / 1000, tz=timezone.utc).isoformat()}"
+                    ))
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {imported} candles'))
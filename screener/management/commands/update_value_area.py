@@ -4,77 +4,98 @@ import os
 from datetime import datetime, timezone
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from screener.models import ValueAreaResult
-from screener.utils import get_value_area_pairs, is_price_within_fvg
+from django.db import transaction
+from screener.models import ValueAreaHourlyRollup, ValueAreaResult
+from screener.utils import get_value_area_pairs, is_price_within_fvg, get_ticker
+from screener.markets_snapshot import preload_markets
+from screener.symbol_registry import load_registry
+from screener.metrics import job_metrics, record
+from screener.profiling import add_profile_arguments, profile_session
 
 class Command(BaseCommand):
     help = 'Update value area results'
 
+    def add_arguments(self, parser):
+        add_profile_arguments(parser)
+
     def handle(self, *args, **kwargs):
-        try:
-            # Initialize Binance exchange with API key and secret from environment variables
-            exchange = ccxt.binance(
-                {
-                    "apiKey": settings.BINANCE_API_KEY,
-                    "secret": settings.BINANCE_API_SECRET,
-                }
-            )
+        # Duration, outcome and counts go to the metrics sink the /metrics view reads
+        cache_dir = os.path.join(settings.BASE_DIR, 'cache')
+        profile_dir = os.path.join(settings.BASE_DIR, 'results', 'profiles')
+        with profile_session('update_value_area', kwargs['profile'], kwargs['profile_memory'], profile_dir), \
+                job_metrics('update_value_area', cache_dir) as run:
+            try:
+                # Initialize Binance exchange with API key and secret from environment variables
+                exchange = ccxt.binance(
+                    {
+                        "apiKey": settings.BINANCE_API_KEY,
+                        "secret": settings.BINANCE_API_SECRET,
+                    }
+                )
+                snapshot_dir = os.path.join(settings.BASE_DIR, 'cache')
+                preload_markets(exchange, snapshot_dir=snapshot_dir)
+                registry = load_registry(exchange, snapshot_dir=snapshot_dir)
             
-            # Get the start of the month
-            now = datetime.now(timezone.utc)
-            start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+                # Get the start of the month
+                now = datetime.now(timezone.utc)
+                start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
             
-            # Load markets from matching_futures_markets.json
-            matching_file_path = os.path.join(settings.BASE_DIR, 'screener', 'data', 'matching_futures_markets.json')
-            with open(matching_file_path, 'r') as file:
-                futures_symbols = json.load(file)
+                # Load markets from matching_futures_markets.json
+                matching_file_path = os.path.join(settings.BASE_DIR, 'screener', 'data', 'matching_futures_markets.json')
+                with open(matching_file_path, 'r') as file:
+                    futures_symbols = json.load(file)
             
-            # Filter futures_symbols where the price is within an FVG
-            filtered_futures_symbols = []
-            for symbol in futures_symbols:
-                # Fetch the current price
-                ticker = exchange.fetch_ticker(symbol)
-                current_price = ticker['last']
+                record(cache_dir, "set", "screener_symbols_screened", len(futures_symbols), job='update_value_area')
+
+                # Filter futures_symbols where the price is within an FVG
+                filtered_futures_symbols = []
+                for symbol in futures_symbols:
+                    # Fetch the current price
+                    ticker = get_ticker(exchange, symbol)
+                    current_price = ticker['last']
                 
-                # Check if the current price is within an FVG
-                if is_price_within_fvg(exchange, symbol, current_price):
-                    filtered_futures_symbols.append(symbol)
+                    # Check if the current price is within an FVG
+                    if is_price_within_fvg(exchange, symbol, current_price):
+                        filtered_futures_symbols.append(symbol)
             
-            # Get value area pairs for spot and futures prices
-            spot_results = get_value_area_pairs(exchange, filtered_futures_symbols, "spot", start_of_month, percentage=0.99)
-            futures_results = get_value_area_pairs(exchange, filtered_futures_symbols, "futures", start_of_month, percentage=0.99)
+                # Get value area pairs for spot and futures prices
+                spot_results = get_value_area_pairs(exchange, filtered_futures_symbols, "spot", start_of_month, percentage=0.99, registry=registry)
+                futures_results = get_value_area_pairs(exchange, filtered_futures_symbols, "futures", start_of_month, percentage=0.99, registry=registry)
 
-            # Convert results to dictionaries for easy lookup
-            spot_dict = {result['symbol']: result for result in spot_results}
-            futures_dict = {result['symbol'].replace(':USDT', ''): result for result in futures_results}
+                # Convert results to dictionaries keyed by futures symbol for easy lookup
+                spot_dict = {registry.futures_symbol(result['symbol']): result for result in spot_results}
+                futures_dict = {result['symbol']: result for result in futures_results}
             
-            # Find symbols where both spot and futures prices are outside the value area
-            outside_value_area = []
+                # Find symbols where both spot and futures prices are outside the value area
+                outside_value_area = []
             
-            for symbol in filtered_futures_symbols:
-                normalized_symbol = symbol.replace(':USDT', '')
-                if normalized_symbol in spot_dict and normalized_symbol in futures_dict:
-                    spot_result = spot_dict[normalized_symbol]
-                    futures_result = futures_dict[normalized_symbol]
+                for symbol in filtered_futures_symbols:
+                    if symbol in spot_dict and symbol in futures_dict:
+                        spot_result = spot_dict[symbol]
+                        futures_result = futures_dict[symbol]
             
-                    if (spot_result['current_price'] > spot_result['vah'] or spot_result['current_price'] < spot_result['val']) and \
-                       (futures_result['current_price'] > futures_result['vah'] or futures_result['current_price'] < futures_result['val']):
-                        outside_value_area.append({
-                            'symbol': f"{normalized_symbol}:USDT",
-                            'current_price': spot_result['current_price'],
-                            'vah': spot_result['vah'],
-                            'val': spot_result['val']
-                        })
+                        if (spot_result['current_price'] > spot_result['vah'] or spot_result['current_price'] < spot_result['val']) and \
+                           (futures_result['current_price'] > futures_result['vah'] or futures_result['current_price'] < futures_result['val']):
+                            outside_value_area.append({
+                                'symbol': symbol,
+                                'current_price': spot_result['current_price'],
+                                'vah': spot_result['vah'],
+                                'val': spot_result['val']
+                            })
             
-            # Save new results without clearing old results
-            for result in outside_value_area:
-                ValueAreaResult.objects.create(
-                    symbol=result['symbol'],
-                    current_price=result['current_price'],
-                    vah=result['vah'],
-                    val=result['val']
-                )
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f'Error: {str(e)}'))
-        else:
-            self.stdout.write(self.style.SUCCESS('Successfully updated value area results'))
\ No newline at end of file
+                # Save new results without clearing old results, counting each in the hourly rollup the API reads
+                with transaction.atomic():
+                    for result in outside_value_area:
+                        saved = ValueAreaResult.objects.create(
+                            symbol=result['symbol'],
+                            current_price=result['current_price'],
+                            vah=result['vah'],
+                            val=result['val']
+                        )
+                        ValueAreaHourlyRollup.add_result(saved)
+                record(cache_dir, "inc", "screener_results_written_total", len(outside_value_area), job='update_value_area')
+            except Exception as e:
+                run.failed = True
+                self.stderr.write(self.style.ERROR(f'Error: {str(e)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Successfully updated value area results'))
\ No newline at end of file
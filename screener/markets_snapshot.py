@@ -0,0 +1,126 @@
+import mmap
+import os
+import pickle
+import time
+
+try:
+    from screener.rate_limit import install_rate_limiter
+except ImportError:
+    from rate_limit import install_rate_limiter
+
+# Markets snapshots live next to the OHLCV cache, one file per exchange
+SNAPSHOT_DIR = "cache"
+SNAPSHOT_TTL = 6 * 60 * 60  # fetch_markets refreshes it hourly; this covers a stopped cron
+
+# Snapshots already unpickled in this process, by path: (mtime, snapshot)
+_loaded = {}
+
+
+def snapshot_path(exchange_id, snapshot_dir=SNAPSHOT_DIR):
+    """Path of the markets snapshot for an exchange id."""
+    return os.path.join(snapshot_dir, f"markets_{exchange_id}.pickle")
+
+
+def read_markets_snapshot(path, ttl=SNAPSHOT_TTL):
+    """
+    Read a markets snapshot if it is younger than `ttl` seconds.
+
+    The file is memory-mapped and unpickled once per process; later calls
+    reuse the same objects until the file changes on disk.
+
+    Returns:
+        dict: {"markets": ..., "currencies": ...}, or None if missing or stale
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if ttl is not None and time.time() - mtime > ttl:
+        return None
+
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            snapshot = pickle.loads(mapped)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+        return None
+    _loaded[path] = (mtime, snapshot)
+    return snapshot
+
+
+def write_markets_snapshot(exchange, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Save the loaded markets of an exchange, rewriting the file only if they changed.
+
+    An unchanged snapshot is only touched, which renews its TTL.
+
+    Returns:
+        bool: True if the snapshot file was (re)written
+    """
+    if not os.path.exists(snapshot_dir):
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    path = snapshot_path(exchange.id, snapshot_dir)
+    data = pickle.dumps({"markets": exchange.markets, "currencies": exchange.currencies},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                os.utime(path)
+                return False
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return True
+
+
+def preload_markets(exchange, ttl=SNAPSHOT_TTL, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Give an exchange its markets from the shared snapshot instead of load_markets().
+
+    Falls back to load_markets() (and saves a new snapshot) when the snapshot
+    is missing or older than `ttl`. Safe to call on every task in a worker:
+    it does nothing if the exchange already has markets. Also makes the
+    exchange draw from the shared request weight budget (rate_limit).
+
+    Returns:
+        dict: The exchange's markets
+    """
+    install_rate_limiter(exchange, snapshot_dir)
+    if exchange.markets:
+        return exchange.markets
+
+    snapshot = read_markets_snapshot(snapshot_path(exchange.id, snapshot_dir), ttl)
+    if snapshot is None:
+        return refresh_markets(exchange, snapshot_dir)
+
+    exchange.set_markets(snapshot["markets"], snapshot["currencies"])
+    if exchange.options.get("adjustForTimeDifference"):
+        # load_markets() would have done this as well
+        exchange.load_time_difference()
+    return exchange.markets
+
+
+def refresh_markets(exchange, snapshot_dir=SNAPSHOT_DIR):
+    """Load markets from the exchange and update the shared snapshot."""
+    install_rate_limiter(exchange, snapshot_dir)
+    markets = exchange.load_markets(reload=True)
+    try:
+        write_markets_snapshot(exchange, snapshot_dir)
+    except OSError as e:
+        print(f"Error saving markets snapshot: {e}")
+    return markets
+
+
+def diff_symbols(old_symbols, new_symbols):
+    """Symbols listed and delisted between two symbol lists."""
+    old_symbols, new_symbols = set(old_symbols), set(new_symbols)
+    return {
+        "listed": sorted(new_symbols - old_symbols),
+        "delisted": sorted(old_symbols - new_symbols),
+    }
@@ -0,0 +1,194 @@
+import fcntl
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Decoded data kept in memory per process, in front of the disk caches
+MEMORY_CACHE_BYTES = 128 * 1024 * 1024
+
+# Lock files that make concurrent workers wait for one fetch of the same key
+LOCK_DIR = os.path.join("cache", "locks")
+
+_MISSING = object()
+
+
+def value_nbytes(value):
+    """Approximate memory held by a cached value."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by the bytes of its values.
+
+    Entries may carry an expiry; expired entries count as misses. Safe to
+    share between threads.
+    """
+
+    def __init__(self, max_bytes=MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Cached value for `key`, or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl=None):
+        """Cache `value`, evicting the least recently used entries beyond the budget."""
+        nbytes = value_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes, expires)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and memory use."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one.
+
+    The first caller runs the function; callers arriving while it runs wait
+    for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self.shared = 0  # calls answered by another caller's run
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+            else:
+                self.shared += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = function()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+
+@contextmanager
+def key_lock(key, lock_dir=LOCK_DIR):
+    """
+    Exclusive lock on `key` across processes.
+
+    Workers that miss the cache for the same key at the same moment take
+    turns: the first one fetches, the others then find its result on disk.
+    """
+    if not os.path.exists(lock_dir):
+        os.makedirs(lock_dir, exist_ok=True)
+    name = hashlib.sha1(repr(key).encode()).hexdigest()
+    fd = os.open(os.path.join(lock_dir, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Also releases the lock
+
+
+# Shared by everything in this process
+memory_cache = LRUCache()
+single_flight = SingleFlight()
+
+
+def cached(key, fetch, ttl=None, cache=None):
+    """
+    Value for `key` from the in-memory cache, else from one shared call to fetch().
+
+    Args:
+        key (tuple): Cache key
+        fetch (callable): Produces the value on a miss
+        ttl (float, optional): Seconds the value stays valid, default forever
+        cache (LRUCache, optional): Cache to use, default memory_cache
+    """
+    cache = memory_cache if cache is None else cache
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    def load():
+        value = fetch()
+        if value is not None:
+            cache.put(key, value, ttl)
+        return value
+
+    return single_flight.do(key, load)
+
+
+def cache_stats():
+    """Counters of this process's memory cache and single-flight layer."""
+    return {**memory_cache.stats(), "coalesced": single_flight.shared}
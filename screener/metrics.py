@@ -0,0 +1,266 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import util
+
+# Metrics sink shared by the web process, cron commands and screener workers
+METRICS_DIR = "cache"
+METRICS_NAME = "metrics.sqlite3"
+
+# Seconds between writes of the counters a process batches with add_batched()
+FLUSH_INTERVAL = 5
+
+# Upper bounds in seconds of the API latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metrics recorded in the sink: name -> (Prometheus type, help text)
+METRICS = {
+    "screener_job_duration_seconds": ("gauge", "Duration of the last run of a job"),
+    "screener_job_last_success_timestamp_seconds": ("gauge", "Unix time the last successful run of a job finished"),
+    "screener_job_runs_total": ("counter", "Job runs by outcome"),
+    "screener_api_requests_total": ("counter", "Exchange API requests by weight pool"),
+    "screener_api_weight_total": ("counter", "Exchange request weight spent by weight pool"),
+    "screener_api_wait_seconds_total": ("counter", "Seconds spent waiting for the shared request weight budget"),
+    "screener_symbols_screened": ("gauge", "Symbols screened by the last run of a job"),
+    "screener_results_written_total": ("counter", "Results written by a job"),
+    "screener_http_request_duration_seconds": ("histogram", "Latency of the API views"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+_local = threading.local()
+
+
+def label_key(labels):
+    """Canonical stored form of a label set."""
+    return json.dumps(labels, sort_keys=True)
+
+
+class MetricsSink:
+    """
+    Counters, gauges and histograms kept in a SQLite file.
+
+    Every process writing to the same directory adds to the same samples,
+    so short-lived cron commands and pool workers report to the
+    long-running web process, which renders them for Prometheus.
+    """
+
+    def __init__(self, metrics_dir=METRICS_DIR):
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(metrics_dir, METRICS_NAME), timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def add(self, samples):
+        """Add to several counters in one transaction: [(name, labels dict, amount), ...]."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?) "
+                "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+                [(name, label_key(labels), value) for name, labels, value in samples],
+            )
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter."""
+        self.add([(name, labels, amount)])
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO samples VALUES (?, ?, ?)", (name, label_key(labels), value)
+            )
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Add an observation to a histogram (cumulative buckets, sum and count)."""
+        samples = [(f"{name}_bucket", {**labels, "le": str(bound)}, int(value <= bound)) for bound in buckets]
+        samples.append((f"{name}_bucket", {**labels, "le": "+Inf"}, 1))
+        samples.append((f"{name}_sum", labels, value))
+        samples.append((f"{name}_count", labels, 1))
+        self.add(samples)
+
+    def samples(self):
+        """All stored samples as (name, labels dict, value)."""
+        rows = self.connection.execute("SELECT name, labels, value FROM samples").fetchall()
+        return [(name, json.loads(labels), value) for name, labels, value in rows]
+
+
+def metrics_sink(metrics_dir=METRICS_DIR):
+    """The sink of a directory, opened once per process and thread."""
+    sinks = getattr(_local, "sinks", None)
+    if sinks is None or _local.pid != os.getpid():
+        # Connections must not cross a fork
+        sinks = _local.sinks = {}
+        _local.pid = os.getpid()
+    if metrics_dir not in sinks:
+        sinks[metrics_dir] = MetricsSink(metrics_dir)
+    return sinks[metrics_dir]
+
+
+def record(metrics_dir, method, *args, **kwargs):
+    """
+    Call a sink method, never letting a metrics failure break the caller.
+
+    Example:
+        record("cache", "inc", "screener_api_requests_total", pool="spot")
+    """
+    try:
+        getattr(metrics_sink(metrics_dir), method)(*args, **kwargs)
+    except sqlite3.Error as e:
+        print(f"Error recording metrics ({method}): {e}")
+
+
+class PendingCounters:
+    """Counter amounts added by this process with add_batched() and not written yet."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.pid = None  # Process that registered the exit flush
+        self.samples = {}  # (metrics_dir, name, label key) -> [labels, amount]
+        self.flushed_at = 0.0
+
+
+_pending = PendingCounters()
+
+# A forked child starts without its parent's pending amounts, and with a lock no thread holds
+os.register_at_fork(after_in_child=_pending.reset)
+
+
+def add_batched(metrics_dir, samples):
+    """
+    Add to counters like MetricsSink.add(), writing at most every FLUSH_INTERVAL seconds.
+
+    For hot paths such as every exchange request. Amounts still pending are
+    written by flush(), which also runs at process exit (pool workers
+    included, through a multiprocessing finalizer).
+
+    Args:
+        metrics_dir (str): Directory of the sink
+        samples (list): [(name, labels dict, amount), ...]
+    """
+    now = time.time()
+    with _pending.lock:
+        if _pending.pid != os.getpid():
+            _pending.pid = os.getpid()
+            _pending.flushed_at = now
+            util.Finalize(None, flush, exitpriority=10)
+        for name, labels, amount in samples:
+            key = (metrics_dir, name, label_key(labels))
+            if key in _pending.samples:
+                _pending.samples[key][1] += amount
+            else:
+                _pending.samples[key] = [labels, amount]
+        if now - _pending.flushed_at < FLUSH_INTERVAL:
+            return
+    flush()
+
+
+def flush():
+    """Write the amounts this process batched with add_batched()."""
+    with _pending.lock:
+        due, _pending.samples = _pending.samples, {}
+        _pending.flushed_at = time.time()
+    samples = {}
+    for (metrics_dir, name, _), (labels, amount) in due.items():
+        samples.setdefault(metrics_dir, []).append((name, labels, amount))
+    for metrics_dir, dir_samples in samples.items():
+        record(metrics_dir, "add", dir_samples)
+
+
+class JobRun:
+    """Outcome of a job run inside job_metrics(); set failed when the job handles its own errors."""
+
+    def __init__(self):
+        self.failed = False
+
+
+@contextmanager
+def job_metrics(job, metrics_dir=METRICS_DIR):
+    """
+    Record the duration, outcome and last success time of a job run.
+
+    Example:
+        with job_metrics("update_value_area", metrics_dir) as run:
+            try:
+                ...
+            except Exception:
+                run.failed = True
+    """
+    run = JobRun()
+    start = time.time()
+    try:
+        yield run
+    except BaseException:
+        run.failed = True
+        raise
+    finally:
+        flush()
+        finished = time.time()
+        record(metrics_dir, "set", "screener_job_duration_seconds", finished - start, job=job)
+        record(metrics_dir, "inc", "screener_job_runs_total", job=job, status="failure" if run.failed else "success")
+        if not run.failed:
+            record(metrics_dir, "set", "screener_job_last_success_timestamp_seconds", finished, job=job)
+
+
+def format_value(value):
+    return repr(float(value)).replace("inf", "Inf")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def sample_order(sample):
+    """Sort key keeping histogram buckets in increasing order."""
+    name, labels, _ = sample
+    le = labels.get("le")
+    bound = float("inf") if le == "+Inf" else float(le) if le is not None else 0.0
+    return name, sorted((key, value) for key, value in labels.items() if key != "le"), bound
+
+
+def render(samples, extra=()):
+    """
+    Prometheus text exposition of stored samples.
+
+    Args:
+        samples (list): (name, labels, value) from MetricsSink.samples()
+        extra (iterable): (name, type, help, [(labels, value), ...]) for
+            metrics computed at scrape time
+
+    Returns:
+        str: Exposition text (format version 0.0.4)
+    """
+    lines = []
+    for base, (kind, help_text) in sorted(METRICS.items()):
+        names = (f"{base}_bucket", f"{base}_sum", f"{base}_count") if kind == "histogram" else (base,)
+        selected = sorted((sample for sample in samples if sample[0] in names), key=sample_order)
+        if not selected:
+            continue
+        lines.append(f"# HELP {base} {help_text}")
+        lines.append(f"# TYPE {base} {kind}")
+        for name, labels, value in selected:
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+    for base, kind, help_text, values in extra:
+        lines.append(f"# HELP {base} {help_text}")
+        lines.append(f"# TYPE {base} {kind}")
+        for labels, value in values:
+            lines.append(f"{base}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-19 01:40
+
+from django.db import migrations, models
+
+
+def backfill_rollup(apps, schema_editor):
+    """Roll up the results saved before the rollup existed, hour by hour."""
+    ValueAreaResult = apps.get_model('screener', 'ValueAreaResult')
+    ValueAreaHourlyRollup = apps.get_model('screener', 'ValueAreaHourlyRollup')
+    rollups = {}
+    for result in ValueAreaResult.objects.order_by('timestamp', 'id').iterator():
+        hour = result.timestamp.replace(minute=0, second=0, microsecond=0)
+        rollup = rollups.get((result.symbol, hour))
+        if rollup is None:
+            rollup = rollups[(result.symbol, hour)] = ValueAreaHourlyRollup(symbol=result.symbol, hour=hour, hits=0)
+        rollup.hits += 1
+        rollup.current_price, rollup.vah, rollup.val = result.current_price, result.vah, result.val
+    ValueAreaHourlyRollup.objects.bulk_create(rollups.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('screener', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='valuearearesult',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='ValueAreaHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=50)),
+                ('hour', models.DateTimeField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('current_price', models.FloatField()),
+                ('vah', models.FloatField()),
+                ('val', models.FloatField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'symbol'), name='unique_value_area_rollup_hour_symbol')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -5,7 +5,41 @@ class ValueAreaResult(models.Model):
     current_price = models.FloatField()
     vah = models.FloatField()
     val = models.FloatField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
-        return self.symbol
\ No newline at end of file
+        return self.symbol
+
+class ValueAreaHourlyRollup(models.Model):
+    """
+    Results per symbol and UTC hour, kept by update_value_area as it inserts them.
+
+    The value area API sums at most 24 of these per symbol instead of
+    counting every ValueAreaResult of the last day.
+    """
+    symbol = models.CharField(max_length=50)
+    hour = models.DateTimeField()
+    hits = models.PositiveIntegerField(default=0)
+    # Latest result of the hour
+    current_price = models.FloatField()
+    vah = models.FloatField()
+    val = models.FloatField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'symbol'], name='unique_value_area_rollup_hour_symbol'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.hour:%Y-%m-%d %H:00}"
+
+    @classmethod
+    def add_result(cls, result):
+        """Count a saved ValueAreaResult in its hour and keep its prices as the hour's latest."""
+        hour = result.timestamp.replace(minute=0, second=0, microsecond=0)
+        latest = {'current_price': result.current_price, 'vah': result.vah, 'val': result.val}
+        rollup, created = cls.objects.get_or_create(symbol=result.symbol, hour=hour, defaults={**latest, 'hits': 1})
+        if not created:
+            cls.objects.filter(pk=rollup.pk).update(hits=models.F('hits') + 1, **latest)
+        return rollup
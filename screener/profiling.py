@@ -0,0 +1,228 @@
+import cProfile
+import glob
+import json
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Profiles are written here unless an entry point passes its own directory
+PROFILE_DIR = os.path.join("results", "profiles")
+
+# Set by profile_session() so pool workers (forked or spawned) profile their tasks too
+PROFILE_DIR_ENV = "SCREENER_PROFILE_DIR"
+PROFILE_MEMORY_ENV = "SCREENER_PROFILE_MEMORY"
+
+# Frames deeper than this, or holding less than this many seconds, are left out of the collapsed stacks
+MAX_STACK_DEPTH = 64
+MIN_STACK_SECONDS = 0.0001
+
+# Functions printed in the summary at the end of a session
+SUMMARY_FUNCTIONS = 20
+
+# Profiler of this process: the session's in the parent, the task profiler in a worker
+_profiler = None
+_profiler_pid = None
+_session_pid = None
+
+
+class StagePeaks:
+    """
+    Peak traced memory per instrumentation stage, while tracemalloc is tracing.
+
+    Nested stages share tracemalloc's single peak counter, so the peak an
+    outer stage reached before an inner one resets it is carried over.
+    """
+
+    def __init__(self):
+        self.peaks = {}  # stage -> largest peak above the memory in use at its start, in bytes
+        self._open = []  # [memory at start, peak so far] per running stage
+
+    def start(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._open:
+            self._open[-1][1] = max(self._open[-1][1], peak)
+        tracemalloc.reset_peak()
+        self._open.append([current, current])
+
+    def finish(self, stage):
+        start, peak_so_far = self._open.pop()
+        peak = max(peak_so_far, tracemalloc.get_traced_memory()[1])
+        self.peaks[stage] = max(self.peaks.get(stage, 0), peak - start)
+        if self._open:
+            self._open[-1][1] = max(self._open[-1][1], peak)
+
+
+# Filled by instrumentation.timed() while tracemalloc is tracing
+stage_peaks = StagePeaks()
+
+
+def add_profile_arguments(parser):
+    """Add --profile and --profile-memory to an argparse parser (or a management command's)."""
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the run, including worker processes, into pstats and collapsed-stack files")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="With --profile, also record tracemalloc peak allocations per stage")
+
+
+def worker_profiler():
+    """This worker's profiler when a session is active in the parent, else None."""
+    global _profiler, _profiler_pid
+    if os.environ.get(PROFILE_DIR_ENV) is None or os.getpid() == _session_pid:
+        # No session, or the session's own process, which is profiled already
+        return None
+    if _profiler_pid != os.getpid():
+        if _profiler is not None:
+            # Forked from the parent while its profiler was running
+            _profiler.disable()
+        _profiler, _profiler_pid = cProfile.Profile(), os.getpid()
+        if os.environ.get(PROFILE_MEMORY_ENV) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        stage_peaks.peaks.clear()
+    return _profiler
+
+
+def run_profiled(function, data):
+    """
+    function(data), profiled when the parent runs a profile session.
+
+    Each worker keeps one profiler across its tasks and rewrites its dump
+    after every task, since pool workers exit without a shutdown hook.
+    """
+    profiler = worker_profiler()
+    if profiler is None:
+        return function(data)
+
+    profiler.enable()
+    try:
+        return function(data)
+    finally:
+        profiler.disable()
+        directory = os.environ[PROFILE_DIR_ENV]
+        profiler.dump_stats(os.path.join(directory, f"worker-{os.getpid()}.prof"))
+        if tracemalloc.is_tracing():
+            with open(os.path.join(directory, f"worker-{os.getpid()}.memory.json"), "w") as f:
+                json.dump(stage_peaks.peaks, f)
+
+
+def frame_name(function):
+    """Flame graph frame for a pstats function key (file, line, name)."""
+    filename, line, name = function
+    if filename == "~":
+        return name.replace(";", ",")
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ",")
+
+
+def collapsed_stacks(stats):
+    """
+    Collapsed stacks ("frame;frame;frame microseconds") from merged pstats.
+
+    cProfile only records caller/callee pairs, so each function's own time
+    is split over the paths leading to it in proportion to the time its
+    callers spent in it.
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    lines = {}
+
+    def walk(function, stack, fraction):
+        _, _, own_time, total_time, _ = stats.stats[function]
+        stack = stack + [frame_name(function)]
+        own = own_time * fraction
+        if own >= MIN_STACK_SECONDS:
+            key = ";".join(stack)
+            lines[key] = lines.get(key, 0) + own
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(function, ()):
+            callee_total = stats.stats[callee][3]
+            if callee_total <= 0 or frame_name(callee) in stack:
+                continue
+            share = fraction * edge_time / callee_total
+            if share * callee_total >= MIN_STACK_SECONDS:
+                walk(callee, stack, share)
+
+    roots = [function for function, entry in stats.stats.items() if not entry[4]]
+    for root in roots:
+        walk(root, [], 1.0)
+    return [f"{stack} {int(seconds * 1_000_000)}" for stack, seconds in sorted(lines.items()) if seconds * 1_000_000 >= 1]
+
+
+def merge_memory(paths, own_peaks):
+    """Largest peak per stage over the parent and every worker, in bytes."""
+    peaks = dict(own_peaks)
+    for path in paths:
+        try:
+            with open(path, "r") as f:
+                worker_peaks = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for stage, peak in worker_peaks.items():
+            peaks[stage] = max(peaks.get(stage, 0), peak)
+    return dict(sorted(peaks.items(), key=lambda item: item[1], reverse=True))
+
+
+@contextmanager
+def profile_session(name, enabled=True, memory=False, output_dir=PROFILE_DIR):
+    """
+    Profile everything run inside the block, in this process and in pool workers.
+
+    Workers pick the session up from the environment in run_profiled()
+    (instrumentation.measured() calls it). On exit the parent's and every
+    worker's profiles are merged into `<name>_<timestamp>.pstats` and a
+    flame graph compatible `.collapsed` file; with `memory`, tracemalloc
+    peak allocations per instrumentation stage go to `.memory.json`.
+
+    Yields:
+        str: Path prefix of the output files, or None when not enabled
+    """
+    global _profiler, _profiler_pid, _session_pid
+    if not enabled:
+        yield None
+        return
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    prefix = os.path.join(output_dir, f"{name}_{timestamp}")
+    workers_dir = f"{prefix}.workers"
+    os.makedirs(workers_dir, exist_ok=True)
+    os.environ[PROFILE_DIR_ENV] = workers_dir
+    if memory:
+        os.environ[PROFILE_MEMORY_ENV] = "1"
+        tracemalloc.start()
+        stage_peaks.peaks.clear()
+
+    _profiler, _profiler_pid = cProfile.Profile(), os.getpid()
+    _session_pid = os.getpid()
+    _profiler.enable()
+    try:
+        yield prefix
+    finally:
+        _profiler.disable()
+        os.environ.pop(PROFILE_DIR_ENV, None)
+        os.environ.pop(PROFILE_MEMORY_ENV, None)
+
+        stats = pstats.Stats(_profiler)
+        worker_dumps = sorted(glob.glob(os.path.join(workers_dir, "worker-*.prof")))
+        for path in worker_dumps:
+            stats.add(path)
+        stats.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.collapsed", "w") as f:
+            f.write("\n".join(collapsed_stacks(stats)) + "\n")
+        _profiler = _profiler_pid = _session_pid = None
+
+        print(f"\nProfile of the parent and {len(worker_dumps)} workers written to {prefix}.pstats "
+              f"and {prefix}.collapsed")
+        stats.sort_stats("cumulative").print_stats(SUMMARY_FUNCTIONS)
+
+        if memory:
+            peaks = merge_memory(glob.glob(os.path.join(workers_dir, "worker-*.memory.json")), stage_peaks.peaks)
+            tracemalloc.stop()
+            with open(f"{prefix}.memory.json", "w") as f:
+                json.dump(peaks, f, indent=2)
+            print("Peak allocations per stage:")
+            for stage, peak in peaks.items():
+                print(f"- {stage}: {peak / 1e6:.1f} MB")
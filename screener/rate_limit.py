@@ -0,0 +1,199 @@
+import fcntl
+import os
+import struct
+import time
+
+try:
+    from screener.metrics import add_batched
+except ImportError:
+    from metrics import add_batched
+
+# Bucket state files live next to the markets snapshot, one per weight pool
+RATE_LIMIT_DIR = "cache"
+
+# Binance request weight allowed per minute and IP, per pool
+WEIGHT_LIMITS = {
+    "spot": 6000,
+    "futures": 2400,   # fapi (USDT-M)
+    "delivery": 2400,  # dapi (COIN-M)
+}
+WEIGHT_SHARE = 0.8  # Share of the cap the screeners use; the rest absorbs other clients on the IP
+BURST_SECONDS = 10  # Bucket capacity, in seconds of budget
+
+# ccxt expresses spot weights in units of 5 (klines weight 2 -> cost 0.4)
+SPOT_COST_SCALE = 5
+
+# Binance default for klines requests sent without a limit
+DEFAULT_KLINES_LIMIT = 500
+
+STATE = struct.Struct("<dd")  # tokens, last refill (epoch seconds)
+
+
+def request_weight(api, params, config):
+    """
+    Binance weight of one request and the pool it counts against.
+
+    Uses the per-endpoint costs ccxt ships for Binance: weights that grow
+    with `limit` (klines), symbol-less variants (all tickers) and flat costs.
+
+    Returns:
+        tuple: (pool, weight)
+    """
+    if isinstance(api, (list, tuple)):
+        api = api[0]
+    if not isinstance(config, dict):
+        config = {"cost": config}
+    cost = config.get("cost", 1)
+    if "noSymbol" in config and "symbol" not in params:
+        cost = config["noSymbol"]
+    elif "byLimit" in config:
+        limit = params.get("limit", DEFAULT_KLINES_LIMIT)
+        for max_limit, limit_cost in config["byLimit"]:
+            if limit <= max_limit:
+                cost = limit_cost
+                break
+
+    if api.startswith("fapi"):
+        return "futures", cost
+    if api.startswith("dapi"):
+        return "delivery", cost
+    return "spot", cost * SPOT_COST_SCALE
+
+
+def update_shared_state(path, state_format, update):
+    """
+    Read-modify-write a small fixed-size state file under an exclusive lock.
+
+    Args:
+        path (str): State file, created on first use
+        state_format (struct.Struct): Record layout
+        update (callable): Called with (values or None, now); returns
+            (new values, result)
+
+    Returns:
+        The result returned by `update`
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        state = os.pread(fd, state_format.size, 0)
+        values = state_format.unpack(state) if len(state) == state_format.size else None
+        values, result = update(values, time.time())
+        os.pwrite(fd, state_format.pack(*values), 0)
+        return result
+    finally:
+        os.close(fd)  # Also releases the lock
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state lives in a small file shared by all processes.
+
+    Every acquire locks the file (flock), refills the bucket for the time
+    elapsed since the last caller and takes the tokens, so any number of
+    workers draw from one budget.
+    """
+
+    def __init__(self, path, capacity, rate):
+        self.path = path
+        self.capacity = capacity
+        self.rate = rate  # tokens per second
+
+    def acquire(self, tokens):
+        """
+        Take `tokens` from the bucket, sleeping until they are available.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        tokens = min(tokens, self.capacity)
+
+        def take(values, now):
+            if values is None:
+                available = self.capacity
+            else:
+                available, updated = values
+                available = min(self.capacity, available + max(now - updated, 0) * self.rate)
+            if available >= tokens:
+                return (available - tokens, now), 0.0
+            return (available, now), (tokens - available) / self.rate
+
+        waited = 0.0
+        while True:
+            delay = update_shared_state(self.path, STATE, take)
+            if delay == 0.0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+class SharedRateLimiter:
+    """
+    Rate limiter for a ccxt Binance instance, shared across processes.
+
+    Installed as the exchange's calculate_rate_limiter_cost, which ccxt
+    calls before every request: it waits for the request's weight in the
+    shared bucket of its pool and returns a cost of 0, so ccxt's own
+    per-instance throttle does not sleep a second time. Holds no open
+    files, so it is pickled along with the exchange into worker processes.
+    """
+
+    def __init__(self, exchange_id, state_dir=RATE_LIMIT_DIR, share=WEIGHT_SHARE):
+        self.exchange_id = exchange_id
+        self.state_dir = state_dir
+        self.share = share
+        self.weight_used = {}  # pool -> weight requested by this process
+        self.waited = 0.0      # seconds this process spent waiting for tokens
+        self._buckets = {}
+
+    def bucket(self, pool):
+        """Shared bucket for a weight pool."""
+        bucket = self._buckets.get(pool)
+        if bucket is None:
+            if not os.path.exists(self.state_dir):
+                os.makedirs(self.state_dir, exist_ok=True)
+            per_second = WEIGHT_LIMITS[pool] * self.share / 60
+            bucket = SharedTokenBucket(
+                os.path.join(self.state_dir, f"rate_limit_{self.exchange_id}_{pool}.state"),
+                capacity=per_second * BURST_SECONDS,
+                rate=per_second,
+            )
+            self._buckets[pool] = bucket
+        return bucket
+
+    def acquire(self, pool, weight):
+        """Wait until `weight` can be spent in `pool`."""
+        self.weight_used[pool] = self.weight_used.get(pool, 0) + weight
+        waited = self.bucket(pool).acquire(weight)
+        self.waited += waited
+
+        # Requests of every process end up in the metrics sink next to the bucket state,
+        # batched so requests do not each write to it
+        labels = {"pool": pool}
+        samples = [("screener_api_requests_total", labels, 1), ("screener_api_weight_total", labels, weight)]
+        if waited:
+            samples.append(("screener_api_wait_seconds_total", labels, waited))
+        add_batched(self.state_dir, samples)
+
+    def __call__(self, api, method, path, params, config={}):
+        pool, weight = request_weight(api, params, config)
+        self.acquire(pool, weight)
+        return 0
+
+
+def install_rate_limiter(exchange, state_dir=RATE_LIMIT_DIR, share=WEIGHT_SHARE):
+    """
+    Make every request of a Binance exchange draw from the shared weight budget.
+
+    Does nothing if the exchange already has a shared limiter.
+
+    Returns:
+        SharedRateLimiter: The exchange's limiter
+    """
+    limiter = exchange.__dict__.get("calculate_rate_limiter_cost")
+    if isinstance(limiter, SharedRateLimiter):
+        return limiter
+    limiter = SharedRateLimiter(exchange.id, state_dir, share)
+    exchange.enableRateLimit = True
+    exchange.calculate_rate_limiter_cost = limiter
+    return limiter
@@ -0,0 +1,211 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+
+from candle_store import timeframe_to_ms, list_stored_symbols
+from detection import detect_gaps, lines_in_ranges
+from results_store import ResultsWriter
+from thresholds import PINESCRIPT_MIN_1H_GAP_PERCENT as MIN_1H_GAP_PERCENT
+from thresholds import PINESCRIPT_MIN_5M_GAP_PERCENT as MIN_5M_GAP_PERCENT
+from value_area import value_area_as_of, value_area_arrays
+from shared_candles import SharedCandles, attach_shared_candles, read_shared_candles, symbol_chunks
+from zones import ALIGNMENT_TYPES, new_setups, set_zones, setup_dtype, setups_to_dicts, zones_from_gaps
+
+HOUR_MS = timeframe_to_ms("1h")
+FIVE_MINUTES_MS = timeframe_to_ms("5m")
+DAY_MS = timeframe_to_ms("1d")
+
+# Replay setups as compact records, so workers return arrays instead of dicts
+SETUP_DTYPE = setup_dtype(extra=[("as_of", "i8")])
+
+
+def screen_as_of(symbol, as_of_ms, window_ms, lookback_ms, store_dir=None,
+                 min_1h_gap_percent=MIN_1H_GAP_PERCENT, min_5m_gap_percent=MIN_5M_GAP_PERCENT):
+    """
+    Replay the 2025 screener for one symbol at a historical point in time.
+
+    Only candles that had closed by `as_of_ms` are used. A 1H gap can only
+    pair with a 5M gap completing after it, and the value area for each 5M
+    gap is rebuilt from the days that had closed before it.
+
+    Args:
+        symbol (str): Trading pair symbol
+        as_of_ms (int): Replay time in epoch ms; the 5M window ends here
+        window_ms (int): Length of the 5M window in ms
+        lookback_ms (int): How far back 1H gaps are searched, in ms
+        store_dir (str, optional): Candle store directory
+
+    Returns:
+        list: Setups in the same shape as custom_process_symbol
+    """
+    return setups_to_dicts(screen_as_of_records(
+        symbol, as_of_ms, window_ms, lookback_ms, store_dir, min_1h_gap_percent, min_5m_gap_percent))
+
+
+def screen_as_of_records(symbol, as_of_ms, window_ms, lookback_ms, store_dir=None,
+                         min_1h_gap_percent=MIN_1H_GAP_PERCENT, min_5m_gap_percent=MIN_5M_GAP_PERCENT):
+    """screen_as_of returning SETUP_DTYPE records; candles come from the shared block when attached."""
+    store_kwargs = {} if store_dir is None else {"store_dir": store_dir}
+    empty = np.empty(0, dtype=SETUP_DTYPE)
+    candles_1h = read_shared_candles(symbol, "1h", since=as_of_ms - lookback_ms,
+                                     until=as_of_ms - HOUR_MS + 1, **store_kwargs)
+    candles_5m = read_shared_candles(symbol, "5m", since=as_of_ms - window_ms,
+                                     until=as_of_ms - FIVE_MINUTES_MS + 1, **store_kwargs)
+    if len(candles_1h) < 3 or len(candles_5m) < 3:
+        return empty
+
+    gaps_1h = detect_gaps(candles_1h, min_1h_gap_percent)
+    gaps_5m = detect_gaps(candles_5m, min_5m_gap_percent)
+    if len(gaps_1h["bullish"]) == 0 or len(gaps_5m["bullish"]) == 0:
+        return empty
+
+    # A gap is known once its third candle has closed
+    known_1h = gaps_1h["timestamp"] + 2 * HOUR_MS
+    known_5m = gaps_5m["timestamp"] + 2 * FIVE_MINUTES_MS
+
+    # Value areas as of the day each 5M gap formed
+    gap_days = gaps_5m["timestamp"] - gaps_5m["timestamp"] % DAY_MS
+    value_areas = {day: value_area_as_of(candles_1h, day) for day in np.unique(gap_days)}
+    va_high, va_low = value_area_arrays(value_areas, gap_days)
+    va_ok = np.where(gaps_5m["bullish"], gaps_5m["upper_line"] < va_low, gaps_5m["lower_line"] > va_high)
+
+    gap_indexes, line_indexes = [], []
+    for is_bullish, line_field in ((True, "lower_line"), (False, "upper_line")):
+        selected = np.flatnonzero((gaps_5m["bullish"] == is_bullish) & va_ok)
+        ranges, lines = lines_in_ranges(gaps_1h[line_field],
+                                        gaps_5m["lower_line"][selected],
+                                        gaps_5m["upper_line"][selected])
+        gap_index = selected[ranges]
+        no_lookahead = known_1h[lines] <= known_5m[gap_index]
+        gap_indexes.append(gap_index[no_lookahead])
+        line_indexes.append(lines[no_lookahead])
+    i = np.concatenate(gap_indexes)
+    j = np.concatenate(line_indexes)
+
+    records = new_setups(len(i), symbol, extra=[("as_of", "i8")])
+    zones_5m = zones_from_gaps(gaps_5m, i)
+    records["bullish"] = zones_5m["bullish"]
+    records["alignment"] = np.where(zones_5m["bullish"], ALIGNMENT_TYPES.index("lower"), ALIGNMENT_TYPES.index("upper"))
+    records["current_price"] = float(candles_5m["close"][-1])
+    set_zones(records, "1h", zones_from_gaps(gaps_1h, j))
+    set_zones(records, "5m", zones_5m)
+    records["stop_loss"] = np.where(zones_5m["bullish"], zones_5m["middle_candle_low"], zones_5m["middle_candle_high"])
+    records["va_high"] = va_high[i]
+    records["va_low"] = va_low[i]
+    records["as_of"] = as_of_ms
+    return records
+
+
+def replay_task(data):
+    """Screen one (symbol, as-of) pair - for parallel processing; returns SETUP_DTYPE records."""
+    symbol, as_of_ms, window_ms, lookback_ms, store_dir = data
+    try:
+        return screen_as_of_records(symbol, as_of_ms, window_ms, lookback_ms, store_dir)
+    except Exception as e:
+        print(f"\rReplaying {symbol} - Error: {str(e)}", end="")
+        return np.empty(0, dtype=SETUP_DTYPE)
+
+
+def as_of_points(start, end, step, window):
+    """Window end times for a walk forward over [start, end)."""
+    points = []
+    as_of = start + window
+    while as_of <= end:
+        points.append(as_of)
+        as_of += step
+    return points
+
+
+def walk_forward(symbols, points, window, lookback, writer, store_dir=None, max_workers=None):
+    """
+    Replay the screener for every symbol at every as-of point, in parallel.
+
+    Each (symbol, window) pair is an independent task, so windows and
+    symbols are spread over the worker pool together. The candles every
+    task needs are loaded once into shared memory that all workers view,
+    one chunk of symbols at a time, and setups come back as compact
+    records, written as each task completes.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    window_ms = int(window.total_seconds() * 1000)
+    lookback_ms = int(lookback.total_seconds() * 1000)
+    as_of_ms = [int(as_of.timestamp() * 1000) for as_of in points]
+    total_tasks = len(symbols) * len(as_of_ms)
+    ranges = {
+        "1h": (min(as_of_ms) - lookback_ms, max(as_of_ms) - HOUR_MS + 1),
+        "5m": (min(as_of_ms) - window_ms, max(as_of_ms) - FIVE_MINUTES_MS + 1),
+    }
+    store_kwargs = {} if store_dir is None else {"store_dir": store_dir}
+    done = 0
+
+    # One shared block per chunk of symbols, released before the next one is loaded
+    for chunk in symbol_chunks(symbols):
+        tasks = [
+            (symbol, as_of, window_ms, lookback_ms, store_dir)
+            for as_of in as_of_ms for symbol in chunk
+        ]
+        shared = SharedCandles.create(chunk, ranges, **store_kwargs)
+        with shared, ProcessPoolExecutor(max_workers=max_workers, initializer=attach_shared_candles,
+                                         initargs=(shared.handle(),)) as executor:
+            for records in executor.map(replay_task, tasks, chunksize=8):
+                writer.write_records(records)
+                done += 1
+                print(f"\rReplayed {done}/{total_tasks} symbol windows, found {writer.total_setups} setups so far...", end="")
+    print()
+
+
+def parse_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the FVG screener over stored candles as of past dates")
+    parser.add_argument("--as-of", type=parse_date, help="Screen once, with the 5M window ending at this time")
+    parser.add_argument("--start", type=parse_date, help="Walk forward: start of the first 5M window")
+    parser.add_argument("--end", type=parse_date, help="Walk forward: no window ends after this time")
+    parser.add_argument("--window-days", type=float, default=7, help="Length of each 5M window in days")
+    parser.add_argument("--step-days", type=float, default=7, help="Walk forward step in days")
+    parser.add_argument("--lookback-days", type=float, default=90, help="How far back 1H gaps are searched")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to replay (default: every symbol with stored 5M candles)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    window = timedelta(days=args.window_days)
+    if args.as_of:
+        points = [args.as_of]
+    elif args.start and args.end:
+        points = as_of_points(args.start, args.end, timedelta(days=args.step_days), window)
+    else:
+        parser.error("either --as-of or both --start and --end are required")
+
+    symbols = args.symbols or list_stored_symbols("5m")
+    if not symbols or not points:
+        print("Nothing to replay")
+        return
+
+    print(f"Replaying {len(symbols)} symbols at {len(points)} points from {points[0].isoformat()} to {points[-1].isoformat()}")
+    print(f"Using minimum gap thresholds: 1H >= {MIN_1H_GAP_PERCENT}%, 5M >= {MIN_5M_GAP_PERCENT}%")
+
+    writer = ResultsWriter("results", "walk_forward", {
+        "coins_analyzed": symbols,
+        "as_of_points": [point.isoformat() for point in points],
+        "window_days": args.window_days,
+        "lookback_days": args.lookback_days,
+        "min_gap_thresholds": {
+            "1h": MIN_1H_GAP_PERCENT,
+            "5m": MIN_5M_GAP_PERCENT
+        }
+    })
+    with writer:
+        walk_forward(symbols, points, window, timedelta(days=args.lookback_days), writer, max_workers=args.workers)
+
+    print(f"Total setups found: {writer.total_setups}")
+    print(f"\nResults saved to: {writer.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from zones import setup_rows
+
+# Nested setup dicts that get flattened into prefixed columns: one per
+# timeframe, e.g. fvg_1h/fvg_5m, or fvg_1d/fvg_4h for longer confluence chains
+NESTED_KEY = re.compile(r"fvg_\d+[mhdwM]")
+NESTED_COLUMN = re.compile(r"(fvg_\d+[mhdwM])_(.+)")
+
+# Typed schema for the flattened setup columns. Columns not listed here are
+# kept as whatever pandas infers for them.
+SETUP_SCHEMA = {
+    "symbol": "category",
+    "type": "category",
+    "alignment_type": "category",
+    "current_price": "float64",
+    "stop_loss": "float64",
+    "risk_reward": "float64",
+    "va_high": "float64",
+    "va_low": "float64",
+    "fvg_1h_type": "category",
+    "fvg_1h_high": "float64",
+    "fvg_1h_low": "float64",
+    "fvg_1h_upper_line": "float64",
+    "fvg_1h_lower_line": "float64",
+    "fvg_1h_middle_candle_high": "float64",
+    "fvg_1h_middle_candle_low": "float64",
+    "fvg_1h_gap_percent": "float64",
+    "fvg_1h_timestamp": "datetime64[ns, UTC]",
+    "fvg_5m_high": "float64",
+    "fvg_5m_low": "float64",
+    "fvg_5m_upper_line": "float64",
+    "fvg_5m_lower_line": "float64",
+    "fvg_5m_middle_candle_high": "float64",
+    "fvg_5m_middle_candle_low": "float64",
+    "fvg_5m_gap_size": "float64",
+    "fvg_5m_gap_percent": "float64",
+    "fvg_5m_timestamp": "datetime64[ns, UTC]",
+}
+
+RESULTS_EXTENSION = ".ndjson"
+META_EXTENSION = ".meta.json"
+TIMINGS_EXTENSION = ".timings.json"
+
+
+def _to_json_value(value):
+    """Convert pandas/NumPy scalars into plain JSON-serializable values."""
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def flatten_setup(setup):
+    """
+    Flatten a nested setup dict into a single level of columns.
+
+    Nested `fvg_<timeframe>` dicts such as `fvg_1h`/`fvg_5m` become
+    `fvg_1h_<key>`/`fvg_5m_<key>` columns.
+
+    Args:
+        setup (dict): A setup as built by the screeners
+
+    Returns:
+        dict: Flat dict with JSON-serializable values
+    """
+    flat = {}
+    for key, value in setup.items():
+        if isinstance(value, dict) and NESTED_KEY.fullmatch(key):
+            for sub_key, sub_value in value.items():
+                flat[f"{key}_{sub_key}"] = _to_json_value(sub_value)
+        else:
+            flat[key] = _to_json_value(value)
+    return flat
+
+
+def unflatten_setup(flat):
+    """Rebuild the nested setup dict shape from a flat row."""
+    setup = {}
+    for key, value in flat.items():
+        match = NESTED_COLUMN.fullmatch(key)
+        if match:
+            setup.setdefault(match.group(1), {})[match.group(2)] = value
+        else:
+            setup[key] = value
+    return setup
+
+
+def meta_path_for(results_path):
+    """Return the metadata sidecar path for a results file."""
+    return results_path[:-len(RESULTS_EXTENSION)] + META_EXTENSION
+
+
+def timings_path_for(results_path):
+    """Return the stage timings sidecar path for a results file."""
+    return results_path[:-len(RESULTS_EXTENSION)] + TIMINGS_EXTENSION
+
+
+class ResultsWriter:
+    """
+    Append-only writer for screener results in newline-delimited JSON.
+
+    Each setup is written as one flattened row as soon as its symbol has been
+    processed, so a crash near the end of a run keeps everything found so far.
+    Run metadata lives in a `.meta.json` sidecar that is rewritten on close.
+    """
+
+    def __init__(self, results_dir, prefix, metadata=None):
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(results_dir, f"{prefix}_{timestamp}{RESULTS_EXTENSION}")
+        self.meta_path = meta_path_for(self.path)
+        self.metadata = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "format": "ndjson",
+            "complete": False,
+        }
+        self.metadata.update(metadata or {})
+        self.total_setups = 0
+        self.symbols_written = 0
+
+        self._file = open(self.path, "a")
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(self.meta_path, "w") as f:
+            json.dump(self.metadata, f, indent=2, default=str)
+
+    def write_setups(self, setups):
+        """Append one symbol's setups and flush them to disk."""
+        with timed("result_writing"):
+            for setup in setups:
+                self._file.write(json.dumps(flatten_setup(setup), default=str))
+                self._file.write("\n")
+            self._file.flush()
+        self.total_setups += len(setups)
+        self.symbols_written += 1
+
+    def write_records(self, records, layout="pinescript"):
+        """
+        Append one symbol's setups from a zones setup array.
+
+        Rows are identical to write_setups(setups_to_dicts(records, layout))
+        but are built straight from the array.
+        """
+        with timed("result_writing"):
+            for row in setup_rows(records, layout):
+                self._file.write(json.dumps(row, default=str))
+                self._file.write("\n")
+            self._file.flush()
+        self.total_setups += len(records)
+        self.symbols_written += 1
+
+    def write_timings(self, report):
+        """Write a run's stage timings (instrumentation.RunTimings.report()) next to the results."""
+        path = timings_path_for(self.path)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        self.metadata["timings_file"] = os.path.basename(path)
+
+    def close(self, complete=True, **extra_metadata):
+        """
+        Close the results file and record final run metadata.
+
+        Args:
+            complete (bool): Whether the run finished; a run that raised stays
+                marked incomplete, with its error type in `error`
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        self.metadata.update(extra_metadata)
+        self.metadata["total_setups"] = self.total_setups
+        self.metadata["complete"] = complete
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.close(complete=False, error=exc_type.__name__)
+
+
+def load_metadata(path):
+    """Load run metadata for either an NDJSON results file or a legacy JSON file."""
+    if path.endswith(RESULTS_EXTENSION):
+        meta_path = meta_path_for(path)
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, "r") as f:
+            return json.load(f)
+
+    with open(path, "r") as f:
+        data = json.load(f)
+    return {key: value for key, value in data.items() if key != "setups"}
+
+
+def iter_setups(path, nested=False):
+    """
+    Stream setups from a results file one at a time.
+
+    Args:
+        path (str): NDJSON results file, or a legacy JSON file with a `setups` list
+        nested (bool): Yield setups in the original nested dict shape
+
+    Yields:
+        dict: One setup per iteration
+    """
+    if path.endswith(RESULTS_EXTENSION):
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    flat = json.loads(line)
+                except ValueError:
+                    # A crash can leave a partial last line behind
+                    continue
+                yield unflatten_setup(flat) if nested else flat
+        return
+
+    with open(path, "r") as f:
+        data = json.load(f)
+    for setup in data.get("setups", []):
+        yield setup if nested else flatten_setup(setup)
+
+
+def column_dtype(column):
+    """Schema dtype of a flattened column; other timeframes follow the fvg_1h/fvg_5m columns."""
+    if column in SETUP_SCHEMA:
+        return SETUP_SCHEMA[column]
+    match = NESTED_COLUMN.fullmatch(column)
+    if match:
+        field = match.group(2)
+        return SETUP_SCHEMA.get(f"fvg_1h_{field}") or SETUP_SCHEMA.get(f"fvg_5m_{field}")
+    return None
+
+
+def _apply_schema(df, columns=None):
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    for column in df.columns:
+        dtype = column_dtype(column)
+        if dtype is None:
+            continue
+        if dtype.startswith("datetime64"):
+            df[column] = pd.to_datetime(df[column], utc=True, format="ISO8601")
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def iter_setup_frames(path, chunksize=100000, columns=None):
+    """
+    Stream a results file as typed DataFrame chunks with bounded memory.
+
+    Args:
+        path (str): Results file path
+        chunksize (int): Number of setups per chunk
+        columns (list, optional): Only keep these flattened columns
+
+    Yields:
+        pd.DataFrame: Flattened, typed setups
+    """
+    rows = []
+    for row in iter_setups(path):
+        rows.append(row)
+        if len(rows) >= chunksize:
+            yield _apply_schema(pd.DataFrame(rows), columns)
+            rows = []
+    if rows:
+        yield _apply_schema(pd.DataFrame(rows), columns)
+
+
+def load_setups_frame(path, columns=None):
+    """Load a whole results file into one typed DataFrame."""
+    frames = list(iter_setup_frames(path, columns=columns))
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
@@ -1,8 +1,10 @@
+import argparse
 import ccxt
 import os
 import json
-from datetime import datetime, timezone
 from utils import find_fvg_setups
+from results_store import ResultsWriter, iter_setups
+from profiling import add_profile_arguments, profile_session
 
 def load_valid_futures_symbols():
     """Load valid futures symbols from the JSON file."""
@@ -19,6 +21,14 @@ def load_valid_futures_symbols():
         return data['symbols']
 
 def main():
+    parser = argparse.ArgumentParser(description="Screen all valid futures symbols for 1H/5M FVG setups")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session("fvg_screener", enabled=args.profile, memory=args.profile_memory):
+        run_screener()
+
+def run_screener():
     print("Initializing FVG Screener...")
     
     # Load valid futures symbols
@@ -37,33 +47,20 @@ def main():
         }
     })
 
+    # Stream setups to the results file as each symbol completes
+    writer = ResultsWriter("results", "fvg_setups", {"total_symbols": len(valid_symbols)})
+
     # Find FVG setups
     print("\nStarting FVG analysis...")
-    fvg_setups = find_fvg_setups(exchange, valid_symbols, "futures")
-
-    # Create results directory if it doesn't exist
-    results_dir = "results"
-    if not os.path.exists(results_dir):
-        os.makedirs(results_dir)
-
-    # Generate timestamp for filename
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    json_filename = os.path.join(results_dir, f"fvg_setups_{timestamp}.json")
-
-    # Save results to JSON file
-    print(f"\nSaving results to {json_filename}")
-    with open(json_filename, 'w') as f:
-        json.dump({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "total_symbols": len(valid_symbols),
-            "setups": fvg_setups
-        }, f, indent=2, default=str)
+    print(f"\nSaving results to {writer.path}")
+    with writer:
+        find_fvg_setups(exchange, valid_symbols, "futures", writer=writer)
 
     # Print results
     print("\n=== FVG Setups ===")
-    if fvg_setups:
-        print(f"\nFound {len(fvg_setups)} FVG setups:")
-        for setup in fvg_setups:
+    if writer.total_setups:
+        print(f"\nFound {writer.total_setups} FVG setups:")
+        for setup in iter_setups(writer.path, nested=True):
             print(f"\nSymbol: {setup['symbol']}")
             print(f"Type: {setup['type'].upper()}")
             print(f"Current Price: {setup['current_price']:.8f}")
@@ -76,7 +73,7 @@ def main():
     else:
         print("No FVG setups found.")
 
-    print(f"\nResults saved to: {json_filename}")
+    print(f"\nResults saved to: {writer.path}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
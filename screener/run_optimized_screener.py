@@ -1,8 +1,6 @@
 import ccxt
-import os
-import json
-from datetime import datetime, timezone
 from utils import find_fvg_setups
+from results_store import ResultsWriter, iter_setups
 import time
 
 def main():
@@ -30,38 +28,24 @@ def main():
     # Track execution time
     start_time = time.time()
     
-    # Find FVG setups using optimized method
-    fvg_setups = find_fvg_setups(exchange, specific_symbols, "futures")
-    
-    # Calculate execution time
-    execution_time = time.time() - start_time
-    
-    # Create results directory if it doesn't exist
-    results_dir = "results"
-    if not os.path.exists(results_dir):
-        os.makedirs(results_dir)
+    # Stream setups to the results file as each symbol completes
+    writer = ResultsWriter("results", "optimized_coin_setups", {"coins_analyzed": specific_symbols})
 
-    # Generate timestamp for filename
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    json_filename = os.path.join(results_dir, f"optimized_coin_setups_{timestamp}.json")
-
-    # Save results to JSON file
-    with open(json_filename, 'w') as f:
-        json.dump({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "coins_analyzed": specific_symbols,
-            "execution_time_seconds": execution_time,
-            "total_setups": len(fvg_setups),
-            "setups": fvg_setups
-        }, f, indent=2, default=str)
+    # Find FVG setups using optimized method
+    with writer:
+        find_fvg_setups(exchange, specific_symbols, "futures", writer=writer)
+        
+        # Calculate execution time
+        execution_time = time.time() - start_time
+        writer.metadata["execution_time_seconds"] = execution_time
 
     # Print results
     print(f"\nExecution time: {execution_time:.2f} seconds")
-    print(f"Total setups found: {len(fvg_setups)}")
+    print(f"Total setups found: {writer.total_setups}")
     
     print("\n=== FVG Setups ===")
-    if fvg_setups:
-        for setup in fvg_setups:
+    if writer.total_setups:
+        for setup in iter_setups(writer.path, nested=True):
             print(f"\nSymbol: {setup['symbol']}")
             print(f"Type: {setup['type'].upper()}")
             print(f"Current Price: {setup['current_price']:.8f}")
@@ -74,7 +58,7 @@ def main():
     else:
         print("No FVG setups found for the specified coins.")
 
-    print(f"\nResults saved to: {json_filename}")
+    print(f"\nResults saved to: {writer.path}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,8 +1,6 @@
 import ccxt
-import os
-import json
-from datetime import datetime, timezone
 from utils import find_fvg_setups
+from results_store import ResultsWriter, iter_setups
 
 def main():
     print("Initializing FVG Screener for Specific Coins...")
@@ -26,30 +24,17 @@ def main():
         }
     })
 
-    # Find FVG setups
-    fvg_setups = find_fvg_setups(exchange, specific_symbols, "futures")
-
-    # Create results directory if it doesn't exist
-    results_dir = "results"
-    if not os.path.exists(results_dir):
-        os.makedirs(results_dir)
+    # Stream setups to the results file as each symbol completes
+    writer = ResultsWriter("results", "specific_coins_fvg_setups", {"coins_analyzed": specific_symbols})
 
-    # Generate timestamp for filename
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    json_filename = os.path.join(results_dir, f"specific_coins_fvg_setups_{timestamp}.json")
-
-    # Save results to JSON file
-    with open(json_filename, 'w') as f:
-        json.dump({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "coins_analyzed": specific_symbols,
-            "setups": fvg_setups
-        }, f, indent=2, default=str)
+    # Find FVG setups
+    with writer:
+        find_fvg_setups(exchange, specific_symbols, "futures", writer=writer)
 
     # Print results
     print("\n=== FVG Setups ===")
-    if fvg_setups:
-        for setup in fvg_setups:
+    if writer.total_setups:
+        for setup in iter_setups(writer.path, nested=True):
             print(f"\nSymbol: {setup['symbol']}")
             print(f"Type: {setup['type'].upper()}")
             print(f"Current Price: {setup['current_price']:.8f}")
@@ -62,7 +47,7 @@ def main():
     else:
         print("No FVG setups found for the specified coins.")
 
-    print(f"\nResults saved to: {json_filename}")
+    print(f"\nResults saved to: {writer.path}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
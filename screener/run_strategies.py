@@ -0,0 +1,125 @@
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import ccxt
+import numpy as np
+
+from utils import get_ohlcv_data, get_ticker
+from candle_store import read_candles
+from concurrency import pool_workers
+from results_store import ResultsWriter
+from markets_snapshot import preload_markets
+from run_fvg_screener import load_valid_futures_symbols
+from strategies import STRATEGIES, SymbolContext, evaluate_strategies
+
+
+def load_candles(exchange, symbol, timeframe, since, until=None):
+    """Fetch candles through the cache once, then read them with volume from the candle store."""
+    fetched = get_ohlcv_data(exchange, symbol, timeframe, since)
+    if fetched is None:
+        return None
+
+    candles = read_candles(symbol, timeframe, since=since, until=until)
+    if len(candles) == 0:
+        # Store not written yet (e.g. cache filled before it existed)
+        candles = fetched
+        start = np.searchsorted(candles["timestamp"], since, side="left")
+        end = len(candles) if until is None else np.searchsorted(candles["timestamp"], until, side="left")
+        candles = candles[start:end]
+    return candles
+
+
+def process_symbol_strategies(data):
+    """Load one symbol's candles once and run every strategy on them - for parallel processing."""
+    symbol, exchange, names, since_1h, start_5m, end_5m = data
+    try:
+        preload_markets(exchange)
+        ticker = get_ticker(exchange, symbol)
+        current_price = ticker["last"]
+
+        candles_1h = load_candles(exchange, symbol, "1h", since_1h)
+        if candles_1h is None or len(candles_1h) < 3:
+            return []
+        candles_5m = load_candles(exchange, symbol, "5m", start_5m, end_5m)
+        if candles_5m is None or len(candles_5m) < 3:
+            return []
+
+        context = SymbolContext(symbol, current_price, candles_1h, candles_5m)
+        return evaluate_strategies(context, names)
+    except Exception as e:
+        print(f"\rProcessing symbol {symbol} - Error: {str(e)}", end="")
+        return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every registered FVG strategy in a single pass")
+    parser.add_argument("--strategies", nargs="*", choices=list(STRATEGIES), help="Strategies to run (default: all)")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to screen (default: valid futures symbols file)")
+    parser.add_argument("--days-1h", type=float, default=90, help="How far back 1H gaps are searched")
+    parser.add_argument("--days-5m", type=float, default=7, help="Length of the 5M window ending now")
+    args = parser.parse_args()
+
+    names = args.strategies or list(STRATEGIES)
+    symbols = args.symbols or load_valid_futures_symbols()
+    if not symbols:
+        return
+
+    print(f"Running strategies: {', '.join(names)}")
+    for name in names:
+        print(f"- {name}: {STRATEGIES[name]['description']}")
+
+    exchange = ccxt.binance({
+        'enableRateLimit': True,
+        'options': {
+            'defaultType': 'future',
+            'adjustForTimeDifference': True
+        }
+    })
+
+    start_time = time.time()
+    now = datetime.now(timezone.utc)
+    since_1h = int((now - timedelta(days=args.days_1h)).timestamp() * 1000)
+    start_5m = int((now - timedelta(days=args.days_5m)).timestamp() * 1000)
+    end_5m = int(now.timestamp() * 1000)
+
+    writer = ResultsWriter("results", "strategies", {
+        "coins_analyzed": symbols,
+        "strategies": {
+            name: {key: value for key, value in STRATEGIES[name].items() if key != "align"}
+            for name in names
+        },
+        "analysis_periods": {
+            "1h_fvgs": f"Last {args.days_1h} days",
+            "5m_setups": f"Last {args.days_5m} days"
+        }
+    })
+
+    # More workers than CPU cores while the shared request window is wider
+    max_workers = pool_workers(exchange, min(os.cpu_count(), 4))
+    symbol_data = [(symbol, exchange, names, since_1h, start_5m, end_5m) for symbol in symbols]
+    counts = Counter()
+
+    print(f"\nProcessing {len(symbols)} symbols using parallel processing...")
+    with writer:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for done, setups in enumerate(executor.map(process_symbol_strategies, symbol_data), start=1):
+                writer.write_setups(setups)
+                counts.update(setup["strategy"] for setup in setups)
+                print(f"\rProcessed {done}/{len(symbols)} symbols, found {writer.total_setups} setups so far...", end="")
+
+        execution_time = time.time() - start_time
+        writer.metadata["execution_time_seconds"] = execution_time
+
+    print(f"\n\nExecution time: {execution_time:.2f} seconds")
+    print("\n=== Setups By Strategy ===")
+    for name in names:
+        print(f"{name}: {counts[name]} setups")
+
+    print(f"\nResults saved to: {writer.path}")
+
+if __name__ == "__main__":
+    main()
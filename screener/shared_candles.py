@@ -0,0 +1,120 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from candle_store import CANDLE_DTYPE, STORE_DIR, read_candles
+
+# Symbols per shared block: callers load and release one block per chunk,
+# so peak memory grows with the chunk rather than with the universe
+SYMBOLS_PER_BLOCK = 50
+
+# Block attached by this worker process (see attach_shared_candles)
+_attached = None
+
+
+def symbol_chunks(symbols, size=SYMBOLS_PER_BLOCK):
+    """Consecutive chunks of `size` symbols, one shared block each."""
+    return [symbols[start:start + size] for start in range(0, len(symbols), size)]
+
+
+class SharedCandles:
+    """
+    Candles for many symbols and timeframes packed into one shared memory block.
+
+    The parent loads every series once; workers attach by name and get
+    zero-copy NumPy views by (symbol, timeframe) offset, so memory does not
+    grow with the number of workers.
+    """
+
+    def __init__(self, shm, index, owner=False):
+        self.shm = shm
+        self.index = index  # (symbol, timeframe) -> (offset, length, since, until)
+        self.owner = owner
+        total = sum(entry[1] for entry in index.values())
+        self.records = np.ndarray((total,), dtype=CANDLE_DTYPE, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, symbols, ranges, store_dir=STORE_DIR):
+        """
+        Load stored candles into a new shared block.
+
+        Args:
+            symbols (list): Trading pair symbols
+            ranges (dict): {timeframe: (since, until)} in epoch ms; either
+                bound may be None
+            store_dir (str): Candle store directory
+        """
+        series = {}
+        for symbol in symbols:
+            for timeframe, (since, until) in ranges.items():
+                candles = read_candles(symbol, timeframe, since, until, store_dir=store_dir)
+                if len(candles):
+                    series[(symbol, timeframe)] = (candles, since, until)
+
+        total = sum(len(candles) for candles, _, _ in series.values())
+        shm = shared_memory.SharedMemory(create=True, size=max(total * CANDLE_DTYPE.itemsize, 1))
+        index, offset = {}, 0
+        for key, (candles, since, until) in series.items():
+            index[key] = (offset, len(candles), since, until)
+            offset += len(candles)
+        shared = cls(shm, index, owner=True)
+        for key, (candles, _, _) in series.items():
+            start, length = index[key][:2]
+            shared.records[start:start + length] = candles
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """Attach to a block created in another process, from its handle()."""
+        name, index = handle
+        # Pool workers share the creator's resource tracker, so attaching does
+        # not schedule a second unlink; only the creator unlinks the block
+        return cls(shared_memory.SharedMemory(name=name), index)
+
+    def handle(self):
+        """Small picklable descriptor for attach()."""
+        return self.shm.name, self.index
+
+    def get(self, symbol, timeframe, since=None, until=None):
+        """
+        View of held candles in [since, until), or None if the range is not held.
+        """
+        entry = self.index.get((symbol, timeframe))
+        if entry is None:
+            return None
+        offset, length, held_since, held_until = entry
+        if (held_since is not None and (since is None or since < held_since)) or \
+                (held_until is not None and (until is None or until > held_until)):
+            return None
+
+        candles = self.records[offset:offset + length]
+        start = 0 if since is None else np.searchsorted(candles["timestamp"], since, side="left")
+        end = length if until is None else np.searchsorted(candles["timestamp"], until, side="left")
+        return candles[start:end]
+
+    def close(self):
+        self.records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_shared_candles(handle):
+    """ProcessPoolExecutor initializer: attach this worker to a shared block."""
+    global _attached
+    _attached = SharedCandles.attach(handle) if handle is not None else None
+
+
+def read_shared_candles(symbol, timeframe, since=None, until=None, store_dir=STORE_DIR):
+    """read_candles that serves from the attached shared block when it holds the range."""
+    if _attached is not None:
+        candles = _attached.get(symbol, timeframe, since, until)
+        if candles is not None:
+            return candles
+    return read_candles(symbol, timeframe, since, until, store_dir=store_dir)
@@ -0,0 +1,273 @@
+import numpy as np
+
+from detection import detect_gaps, detect_three_candle_gaps, lines_in_ranges
+from value_area import (
+    month_starts,
+    monthly_volume_days_value_areas,
+    monthly_profile_value_areas,
+    value_area_arrays,
+)
+from thresholds import (
+    ALIGNMENT_MIN_1H_GAP_PERCENT,
+    ALIGNMENT_MIN_5M_GAP_PERCENT,
+    MIN_GAP_PERCENT,
+    PINESCRIPT_MIN_1H_GAP_PERCENT,
+    PINESCRIPT_MIN_5M_GAP_PERCENT,
+)
+from zones import (
+    ALIGNMENT_TYPES,
+    new_setups,
+    set_zones,
+    setups_to_dicts,
+    three_candle_bounds,
+    three_candle_zones,
+    zones_from_gaps,
+)
+
+# Registered strategies by name, in registration order
+STRATEGIES = {}
+
+
+def register_strategy(name, detector, align, min_1h_gap_percent, min_5m_gap_percent,
+                      value_area=None, min_price=0, min_range=0, description=""):
+    """
+    Declare a strategy as a detector plus an alignment rule.
+
+    Args:
+        name (str): Tag written into each setup's `strategy` field
+        detector (str): Gap detector used on both timeframes ("three_candle" or "pinescript")
+        align (callable): Alignment rule, align(context, strategy) -> list of setups
+        min_1h_gap_percent (float): Minimum 1H gap size in %
+        min_5m_gap_percent (float): Minimum 5M gap size in %
+        value_area (str, optional): Value-area method the rule filters on
+            ("volume_days" or "profile_70")
+        min_price (float): Skip symbols priced below this
+        min_range (float): Skip symbols whose 1H high/low range is below this fraction
+        description (str): Human readable summary
+    """
+    STRATEGIES[name] = {
+        "name": name,
+        "detector": detector,
+        "align": align,
+        "min_1h_gap_percent": min_1h_gap_percent,
+        "min_5m_gap_percent": min_5m_gap_percent,
+        "value_area": value_area,
+        "min_price": min_price,
+        "min_range": min_range,
+        "description": description,
+    }
+
+
+class SymbolContext:
+    """
+    Candles of one symbol plus lazily computed primitives shared by all strategies.
+
+    Gaps are detected once per (timeframe, detector) without a threshold and
+    value areas once per method; strategies only apply masks on top.
+    """
+
+    DETECTORS = {
+        "pinescript": detect_gaps,
+        "three_candle": detect_three_candle_gaps,
+    }
+
+    def __init__(self, symbol, current_price, candles_1h, candles_5m):
+        self.symbol = symbol
+        self.current_price = current_price
+        self.candles = {"1h": candles_1h, "5m": candles_5m}
+        self._gaps = {}
+        self._value_areas = {}
+
+    def gaps(self, timeframe, detector):
+        key = (timeframe, detector)
+        if key not in self._gaps:
+            self._gaps[key] = self.DETECTORS[detector](self.candles[timeframe])
+        return self._gaps[key]
+
+    def value_areas(self, method, timestamps):
+        """(va_high, va_low) arrays for the month of each timestamp."""
+        months = month_starts(timestamps)
+        if method not in self._value_areas:
+            self._value_areas[method] = {}
+        areas = self._value_areas[method]
+        missing = [month for month in np.unique(months) if month not in areas]
+        if missing:
+            if method == "volume_days":
+                areas.update(monthly_volume_days_value_areas(self.candles["1h"], missing))
+            elif method == "profile_70":
+                areas.update(monthly_profile_value_areas(self.candles["1h"], missing, 0.7))
+            else:
+                raise ValueError(f"Unknown value area method: {method}")
+        return value_area_arrays(areas, months)
+
+
+def align_crossed_line(context, strategy):
+    """
+    utils.process_symbol rules: a 5M gap forms as price crosses a 1H zone line.
+
+    Bullish: 5M candle i-2 is below the zone high, candle i-1 reaches it and
+    the line sits inside the gap between candles i-1 and i+1. Bearish mirrors
+    this on the zone low. Each rule reduces to an interval of line prices per
+    5M candle, so all zones are matched with one range join per direction.
+    """
+    candles_1h, candles_5m = context.candles["1h"], context.candles["5m"]
+    gaps_1h = context.gaps("1h", strategy["detector"])
+    gaps_5m = context.gaps("5m", strategy["detector"])
+    highs, lows = np.asarray(candles_5m["high"]), np.asarray(candles_5m["low"])
+
+    setups = []
+    for direction in ("bullish", "bearish"):
+        keep = gaps_1h[direction]["gap_percent"] >= strategy["min_1h_gap_percent"]
+        zones_1h = three_candle_zones(candles_1h, gaps_1h, direction, keep)
+        zone_high, zone_low = three_candle_bounds(zones_1h)
+        zone_line = zone_high if direction == "bullish" else zone_low
+
+        gaps = gaps_5m[direction]
+        # Candle i-2 must exist for the crossing check
+        candidates = (gaps["index"] >= 2) & (gaps["gap_percent"] >= strategy["min_5m_gap_percent"])
+        i = gaps["index"][candidates]
+        if direction == "bullish":
+            range_low = np.maximum(highs[i - 1], np.nextafter(highs[i - 2], np.inf))
+            range_high = np.minimum(highs[i - 1], lows[i + 1])
+        else:
+            range_low = lows[i - 1]
+            range_high = np.minimum(highs[i + 1], np.nextafter(lows[i - 2], -np.inf))
+
+        ranges, lines = lines_in_ranges(zone_line, range_low, range_high)
+        zones_5m = three_candle_zones(candles_5m, gaps_5m, direction, candidates)[ranges]
+        records = new_setups(len(ranges), context.symbol)
+        records["bullish"] = direction == "bullish"
+        records["current_price"] = np.nan if context.current_price is None else context.current_price
+        set_zones(records, "1h", zones_1h[lines])
+        set_zones(records, "5m", zones_5m)
+        records["stop_loss"] = zones_5m["middle_candle_high" if direction == "bullish" else "middle_candle_low"]
+        setups.extend(setups_to_dicts(records, layout="three_candle"))
+    return setups
+
+
+def _pinescript_setups(context, gaps_1h, j, gaps_5m, i, alignment, va_high, va_low):
+    """Setup records pairing 1H gaps j with 5M gaps i; alignment indexes ALIGNMENT_TYPES."""
+    zones_5m = zones_from_gaps(gaps_5m, i)
+    records = new_setups(len(i), context.symbol)
+    records["bullish"] = zones_5m["bullish"]
+    records["alignment"] = alignment
+    records["current_price"] = np.nan if context.current_price is None else context.current_price
+    set_zones(records, "1h", zones_from_gaps(gaps_1h, j))
+    set_zones(records, "5m", zones_5m)
+    records["stop_loss"] = np.where(zones_5m["bullish"], zones_5m["middle_candle_low"], zones_5m["middle_candle_high"])
+    records["va_high"] = va_high[i]
+    records["va_low"] = va_low[i]
+    return records
+
+
+def _filtered_pinescript_gaps(context, strategy):
+    gaps_1h = context.gaps("1h", strategy["detector"])
+    gaps_5m = context.gaps("5m", strategy["detector"])
+    keep_1h = np.flatnonzero(gaps_1h["gap_percent"] >= strategy["min_1h_gap_percent"])
+    keep_5m = gaps_5m["gap_percent"] >= strategy["min_5m_gap_percent"]
+    va_high = np.full(len(keep_5m), np.nan)
+    va_low = np.full(len(keep_5m), np.nan)
+    if strategy["value_area"] is not None and len(keep_5m):
+        va_high, va_low = context.value_areas(strategy["value_area"], gaps_5m["timestamp"])
+        # Bullish gaps must complete below VAL, bearish ones above VAH
+        keep_5m &= np.where(gaps_5m["bullish"], gaps_5m["upper_line"] < va_low, gaps_5m["lower_line"] > va_high)
+    return gaps_1h, keep_1h, gaps_5m, keep_5m, va_high, va_low
+
+
+def align_line_in_range(context, strategy):
+    """
+    custom_process_symbol rules: the 1H lower line (bullish) or upper line
+    (bearish) must lie inside a same-direction 5M gap beyond the value area.
+    """
+    gaps_1h, keep_1h, gaps_5m, keep_5m, va_high, va_low = _filtered_pinescript_gaps(context, strategy)
+
+    setups = []
+    for is_bullish, line_field, alignment_type in ((True, "lower_line", "lower"), (False, "upper_line", "upper")):
+        selected = np.flatnonzero(keep_5m & (gaps_5m["bullish"] == is_bullish))
+        ranges, lines = lines_in_ranges(gaps_1h[line_field][keep_1h],
+                                        gaps_5m["lower_line"][selected],
+                                        gaps_5m["upper_line"][selected])
+        records = _pinescript_setups(context, gaps_1h, keep_1h[lines], gaps_5m, selected[ranges],
+                                     ALIGNMENT_TYPES.index(alignment_type), va_high, va_low)
+        setups.extend(setups_to_dicts(records))
+    return setups
+
+
+def align_either_line(context, strategy):
+    """
+    test_fvg_alignment rules: either line of a 1H gap lies inside any 5M gap,
+    optionally beyond the value area.
+    """
+    gaps_1h, keep_1h, gaps_5m, keep_5m, va_high, va_low = _filtered_pinescript_gaps(context, strategy)
+
+    selected = np.flatnonzero(keep_5m)
+    pairs = []
+    for line_field in ("lower_line", "upper_line"):
+        ranges, lines = lines_in_ranges(gaps_1h[line_field][keep_1h],
+                                        gaps_5m["lower_line"][selected],
+                                        gaps_5m["upper_line"][selected])
+        pairs.append(np.column_stack([selected[ranges], keep_1h[lines]]))
+    # A pair with both lines inside still counts once
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+
+    i, j = pairs[:, 0], pairs[:, 1]
+    alignment = np.where(gaps_1h["bullish"][j], ALIGNMENT_TYPES.index("bullish_1h_with_5m"),
+                         ALIGNMENT_TYPES.index("bearish_1h_with_5m"))
+    return setups_to_dicts(_pinescript_setups(context, gaps_1h, j, gaps_5m, i, alignment, va_high, va_low))
+
+
+def evaluate_strategies(context, names=None):
+    """
+    Run every requested strategy over one symbol's shared candles and primitives.
+
+    Returns:
+        list: Setups from all strategies, each tagged with its `strategy` name
+    """
+    setups = []
+    candles_1h = context.candles["1h"]
+    price_range = None
+    if len(candles_1h):
+        lowest = float(np.min(candles_1h["low"]))
+        price_range = (float(np.max(candles_1h["high"])) - lowest) / lowest if lowest > 0 else None
+
+    for name in names or STRATEGIES:
+        strategy = STRATEGIES[name]
+        if context.current_price is not None and context.current_price < strategy["min_price"]:
+            continue
+        if strategy["min_range"] and (price_range is None or price_range < strategy["min_range"]):
+            continue
+        for setup in strategy["align"](context, strategy):
+            setup["strategy"] = name
+            setups.append(setup)
+    return setups
+
+
+register_strategy(
+    "crossed_line",
+    detector="three_candle",
+    align=align_crossed_line,
+    min_1h_gap_percent=MIN_GAP_PERCENT,
+    min_5m_gap_percent=MIN_GAP_PERCENT,
+    min_price=0.001,
+    min_range=0.05,
+    description="3-candle gaps, 5M gap forming as price crosses a 1H zone line (utils.process_symbol)",
+)
+register_strategy(
+    "pinescript_va",
+    detector="pinescript",
+    align=align_line_in_range,
+    min_1h_gap_percent=PINESCRIPT_MIN_1H_GAP_PERCENT,
+    min_5m_gap_percent=PINESCRIPT_MIN_5M_GAP_PERCENT,
+    value_area="volume_days",
+    min_price=0.000001,
+    description="PineScript gaps, 1H line inside the 5M gap beyond the monthly value area (custom_process_symbol)",
+)
+register_strategy(
+    "either_line",
+    detector="pinescript",
+    align=align_either_line,
+    min_1h_gap_percent=ALIGNMENT_MIN_1H_GAP_PERCENT,
+    min_5m_gap_percent=ALIGNMENT_MIN_5M_GAP_PERCENT,
+    value_area="profile_70",
+    description="PineScript gaps, either 1H line inside the 5M gap beyond the value area (test_fvg_alignment)",
+)
@@ -0,0 +1,271 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from candle_store import timeframe_to_ms, list_stored_symbols
+from detection import detect_gaps, lines_in_ranges
+from backtest import backtest_symbol, WIN, LOSS, OPEN
+from value_area import month_starts, value_area_as_of, value_area_arrays
+from shared_candles import SharedCandles, attach_shared_candles, read_shared_candles, symbol_chunks
+
+# Default grid, covering the thresholds tried by hand so far
+DEFAULT_1H_THRESHOLDS = [0.0, 0.042, 0.1, 0.2, 0.3, 0.4, 0.42, 0.5]
+DEFAULT_5M_THRESHOLDS = [0.0, 0.01, 0.05, 0.1, 0.2, 0.42]
+DEFAULT_VA_PERCENTAGES = [None, 0.6, 0.7, 0.84, 0.99]
+
+# Per-cell statistics; all of them add up across symbols
+STAT_FIELDS = ["setups", "wins", "losses", "open", "sum_r"]
+
+HOUR_MS = timeframe_to_ms("1h")
+FIVE_MINUTES_MS = timeframe_to_ms("5m")
+DAY_MS = timeframe_to_ms("1d")
+
+# How far back from a 5M gap 1H gaps are searched, like the live screener's 90 days of 1H candles
+LOOKBACK_MS = 90 * DAY_MS
+
+
+def history_start(start_ms, lookback_ms):
+    """First 1H candle a sweep over [start_ms, ...) needs: the lookback and the value area's month."""
+    return int(min(start_ms - lookback_ms, month_starts([start_ms])[0]))
+
+
+def find_candidates(symbol, start_ms, end_ms, store_dir=None, risk_reward=2, max_bars=None, backtest=True,
+                    lookback_ms=LOOKBACK_MS):
+    """
+    Detect every 1H/5M gap pair for a symbol once, with no thresholds applied.
+
+    As in replay.screen_as_of, a 1H gap only pairs with 5M gaps completing
+    after it, and no more than `lookback_ms` later.
+
+    Returns:
+        dict: Per-pair arrays (gap percents, 5M gap index) plus per-5M-gap
+            arrays needed to apply value-area filters and outcomes later
+    """
+    store_kwargs = {} if store_dir is None else {"store_dir": store_dir}
+    candles_1h = read_shared_candles(symbol, "1h", since=history_start(start_ms, lookback_ms), until=end_ms,
+                                     **store_kwargs)
+    candles_5m = read_shared_candles(symbol, "5m", since=start_ms, **store_kwargs)
+    window_end = np.searchsorted(candles_5m["timestamp"], end_ms, side="left")
+
+    gaps_1h = detect_gaps(candles_1h)
+    gaps_5m = detect_gaps(candles_5m[:window_end])
+    if len(gaps_1h["bullish"]) == 0 or len(gaps_5m["bullish"]) == 0:
+        return None
+
+    # A gap is known once its third candle has closed
+    known_1h = gaps_1h["timestamp"] + 2 * HOUR_MS
+    known_5m = gaps_5m["timestamp"] + 2 * FIVE_MINUTES_MS
+
+    # Bullish 5M gaps align on the 1H lower line, bearish ones on the upper line
+    gap_index, line_index = [], []
+    for is_bullish, line_field in ((True, "lower_line"), (False, "upper_line")):
+        selected = np.flatnonzero(gaps_5m["bullish"] == is_bullish)
+        ranges, lines = lines_in_ranges(gaps_1h[line_field],
+                                        gaps_5m["lower_line"][selected],
+                                        gaps_5m["upper_line"][selected])
+        pair_gaps = selected[ranges]
+        in_window = (known_1h[lines] <= known_5m[pair_gaps]) & \
+            (gaps_1h["timestamp"][lines] >= known_5m[pair_gaps] - lookback_ms)
+        gap_index.append(pair_gaps[in_window])
+        line_index.append(lines[in_window])
+    gap_index = np.concatenate(gap_index)
+    line_index = np.concatenate(line_index)
+    if len(gap_index) == 0:
+        return None
+
+    # Outcomes only depend on the 5M gap, so each one is backtested once
+    outcome = np.full(len(gaps_5m["bullish"]), OPEN, dtype=object)
+    r_multiple = np.full(len(gaps_5m["bullish"]), np.nan)
+    if backtest:
+        setups = pd.DataFrame({
+            "type": np.where(gaps_5m["bullish"], "bullish", "bearish"),
+            "stop_loss": np.where(gaps_5m["bullish"], gaps_5m["middle_low"], gaps_5m["middle_high"]),
+            "risk_reward": risk_reward,
+            "fvg_5m_timestamp": pd.to_datetime(gaps_5m["timestamp"], unit="ms", utc=True),
+        })
+        results = backtest_symbol(setups, candles_5m, timeframe_to_ms("5m"), max_bars)
+        outcome = results["outcome"].to_numpy()
+        r_multiple = results["r_multiple"].to_numpy()
+
+    return {
+        "candles_1h": candles_1h,
+        "gaps_5m": gaps_5m,
+        "gap_index": gap_index,
+        "gap_percent_1h": gaps_1h["gap_percent"][line_index],
+        "gap_percent_5m": gaps_5m["gap_percent"][gap_index],
+        "outcome": outcome,
+        "r_multiple": r_multiple,
+    }
+
+
+def evaluate_grid(candidates, thresholds_1h, thresholds_5m, va_percentages):
+    """
+    Apply every grid cell to the candidate pairs as vectorized filters.
+
+    For each value-area percentage, the threshold masks of both timeframes
+    are combined with one matrix product, giving every (1H, 5M) cell at once.
+    Value areas use the daily-volume method of the live screener
+    (get_monthly_value_area), so 0.7 matches its 70% value area, built as
+    of the day each 5M gap formed (value_area.value_area_as_of).
+
+    Returns:
+        np.ndarray: Stats with shape (va, 1h, 5m, len(STAT_FIELDS))
+    """
+    stats = np.zeros((len(va_percentages), len(thresholds_1h), len(thresholds_5m), len(STAT_FIELDS)))
+    if candidates is None:
+        return stats
+
+    gaps_5m = candidates["gaps_5m"]
+    gap_index = candidates["gap_index"]
+    mask_1h = (candidates["gap_percent_1h"][:, None] >= np.asarray(thresholds_1h)[None, :]).astype("f8")
+    mask_5m = (candidates["gap_percent_5m"][:, None] >= np.asarray(thresholds_5m)[None, :]).astype("f8")
+
+    outcome = candidates["outcome"][gap_index]
+    r_multiple = np.nan_to_num(candidates["r_multiple"][gap_index])
+    weights = np.column_stack([
+        np.ones(len(gap_index)),
+        outcome == WIN,
+        outcome == LOSS,
+        outcome == OPEN,
+        r_multiple,
+    ]).astype("f8")
+
+    gap_days = gaps_5m["timestamp"][gap_index] - gaps_5m["timestamp"][gap_index] % DAY_MS
+    for va_position, percentage in enumerate(va_percentages):
+        if percentage is None:
+            va_ok = np.ones(len(gap_index), dtype=bool)
+        else:
+            areas = {day: value_area_as_of(candidates["candles_1h"], day, percentage * 100)
+                     for day in np.unique(gap_days)}
+            va_high, va_low = value_area_arrays(areas, gap_days)
+            # Bullish gaps must complete below VAL, bearish ones above VAH
+            va_ok = np.where(gaps_5m["bullish"][gap_index], gaps_5m["upper_line"][gap_index] < va_low,
+                             gaps_5m["lower_line"][gap_index] > va_high)
+
+        selected = va_ok.astype("f8")
+        for stat_position in range(len(STAT_FIELDS)):
+            weighted = mask_1h * (selected * weights[:, stat_position])[:, None]
+            stats[va_position, :, :, stat_position] = weighted.T @ mask_5m
+    return stats
+
+
+def sweep_symbol(data):
+    """Detect candidates for one symbol and evaluate the whole grid - for parallel processing."""
+    symbol, start_ms, end_ms, grid, options = data
+    try:
+        candidates = find_candidates(symbol, start_ms, end_ms, **options)
+        return evaluate_grid(candidates, *grid)
+    except Exception as e:
+        print(f"\rSweeping symbol {symbol} - Error: {str(e)}", end="")
+        return None
+
+
+def run_sweep(symbols, start_ms, end_ms, thresholds_1h=None, thresholds_5m=None, va_percentages=None,
+              max_workers=None, lookback_ms=LOOKBACK_MS, **options):
+    """
+    Evaluate a grid of gap thresholds and value-area percentages over many symbols.
+
+    Returns:
+        pd.DataFrame: One row per grid cell with setup counts and outcome stats
+    """
+    grid = (
+        thresholds_1h or DEFAULT_1H_THRESHOLDS,
+        thresholds_5m or DEFAULT_5M_THRESHOLDS,
+        va_percentages or DEFAULT_VA_PERCENTAGES,
+    )
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    totals = np.zeros((len(grid[2]), len(grid[0]), len(grid[1]), len(STAT_FIELDS)))
+    store_kwargs = {} if options.get("store_dir") is None else {"store_dir": options["store_dir"]}
+    done = 0
+
+    # Each chunk's candles are loaded once into shared memory that every worker
+    # views, and released before the next chunk is loaded
+    for chunk in symbol_chunks(symbols):
+        symbol_data = [(symbol, start_ms, end_ms, grid, dict(options, lookback_ms=lookback_ms)) for symbol in chunk]
+        shared = SharedCandles.create(chunk, {"1h": (history_start(start_ms, lookback_ms), end_ms),
+                                              "5m": (start_ms, None)}, **store_kwargs)
+        with shared, ProcessPoolExecutor(max_workers=max_workers, initializer=attach_shared_candles,
+                                         initargs=(shared.handle(),)) as executor:
+            for stats in executor.map(sweep_symbol, symbol_data):
+                if stats is not None:
+                    totals += stats
+                done += 1
+                print(f"\rSwept {done}/{len(symbols)} symbols...", end="")
+    print()
+
+    va_grid, grid_1h, grid_5m = np.meshgrid(range(len(grid[2])), grid[0], grid[1], indexing="ij")
+    cells = pd.DataFrame({
+        "va_percentage": np.array(grid[2], dtype=object)[va_grid.ravel()],
+        "min_1h_gap_percent": grid_1h.ravel(),
+        "min_5m_gap_percent": grid_5m.ravel(),
+    })
+    for position, field in enumerate(STAT_FIELDS):
+        cells[field] = totals[..., position].ravel()
+    cells[["setups", "wins", "losses", "open"]] = cells[["setups", "wins", "losses", "open"]].astype("int64")
+
+    resolved = cells["wins"] + cells["losses"]
+    cells["win_rate"] = (cells["wins"] / resolved.where(resolved > 0)).round(4)
+    cells["expectancy_r"] = (cells["sum_r"] / resolved.where(resolved > 0)).round(4)
+    return cells.drop(columns="sum_r")
+
+
+def parse_list(value):
+    return [None if item.strip().lower() == "none" else float(item) for item in value.split(",")]
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep FVG thresholds and value-area percentages over stored candles")
+    parser.add_argument("--start", type=parse_date, required=True, help="Start of the 5M window (YYYY-MM-DD)")
+    parser.add_argument("--end", type=parse_date, required=True, help="End of the 5M window (YYYY-MM-DD, exclusive)")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to sweep (default: every symbol with stored 5M candles)")
+    parser.add_argument("--min-1h", type=parse_list, help="Comma separated 1H gap thresholds in %%")
+    parser.add_argument("--min-5m", type=parse_list, help="Comma separated 5M gap thresholds in %%")
+    parser.add_argument("--va", type=parse_list, help="Comma separated value-area percentages ('none' disables the filter)")
+    parser.add_argument("--lookback-days", type=float, default=90, help="How far back from a 5M gap 1H gaps are searched")
+    parser.add_argument("--max-bars", type=int, help="Leave setups open if unresolved after this many candles")
+    parser.add_argument("--no-backtest", action="store_true", help="Only count setups")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--output", help="CSV file for the grid results")
+    args = parser.parse_args()
+
+    symbols = args.symbols or list_stored_symbols("5m")
+    if not symbols:
+        print("No symbols with stored 5M candles")
+        return
+
+    print(f"Sweeping {len(symbols)} symbols from {args.start.isoformat()} to {args.end.isoformat()}...")
+    cells = run_sweep(
+        symbols,
+        int(args.start.timestamp() * 1000),
+        int(args.end.timestamp() * 1000),
+        args.min_1h,
+        args.min_5m,
+        args.va,
+        max_workers=args.workers,
+        lookback_ms=int(args.lookback_days * DAY_MS),
+        max_bars=args.max_bars,
+        backtest=not args.no_backtest,
+    )
+
+    sort_by = "setups" if args.no_backtest else "expectancy_r"
+    print(cells.sort_values(sort_by, ascending=False).to_string(index=False))
+
+    if args.output:
+        output_dir = os.path.dirname(args.output)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        cells.to_csv(args.output, index=False)
+        print(f"\nGrid saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from screener.markets_snapshot import SNAPSHOT_DIR, SNAPSHOT_TTL, snapshot_path, read_markets_snapshot, preload_markets
+except ImportError:
+    from markets_snapshot import SNAPSHOT_DIR, SNAPSHOT_TTL, snapshot_path, read_markets_snapshot, preload_markets
+
+# Coins still listed on the exchange that the screeners should ignore
+DELISTED_COINS = {"CVC", "BTCST", "SC", "RAY", "FTT"}
+
+# Contract size prefixes on futures bases, e.g. 1000PEPE or 1MBABYDOGE
+MULTIPLIER_PREFIX = re.compile(r"^(1000000|100000|10000|1000|100|10|1M)(?=[A-Z])")
+
+# Market types kept in the registry
+REGISTRY_TYPES = ("spot", "swap", "future")
+
+Instrument = namedtuple("Instrument", [
+    "id",            # integer id, stable for a given markets snapshot
+    "symbol",        # unified ccxt symbol, e.g. "1000PEPE/USDT:USDT"
+    "pair",          # symbol without the settle currency, e.g. "1000PEPE/USDT"
+    "market_id",     # exchange id, e.g. "1000PEPEUSDT"
+    "type",          # "spot", "swap" or "future"
+    "base",          # exchange base, e.g. "1000PEPE"
+    "quote",
+    "base_asset",    # base with the contract multiplier removed, e.g. "PEPE"
+    "multiplier",    # units of base_asset per unit of base, e.g. 1000
+    "tick_size",
+    "active",        # trading on the exchange
+    "listed",        # active and not in DELISTED_COINS
+])
+
+
+def split_multiplier(base, spot_bases=()):
+    """
+    Split a futures base into (base_asset, multiplier).
+
+    A base that exists on spot as-is (e.g. 1000SATS) has no multiplier, and
+    so does one whose remainder is not a known spot base when it starts
+    with a plain digit (e.g. 1INCH).
+    """
+    if base in spot_bases:
+        return base, 1
+    match = MULTIPLIER_PREFIX.match(base)
+    if not match:
+        return base, 1
+    asset = base[match.end():]
+    multiplier = 1000000 if match.group(1) == "1M" else int(match.group(1))
+    if spot_bases and asset not in spot_bases and match.group(1) in ("10", "100"):
+        return base, 1
+    return asset, multiplier
+
+
+class SymbolRegistry:
+    """
+    Every instrument with an integer id plus precomputed spot/futures/base mappings.
+
+    Lookups by symbol, id or (base asset, quote) are dict or list accesses;
+    per-id arrays (tick sizes, multipliers, listing status) allow vectorized use.
+    """
+
+    def __init__(self, instruments):
+        self.instruments = instruments
+        self._ids = {instrument.symbol: instrument.id for instrument in instruments}
+        self._spot = {}
+        self._futures = {}
+        for instrument in instruments:
+            key = (instrument.base_asset, instrument.quote)
+            if instrument.type == "spot":
+                self._spot[key] = instrument.id
+            elif instrument.type == "swap" and instrument.symbol.endswith(f":{instrument.quote}"):
+                # Linear perpetuals only; inverse and delivery contracts have no spot pairing
+                self._futures[key] = instrument.id
+
+        self.tick_sizes = np.array([instrument.tick_size for instrument in instruments], dtype="f8")
+        self.multipliers = np.array([instrument.multiplier for instrument in instruments], dtype="f8")
+        self.listed = np.array([instrument.listed for instrument in instruments], dtype=bool)
+
+    @classmethod
+    def from_markets(cls, markets):
+        """Build the registry from a ccxt markets dict."""
+        kept = sorted(
+            (market for market in markets.values() if market.get("type") in REGISTRY_TYPES),
+            key=lambda market: market["symbol"],
+        )
+        spot_bases = {market["base"] for market in kept if market["type"] == "spot"}
+
+        instruments = []
+        for market in kept:
+            if market["type"] == "spot":
+                base_asset, multiplier = market["base"], 1
+            else:
+                base_asset, multiplier = split_multiplier(market["base"], spot_bases)
+            active = market.get("active") is not False
+            instruments.append(Instrument(
+                id=len(instruments),
+                symbol=market["symbol"],
+                pair=f"{market['base']}/{market['quote']}",
+                market_id=market["id"],
+                type=market["type"],
+                base=market["base"],
+                quote=market["quote"],
+                base_asset=base_asset,
+                multiplier=multiplier,
+                tick_size=(market.get("precision") or {}).get("price") or np.nan,
+                active=active,
+                listed=active and base_asset not in DELISTED_COINS,
+            ))
+        return cls(instruments)
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def __contains__(self, symbol):
+        return symbol in self._ids
+
+    def id_of(self, symbol):
+        """Integer id of a symbol; raises KeyError for unknown symbols."""
+        return self._ids[symbol]
+
+    def ids_of(self, symbols):
+        """Integer ids for many symbols, -1 where unknown."""
+        return np.array([self._ids.get(symbol, -1) for symbol in symbols], dtype="i8")
+
+    def get(self, symbol):
+        """Instrument for a symbol, or None."""
+        instrument_id = self._ids.get(symbol)
+        return None if instrument_id is None else self.instruments[instrument_id]
+
+    def spot_symbol(self, symbol):
+        """Spot symbol trading the same asset as `symbol` (itself for spot), or None."""
+        instrument = self.get(symbol)
+        if instrument is None:
+            return None
+        spot_id = self._spot.get((instrument.base_asset, instrument.quote))
+        return None if spot_id is None else self.instruments[spot_id].symbol
+
+    def futures_symbol(self, symbol):
+        """Linear perpetual symbol trading the same asset as `symbol`, or None."""
+        instrument = self.get(symbol)
+        if instrument is None:
+            return None
+        futures_id = self._futures.get((instrument.base_asset, instrument.quote))
+        return None if futures_id is None else self.instruments[futures_id].symbol
+
+    def symbols(self, market_type, quote=None, listed_only=False):
+        """Symbols of one market type, optionally for one quote currency and listed only."""
+        return [
+            instrument.symbol for instrument in self.instruments
+            if instrument.type == market_type
+            and (quote is None or instrument.quote == quote)
+            and (instrument.listed or not listed_only)
+        ]
+
+    def futures_pairs(self, quote=None, listed_only=True):
+        """Sorted "BASE/QUOTE" pairs of linear perpetuals, as the futures screeners name them."""
+        return sorted(
+            self.instruments[futures_id].pair for (_, futures_quote), futures_id in self._futures.items()
+            if (quote is None or futures_quote == quote)
+            and (self.instruments[futures_id].listed or not listed_only)
+        )
+
+    def matching_futures_symbols(self, quote="USDT"):
+        """Perpetuals of `quote` whose asset also trades on spot, excluding DELISTED_COINS."""
+        return [
+            instrument.symbol for instrument in self.instruments
+            if instrument.type == "swap" and instrument.quote == quote
+            and (instrument.base_asset, quote) in self._spot
+            and instrument.base_asset not in DELISTED_COINS
+        ]
+
+
+# Registries built in this process, by snapshot path: (markets object, registry)
+_registries = {}
+
+
+def load_registry(exchange=None, snapshot_dir=SNAPSHOT_DIR, ttl=SNAPSHOT_TTL):
+    """
+    Registry for the shared markets snapshot, built once per process.
+
+    With an exchange, a missing or stale snapshot is refreshed through
+    preload_markets; without one, a stale snapshot is still used.
+    """
+    exchange_id = exchange.id if exchange is not None else "binance"
+    path = snapshot_path(exchange_id, snapshot_dir)
+    snapshot = read_markets_snapshot(path, ttl if exchange is not None else None)
+    if snapshot is not None:
+        markets = snapshot["markets"]
+    elif exchange is not None:
+        markets = preload_markets(exchange, ttl, snapshot_dir)
+    else:
+        raise FileNotFoundError(f"No markets snapshot at {path}; run fetch_markets first")
+
+    cached = _registries.get(path)
+    if cached is not None and cached[0] is markets:
+        return cached[1]
+    registry = SymbolRegistry.from_markets(markets)
+    _registries[path] = (markets, registry)
+    return registry
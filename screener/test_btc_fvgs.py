@@ -24,35 +24,36 @@ def analyze_btc_fvgs():
 
     # Fetch 1H data (3 months)
     since_1h = int((datetime.now(timezone.utc) - timedelta(days=90)).timestamp() * 1000)
-    df_1h = get_ohlcv_data(exchange, symbol, "1h", since_1h)
-    if df_1h is None:
+    candles_1h = get_ohlcv_data(exchange, symbol, "1h", since_1h)
+    if candles_1h is None:
         print("Failed to fetch 1H data")
         return
 
+    highs, lows, closes = candles_1h["high"], candles_1h["low"], candles_1h["close"]
+    timestamps = pd.to_datetime(candles_1h["timestamp"], unit="ms", utc=True)
+
     # Find 1H FVGs
     fvg_1h_list = []
-    for i in range(1, len(df_1h) - 1):
+    for i in range(1, len(candles_1h) - 1):
         # Bullish FVG: Gap between i-1 high and i+1 low, and i+1 close below i high
-        if (df_1h.iloc[i-1]["High"] < df_1h.iloc[i+1]["Low"] and 
-            df_1h.iloc[i+1]["Close"] < df_1h.iloc[i]["High"]):
+        if highs[i-1] < lows[i+1] and closes[i+1] < highs[i]:
             fvg_1h_list.append({
                 "type": "bullish",
-                "high": df_1h.iloc[i-1]["High"],
-                "low": df_1h.iloc[i+1]["Low"],
-                "timestamp": df_1h.index[i].isoformat(),
-                "gap_size": df_1h.iloc[i+1]["Low"] - df_1h.iloc[i-1]["High"],
-                "current_price_in_fvg": "Yes" if df_1h.iloc[i+1]["Low"] <= current_price <= df_1h.iloc[i-1]["High"] else "No"
+                "high": highs[i-1],
+                "low": lows[i+1],
+                "timestamp": timestamps[i].isoformat(),
+                "gap_size": lows[i+1] - highs[i-1],
+                "current_price_in_fvg": "Yes" if lows[i+1] <= current_price <= highs[i-1] else "No"
             })
         # Bearish FVG: Gap between i+1 high and i-1 low, and i+1 close above i low
-        if (df_1h.iloc[i+1]["High"] > df_1h.iloc[i-1]["Low"] and 
-            df_1h.iloc[i+1]["Close"] > df_1h.iloc[i]["Low"]):
+        if highs[i+1] > lows[i-1] and closes[i+1] > lows[i]:
             fvg_1h_list.append({
                 "type": "bearish",
-                "high": df_1h.iloc[i+1]["High"],
-                "low": df_1h.iloc[i-1]["Low"],
-                "timestamp": df_1h.index[i].isoformat(),
-                "gap_size": df_1h.iloc[i+1]["High"] - df_1h.iloc[i-1]["Low"],
-                "current_price_in_fvg": "Yes" if df_1h.iloc[i-1]["Low"] <= current_price <= df_1h.iloc[i+1]["High"] else "No"
+                "high": highs[i+1],
+                "low": lows[i-1],
+                "timestamp": timestamps[i].isoformat(),
+                "gap_size": highs[i+1] - lows[i-1],
+                "current_price_in_fvg": "Yes" if lows[i-1] <= current_price <= highs[i+1] else "No"
             })
 
     # Create results dictionary
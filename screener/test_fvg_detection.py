@@ -1,18 +1,17 @@
 import ccxt
-import pandas as pd
 from datetime import datetime, timezone, timedelta
 from utils import get_ohlcv_data, calculate_value_area
+from candle_store import load_candles, bucket_ends, download_range
+from detection import detect_gaps
+from zones import zones_from_gaps, zones_to_dicts
+from rate_limit import install_rate_limiter
+from thresholds import ALIGNMENT_MIN_1H_GAP_PERCENT as MIN_1H_GAP_PERCENT
+from thresholds import ALIGNMENT_MIN_5M_GAP_PERCENT as MIN_5M_GAP_PERCENT
 import json
 import os
-import numpy as np
-import time
 # Since both MarketProfile and market-profile aren't working correctly,
 # let's implement our own volume profile calculation
 
-# Minimum gap percentage thresholds
-MIN_1H_GAP_PERCENT = 0.042
-MIN_5M_GAP_PERCENT = 0.01
-
 def get_monthly_value_area(exchange, symbol, timestamp=None):
     """
     Get monthly Value Area for a symbol based on the month of the timestamp
@@ -38,13 +37,15 @@ def get_monthly_value_area(exchange, symbol, timestamp=None):
         since = int(first_day_of_month.timestamp() * 1000)
         
         # Get hourly data for the entire month for more precise Value Area calculation
-        hourly_data = exchange.fetch_ohlcv(symbol, '1h', since=since, limit=744)  # Max 31 days (744 hours) in a month
+        # (read from the candle store, fetching only what it is missing)
+        month_end = int(bucket_ends([since], '1M')[0])
+        hourly_data = load_candles(exchange, symbol, '1h', since, until=month_end)
         
-        if not hourly_data or len(hourly_data) < 24:  # Need at least some data
+        if len(hourly_data) < 24:  # Need at least some data
             # Fall back to daily data if hourly is not available
-            daily_data = exchange.fetch_ohlcv(symbol, '1d', since=since, limit=31)
+            daily_data = load_candles(exchange, symbol, '1d', since, until=month_end)
             
-            if not daily_data or len(daily_data) < 3:
+            if len(daily_data) < 3:
                 return None, None
                 
             # Use daily data for the calculations below
@@ -53,24 +54,16 @@ def get_monthly_value_area(exchange, symbol, timestamp=None):
             # Use hourly data for better accuracy
             data = hourly_data
             
-        # Convert data to DataFrame
-        df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        
-        # Rename columns to match the calculate_value_area function expectation
-        df = df.rename(columns={'close': 'Close', 'volume': 'Volume'})
-        
-        # Calculate Value Area using the utils function
-        va_high, va_low = calculate_value_area(df, percentage=0.7, bins=100)
+        # Calculate Value Area using the utils function, straight from the candle arrays
+        va_high, va_low = calculate_value_area(data, percentage=0.7, bins=100)
         
         return va_high, va_low
         
     except Exception as e:
         # Simplified fallback with minimal logging
         try:
-            monthly_data = exchange.fetch_ohlcv(symbol, '1M', since=since, limit=1)
-            if not monthly_data:
+            monthly_data = load_candles(exchange, symbol, '1M', since, until=month_end)
+            if len(monthly_data) == 0:
                 return None, None
                 
             timestamp, open_price, high, low, close, volume = monthly_data[0]
@@ -92,73 +85,26 @@ def fetch_all_candles(exchange, symbol, timeframe, since, until=None):
     """
     Fetch all candles for a given timeframe using pagination to overcome API limits
     """
-    all_candles = []
-    limit = 500  # Binance API limit per request
-    current_since = since
-    done = False
+    # Pace requests by weight with the other workers instead of a fixed delay
+    install_rate_limiter(exchange)
     
-    while not done:
-        try:
-            # Fetch a batch of candles
-            candles = exchange.fetch_ohlcv(symbol, timeframe, since=current_since, limit=limit)
-            
-            if not candles or len(candles) == 0:
-                break
-                
-            # Add fetched candles to our list
-            all_candles.extend(candles)
-            
-            # Update the since parameter for the next request
-            # Use the timestamp of the last candle plus the timeframe duration
-            last_timestamp = candles[-1][0]
-            
-            if timeframe == '1h':
-                current_since = last_timestamp + (60 * 60 * 1000)  # Add 1 hour in milliseconds
-            elif timeframe == '5m':
-                current_since = last_timestamp + (5 * 60 * 1000)   # Add 5 minutes in milliseconds
-            
-            # If we have an until timestamp and we've passed it, we're done
-            if until and last_timestamp >= until:
-                done = True
-                
-            # If we got fewer candles than the limit, we're at the end
-            if len(candles) < limit:
-                done = True
-                
-            # Add a small delay to avoid rate limiting
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"Error fetching candles: {str(e)}")
-            break
+    try:
+        # Page-aligned segments fetched concurrently, for any timeframe, and kept in the candle store
+        candles, report = download_range(exchange, symbol, timeframe, since, until)
+        if report["gaps"]:
+            print(f"{symbol} {timeframe}: {len(report['gaps'])} gaps in exchange data")
+    except Exception as e:
+        print(f"Error fetching candles: {str(e)}")
+        return None
     
-    # Convert to DataFrame
-    if not all_candles:
+    if len(candles) == 0:
         return None
-        
-    df = pd.DataFrame(all_candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-    df.set_index('timestamp', inplace=True)
-    
-    # Rename columns to match the expected format
-    df = df.rename(columns={
-        'open': 'Open',
-        'high': 'High',
-        'low': 'Low',
-        'close': 'Close',
-        'volume': 'Volume'
-    })
     
     # Filter to date range if until is specified
     if until:
-        # Convert until to a timestamp with same timezone as the index
-        until_ts = pd.Timestamp(until, unit='ms')
-        # Ensure timezone consistency
-        if df.index.tz is not None:
-            until_ts = until_ts.tz_localize(df.index.tz)
-        df = df[df.index < until_ts]
-    
-    return df
+        candles = candles[candles['timestamp'] < until]
+    
+    return candles
 
 def test_1h_fvg_detection():
     """Test 1H FVG detection logic"""
@@ -184,56 +130,19 @@ def test_1h_fvg_detection():
     print(f"Fetching 1H candles for {symbol} from {start_date.strftime('%Y-%m-%d')}...")
     
     # Use the new function to fetch all candles with pagination
-    df_1h = fetch_all_candles(exchange, symbol, "1h", since)
+    candles_1h = fetch_all_candles(exchange, symbol, "1h", since)
     
-    if df_1h is None or len(df_1h) < 3:
+    if candles_1h is None or len(candles_1h) < 3:
         print("Failed to get 1H data")
         return []
     
-    print(f"Loaded {len(df_1h)} 1H candles for {symbol} from {start_date.strftime('%Y-%m-%d')}")
+    print(f"Loaded {len(candles_1h)} 1H candles for {symbol} from {start_date.strftime('%Y-%m-%d')}")
     
-    # Find 1H FVGs
-    fvg_1h_list = []
-    bullish_count, bearish_count = 0, 0
-    
-    for i in range(2, len(df_1h)):
-        current_candle = df_1h.iloc[i]
-        prev_candle = df_1h.iloc[i-1]
-        prev2_candle = df_1h.iloc[i-2]
-                
-        is_prev_bearish = prev_candle["Open"] > prev_candle["Close"]
-        
-        # Bullish FVG
-        if not is_prev_bearish and current_candle["Low"] > prev2_candle["High"]:
-            gap_size = current_candle["Low"] - prev2_candle["High"]
-            gap_percent = (gap_size / prev_candle["Close"]) * 100
-            
-            # Only include FVGs with gap >= MIN_1H_GAP_PERCENT
-            if gap_percent >= MIN_1H_GAP_PERCENT:
-                fvg_1h_list.append({
-                    "type": "bullish",
-                    "upper_line": current_candle["Low"],
-                    "lower_line": prev2_candle["High"],
-                    "timestamp": df_1h.index[i-1],
-                    "gap_percent": gap_percent
-                })
-                bullish_count += 1
-        
-        # Bearish FVG
-        if is_prev_bearish and current_candle["High"] < prev2_candle["Low"]:
-            gap_size = prev2_candle["Low"] - current_candle["High"]
-            gap_percent = (gap_size / prev_candle["Close"]) * 100
-            
-            # Only include FVGs with gap >= MIN_1H_GAP_PERCENT
-            if gap_percent >= MIN_1H_GAP_PERCENT:
-                fvg_1h_list.append({
-                    "type": "bearish",
-                    "upper_line": prev2_candle["Low"],
-                    "lower_line": current_candle["High"],
-                    "timestamp": df_1h.index[i-1],
-                    "gap_percent": gap_percent
-                })
-                bearish_count += 1
+    # Find 1H FVGs on the whole candle array at once
+    zones = zones_from_gaps(detect_gaps(candles_1h, MIN_1H_GAP_PERCENT))
+    fvg_1h_list = zones_to_dicts(zones)
+    bullish_count = int(zones["bullish"].sum())
+    bearish_count = len(zones) - bullish_count
     
     print(f"\nTotal 1H FVGs found: {len(fvg_1h_list)} (Bullish: {bullish_count}, Bearish: {bearish_count})")
     return fvg_1h_list
@@ -264,56 +173,19 @@ def test_5m_fvg_detection():
     
     # Use the new function to fetch all candles with pagination
     print(f"Fetching 5M candles for {symbol}...")
-    df_5m = fetch_all_candles(exchange, symbol, "5m", since, until)
+    candles_5m = fetch_all_candles(exchange, symbol, "5m", since, until)
     
-    if df_5m is None or len(df_5m) < 3:
+    if candles_5m is None or len(candles_5m) < 3:
         print("Failed to get 5M data")
         return []
     
-    print(f"Loaded {len(df_5m)} 5M candles for analysis")
-    
-    # Find 5M FVGs
-    fvg_5m_list = []
-    bullish_count, bearish_count = 0, 0
+    print(f"Loaded {len(candles_5m)} 5M candles for analysis")
     
-    for i in range(2, len(df_5m)):
-        current_candle = df_5m.iloc[i]
-        prev_candle = df_5m.iloc[i-1]
-        prev2_candle = df_5m.iloc[i-2]
-        
-        is_prev_bearish = prev_candle["Open"] > prev_candle["Close"]
-        
-        # Bullish FVG
-        if not is_prev_bearish and current_candle["Low"] > prev2_candle["High"]:
-            gap_size = current_candle["Low"] - prev2_candle["High"]
-            gap_percent = (gap_size / prev_candle["Close"]) * 100
-            
-            # Only include FVGs with gap >= MIN_5M_GAP_PERCENT
-            if gap_percent >= MIN_5M_GAP_PERCENT:
-                fvg_5m_list.append({
-                    "type": "bullish",
-                    "upper_line": current_candle["Low"],
-                    "lower_line": prev2_candle["High"],
-                    "timestamp": df_5m.index[i-1],
-                    "gap_percent": gap_percent
-                })
-                bullish_count += 1
-        
-        # Bearish FVG
-        if is_prev_bearish and current_candle["High"] < prev2_candle["Low"]:
-            gap_size = prev2_candle["Low"] - current_candle["High"]
-            gap_percent = (gap_size / prev_candle["Close"]) * 100
-            
-            # Only include FVGs with gap >= MIN_5M_GAP_PERCENT
-            if gap_percent >= MIN_5M_GAP_PERCENT:
-                fvg_5m_list.append({
-                    "type": "bearish",
-                    "upper_line": prev2_candle["Low"],
-                    "lower_line": current_candle["High"],
-                    "timestamp": df_5m.index[i-1],
-                    "gap_percent": gap_percent
-                })
-                bearish_count += 1
+    # Find 5M FVGs on the whole candle array at once
+    zones = zones_from_gaps(detect_gaps(candles_5m, MIN_5M_GAP_PERCENT))
+    fvg_5m_list = zones_to_dicts(zones)
+    bullish_count = int(zones["bullish"].sum())
+    bearish_count = len(zones) - bullish_count
     
     print(f"\nTotal 5M FVGs found: {len(fvg_5m_list)} (Bullish: {bullish_count}, Bearish: {bearish_count})")
     return fvg_5m_list
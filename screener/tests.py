@@ -1,3 +1,1741 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.db.models import Count
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from screener import cache_manifest, views
+from screener.candle_store import (build_candles, missing_ranges, read_candles, record_head, resample_candles,
+                                   resample_source, stored_head, timeframe_to_ms, to_candles, to_frame, write_candles as store_candles)
+from screener.kline_archives import find_archives, import_archives
+from screener.markets_snapshot import diff_symbols, preload_markets, read_markets_snapshot, snapshot_path
+from screener.memory_cache import LRUCache, SingleFlight, cached
+from screener.metrics import MetricsSink, flush, render
+from screener.zones import ALIGNMENT_TYPES, new_setups, setups_to_dicts
+from screener.concurrency import INITIAL_WINDOW, LEASE_SECONDS, AdaptiveConcurrency
+from screener.rate_limit import SharedTokenBucket, install_rate_limiter, request_weight
+from screener.models import ValueAreaHourlyRollup, ValueAreaResult
+
+# The screener scripts import their siblings by module name
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import analyze_results  # noqa: E402
+import confluence  # noqa: E402
+import backtest  # noqa: E402
+import replay  # noqa: E402
+import run_2025_crypto_screener  # noqa: E402
+import strategies  # noqa: E402
+import sweep  # noqa: E402
+import utils  # noqa: E402
+from candle_store import write_candles  # noqa: E402
+from detection import detect_gaps  # noqa: E402
+from results_store import (ResultsWriter, iter_setups, load_metadata, load_setups_frame,  # noqa: E402
+                           meta_path_for)
+from shared_candles import SharedCandles, attach_shared_candles, read_shared_candles  # noqa: E402
+from symbol_registry import SymbolRegistry, split_multiplier  # noqa: E402
+from value_area import (month_starts, monthly_profile_value_areas, monthly_volume_days_value_areas,  # noqa: E402
+                        value_area_as_of)
+
+HOUR_MS = 3600 * 1000
+JAN_1_2024 = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+ARCHIVE_HEADER = "open_time,open,high,low,close,volume,close_time,quote_volume,count,taker_buy_volume,taker_buy_quote_volume,ignore"
+
+
+def kline_rows(hours, price_offset=0.0, microseconds=False):
+    """CSV rows of 1h klines opening at the given hours after 2024-01-01, priced from the hour."""
+    rows = []
+    for hour in hours:
+        open_time = JAN_1_2024 + hour * HOUR_MS
+        price = 100.0 + hour + price_offset
+        scale = 1000 if microseconds else 1
+        rows.append(f"{open_time * scale},{price},{price + 2},{price - 1},{price + 1},{10 + hour},"
+                    f"{(open_time + HOUR_MS - 1) * scale},0,0,0,0,0")
+    return rows
+
+
+class KlineArchiveImportTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.directory, "candles")
+        # Store writes take lock files under the working directory
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def write_archive(self, relative_path, rows, header=True):
+        path = os.path.join(self.directory, "mirror", relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        text = "\n".join(([ARCHIVE_HEADER] if header else []) + rows) + "\n"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(os.path.basename(path)[:-len(".zip")] + ".csv", text)
+        return path
+
+    def test_imports_spot_and_futures_archives_into_their_own_series(self):
+        # Monthly spot file with a header and a hole at hours 10-12, a daily file without a
+        # header and with microsecond open times overlapping it, and a USDT-M futures file
+        gap_hours = range(10, 13)
+        monthly = [hour for hour in range(36) if hour not in gap_hours]
+        self.write_archive("spot/monthly/klines/BTCUSDT/1h/BTCUSDT-1h-2024-01.zip", kline_rows(monthly))
+        self.write_archive("spot/daily/klines/BTCUSDT/1h/BTCUSDT-1h-2024-01-02.zip",
+                           kline_rows(range(24, 48), microseconds=True), header=False)
+        self.write_archive("futures/um/monthly/klines/BTCUSDT/1h/BTCUSDT-1h-2024-01.zip",
+                           kline_rows(range(6), price_offset=1000.0))
+        self.write_archive("futures/cm/monthly/klines/BTCUSD_PERP/1h/BTCUSD_PERP-1h-2024-01.zip",
+                           kline_rows(range(6)))
+
+        groups = find_archives(os.path.join(self.directory, "mirror"))
+        self.assertEqual(sorted(groups), [("BTC/USDT", "1h"), ("BTC/USDT:USDT", "1h")])
+        self.assertEqual(len(groups[("BTC/USDT", "1h")]), 2)
+
+        spot = import_archives("BTC/USDT", "1h", groups[("BTC/USDT", "1h")], self.store_dir)
+        expected_hours = [hour for hour in range(48) if hour not in gap_hours]
+        self.assertEqual(spot["candles"], len(expected_hours))
+        # Hours 24-35 are in both files
+        self.assertEqual(spot["duplicates"], 12)
+        self.assertEqual(spot["misaligned"], 0)
+        self.assertEqual(spot["gaps"], [(JAN_1_2024 + 10 * HOUR_MS, JAN_1_2024 + 13 * HOUR_MS)])
+        self.assertEqual(spot["errors"], [])
+
+        candles = read_candles("BTC/USDT", "1h", store_dir=self.store_dir)
+        self.assertEqual(candles["timestamp"].tolist(), [JAN_1_2024 + hour * HOUR_MS for hour in expected_hours])
+        self.assertEqual(candles["open"].tolist(), [100.0 + hour for hour in expected_hours])
+        self.assertEqual(candles["close"].tolist(), [101.0 + hour for hour in expected_hours])
+        self.assertEqual(candles["volume"].tolist(), [10.0 + hour for hour in expected_hours])
+
+        futures = import_archives("BTC/USDT:USDT", "1h", groups[("BTC/USDT:USDT", "1h")], self.store_dir)
+        self.assertEqual(futures["candles"], 6)
+        candles = read_candles("BTC/USDT:USDT", "1h", store_dir=self.store_dir)
+        self.assertEqual(candles["close"].tolist(), [1101.0 + hour for hour in range(6)])
+        self.assertTrue(os.path.exists(os.path.join(self.store_dir, "BTC_USDT_USDT_1h.npy")))
+
+        # The spot series is untouched by the futures import
+        self.assertEqual(read_candles("BTC/USDT", "1h", store_dir=self.store_dir)["close"][0], 101.0)
+
+    def test_market_of_archives_outside_a_mirror_layout(self):
+        self.write_archive("downloads/ETHUSDT-1h-2024-01.zip", kline_rows(range(3)))
+        directory = os.path.join(self.directory, "mirror")
+        self.assertEqual(list(find_archives(directory)), [("ETH/USDT", "1h")])
+        self.assertEqual(list(find_archives(directory, default_market="futures")), [("ETH/USDT:USDT", "1h")])
+        self.assertEqual(find_archives(directory, symbols=["BTC/USDT"]), {})
+
+
+FIVE_MINUTES_MS = 5 * 60 * 1000
+FEB_20_2025 = int(datetime(2025, 2, 20, tzinfo=timezone.utc).timestamp() * 1000)
+FEB_27_2025 = int(datetime(2025, 2, 27, tzinfo=timezone.utc).timestamp() * 1000)
+
+# Prices on a coarse tick, so gap edges and zone lines often hit equal prices
+PRICE_TICK = 0.5
+
+
+def grid_candles(seed, start, step_ms, length):
+    """Candle records of a mean-reverting walk around 100 on PRICE_TICK, with frequent gaps."""
+    rng = np.random.default_rng(seed)
+    rows, close = [], 100.0
+    for position in range(length):
+        open_price = close + PRICE_TICK * rng.choice([-3, -2, -1, 0, 0, 0, 1, 2, 3])
+        close = open_price + PRICE_TICK * (rng.integers(-3, 4) - np.sign(open_price - 100) * rng.integers(0, 2))
+        high = max(open_price, close) + PRICE_TICK * rng.integers(0, 2)
+        low = min(open_price, close) - PRICE_TICK * rng.integers(0, 2)
+        rows.append([start + position * step_ms, open_price, high, low, close, float(rng.integers(1, 100))])
+    return to_candles(rows)
+
+
+def loop_three_candle_setups(symbol, current_price, df_1h, df_5m, min_gap_percent):
+    """utils.process_symbol_staged 1H detection and 5M alignment as iloc loops, before vectorizing."""
+    fvg_1h_list = []
+    for i in range(1, len(df_1h) - 1):
+        if df_1h.iloc[i-1]["High"] < df_1h.iloc[i+1]["Low"]:
+            gap_size = df_1h.iloc[i+1]["Low"] - df_1h.iloc[i-1]["High"]
+            gap_percent = (gap_size / df_1h.iloc[i-1]["Close"]) * 100
+            if gap_percent >= min_gap_percent:
+                fvg_1h_list.append({"type": "bullish", "high": df_1h.iloc[i]["High"], "low": df_1h.iloc[i+1]["Low"],
+                                    "timestamp": df_1h.index[i], "gap_percent": gap_percent})
+        if df_1h.iloc[i+1]["High"] > df_1h.iloc[i-1]["Low"]:
+            gap_size = df_1h.iloc[i+1]["High"] - df_1h.iloc[i-1]["Low"]
+            gap_percent = (gap_size / df_1h.iloc[i-1]["Close"]) * 100
+            if gap_percent >= min_gap_percent:
+                fvg_1h_list.append({"type": "bearish", "high": df_1h.iloc[i+1]["High"], "low": df_1h.iloc[i]["Low"],
+                                    "timestamp": df_1h.index[i], "gap_percent": gap_percent})
+
+    setups = []
+    for fvg_1h in fvg_1h_list:
+        for i in range(2, len(df_5m) - 1):
+            if fvg_1h["type"] == "bullish":
+                gap = df_5m.iloc[i+1]["Low"] - df_5m.iloc[i-1]["High"]
+                gap_percent = (gap / df_5m.iloc[i-1]["Close"]) * 100
+                if (df_5m.iloc[i-1]["High"] < df_5m.iloc[i+1]["Low"] and gap_percent >= min_gap_percent
+                        and df_5m.iloc[i-2]["High"] < fvg_1h["high"] and df_5m.iloc[i-1]["High"] >= fvg_1h["high"]
+                        and df_5m.iloc[i-1]["High"] <= fvg_1h["high"] <= df_5m.iloc[i+1]["Low"]):
+                    setups.append({
+                        "symbol": symbol, "type": "bullish", "current_price": current_price, "fvg_1h": fvg_1h,
+                        "fvg_5m": {"high": df_5m.iloc[i-1]["High"], "low": df_5m.iloc[i+1]["Low"], "gap_size": gap,
+                                   "gap_percent": gap_percent, "timestamp": df_5m.index[i]},
+                        "stop_loss": df_5m.iloc[i]["High"], "risk_reward": 2,
+                    })
+            else:
+                gap = df_5m.iloc[i+1]["High"] - df_5m.iloc[i-1]["Low"]
+                gap_percent = (gap / df_5m.iloc[i-1]["Close"]) * 100
+                if (df_5m.iloc[i+1]["High"] > df_5m.iloc[i-1]["Low"] and gap_percent >= min_gap_percent
+                        and df_5m.iloc[i-2]["Low"] > fvg_1h["low"] and df_5m.iloc[i-1]["Low"] <= fvg_1h["low"]
+                        and df_5m.iloc[i-1]["Low"] <= fvg_1h["low"] <= df_5m.iloc[i+1]["High"]):
+                    setups.append({
+                        "symbol": symbol, "type": "bearish", "current_price": current_price, "fvg_1h": fvg_1h,
+                        "fvg_5m": {"high": df_5m.iloc[i+1]["High"], "low": df_5m.iloc[i-1]["Low"], "gap_size": gap,
+                                   "gap_percent": gap_percent, "timestamp": df_5m.index[i]},
+                        "stop_loss": df_5m.iloc[i]["Low"], "risk_reward": 2,
+                    })
+    return setups
+
+
+def loop_pinescript_gaps(df, min_gap_percent, stop):
+    """PineScript gaps with the current candle i in [2, stop), as custom_process_symbol's iloc loops found them."""
+    gaps = []
+    for i in range(2, stop):
+        current, prev, prev2 = df.iloc[i], df.iloc[i-1], df.iloc[i-2]
+        is_prev_bearish = prev["Open"] > prev["Close"]
+        if not is_prev_bearish and current["Low"] > prev2["High"]:
+            upper, lower = current["Low"], prev2["High"]
+        elif is_prev_bearish and current["High"] < prev2["Low"]:
+            upper, lower = prev2["Low"], current["High"]
+        else:
+            continue
+        gap_percent = ((upper - lower) / prev["Close"]) * 100
+        if gap_percent >= min_gap_percent:
+            gaps.append({"type": "bearish" if is_prev_bearish else "bullish", "upper_line": upper, "lower_line": lower,
+                         "middle_candle_high": prev["High"], "middle_candle_low": prev["Low"],
+                         "gap_size": upper - lower, "timestamp": df.index[i-1], "gap_percent": gap_percent})
+    return gaps
+
+
+def pinescript_setup(symbol, current_price, fvg_1h, fvg_5m, alignment_type, va_high, va_low):
+    """Setup dict of custom_process_symbol and the PineScript strategies."""
+    bullish = fvg_5m["type"] == "bullish"
+    return {
+        "symbol": symbol, "type": fvg_5m["type"], "current_price": current_price,
+        "fvg_1h": {key: fvg_1h[key] for key in ("type", "upper_line", "lower_line", "timestamp", "gap_percent")},
+        "fvg_5m": {key: value for key, value in fvg_5m.items() if key != "type"},
+        "stop_loss": fvg_5m["middle_candle_low"] if bullish else fvg_5m["middle_candle_high"],
+        "risk_reward": 2, "alignment_type": alignment_type, "va_high": va_high, "va_low": va_low,
+    }
+
+
+def loop_line_in_range_setups(symbol, current_price, gaps_1h, gaps_5m, value_area):
+    """custom_process_symbol alignment as loops: the 1H lower (bullish) or upper (bearish) line inside the 5M gap."""
+    setups = []
+    for fvg_1h in gaps_1h:
+        for fvg_5m in gaps_5m:
+            va_high, va_low = value_area(fvg_5m["timestamp"])
+            if va_high is None or va_low is None:
+                continue
+            if fvg_5m["type"] == "bullish" and fvg_5m["upper_line"] < va_low and \
+                    fvg_5m["lower_line"] <= fvg_1h["lower_line"] <= fvg_5m["upper_line"]:
+                setups.append(pinescript_setup(symbol, current_price, fvg_1h, fvg_5m, "lower", va_high, va_low))
+            if fvg_5m["type"] == "bearish" and fvg_5m["lower_line"] > va_high and \
+                    fvg_5m["lower_line"] <= fvg_1h["upper_line"] <= fvg_5m["upper_line"]:
+                setups.append(pinescript_setup(symbol, current_price, fvg_1h, fvg_5m, "upper", va_high, va_low))
+    return setups
+
+
+def loop_either_line_setups(symbol, current_price, gaps_1h, gaps_5m, value_area):
+    """align_either_line as loops: either 1H line inside a 5M gap beyond the value area, once per pair."""
+    setups = []
+    for fvg_5m in gaps_5m:
+        va_high, va_low = value_area(fvg_5m["timestamp"])
+        if va_high is None or va_low is None:
+            continue
+        beyond = fvg_5m["upper_line"] < va_low if fvg_5m["type"] == "bullish" else fvg_5m["lower_line"] > va_high
+        if not beyond:
+            continue
+        for fvg_1h in gaps_1h:
+            if any(fvg_5m["lower_line"] <= fvg_1h[line] <= fvg_5m["upper_line"] for line in ("lower_line", "upper_line")):
+                alignment_type = f"{fvg_1h['type']}_1h_with_5m"
+                setups.append(pinescript_setup(symbol, current_price, fvg_1h, fvg_5m, alignment_type, va_high, va_low))
+    return setups
+
+
+def canonical(setups):
+    """Setups in a fixed order, for rules whose output order was never defined."""
+    return sorted(setups, key=lambda setup: (setup["fvg_1h"]["timestamp"], setup["fvg_5m"]["timestamp"], setup["type"]))
+
+
+class VectorizedAlignmentTests(SimpleTestCase):
+    """The vectorized range joins find the same setups as the iloc loops they replaced."""
+
+    SEEDS = (3, 8, 10)
+    # Four days of 1H candles and 20 hours of 5M candles running into March, enough for
+    # both directions and the equal-price edges while the loops stay quick
+    START_1H, LENGTH_1H = FEB_20_2025 + 5 * 24 * HOUR_MS, 96
+    START_5M, LENGTH_5M = FEB_27_2025 + 36 * HOUR_MS, 240
+    SYMBOL = "TEST/USDT:USDT"
+    CURRENT_PRICE = 100.0
+
+    def candles(self, seed):
+        return (grid_candles(seed, self.START_1H, HOUR_MS, self.LENGTH_1H),
+                grid_candles(seed + 100, self.START_5M, FIVE_MINUTES_MS, self.LENGTH_5M))
+
+    def assertCovered(self, setups):
+        types = {setup["type"] for setup in setups}
+        self.assertEqual(types, {"bullish", "bearish"})
+
+    def crossing_edge_hit(self, candles_5m, setups):
+        """Whether some 5M gap has candle i-2 already at a bullish zone high, which the crossing rule skips."""
+        zone_highs = {setup["fvg_1h"]["high"] for setup in setups if setup["type"] == "bullish"}
+        highs, lows = candles_5m["high"], candles_5m["low"]
+        return any(highs[i-2] == highs[i-1] and highs[i-1] in zone_highs and highs[i-1] < lows[i+1]
+                   for i in range(2, len(highs) - 1))
+
+    def assertInclusiveEdgeHit(self, setups):
+        """Some setup has its 1H line exactly on a bound of the 5M gap."""
+        self.assertTrue(any(setup["fvg_1h"][line] in (setup["fvg_5m"]["lower_line"], setup["fvg_5m"]["upper_line"])
+                            for setup in setups for line in ("lower_line", "upper_line")))
+
+    def test_process_symbol_staged_matches_loops(self):
+        found, edge_hits = [], 0
+        for seed in self.SEEDS:
+            candles_1h, candles_5m = self.candles(seed)
+            series = {"1h": candles_1h, "5m": candles_5m}
+            recent_period = datetime.fromtimestamp(self.START_5M / 1000, tz=timezone.utc)
+            with mock.patch.object(utils, "preload_markets"), \
+                    mock.patch.object(utils, "get_ohlcv_data", side_effect=lambda exchange, symbol, timeframe, since: series[timeframe]):
+                setups, stage = utils.process_symbol_staged((self.SYMBOL, None, "futures", recent_period, self.CURRENT_PRICE))
+            self.assertIsNone(stage)
+            expected = loop_three_candle_setups(self.SYMBOL, self.CURRENT_PRICE, to_frame(candles_1h), to_frame(candles_5m),
+                                                utils.MIN_GAP_PERCENT)
+            self.assertEqual(setups, expected)
+            found.extend(setups)
+            edge_hits += self.crossing_edge_hit(candles_5m, setups)
+        self.assertCovered(found)
+        self.assertTrue(edge_hits)
+
+    def test_custom_process_symbol_matches_loops(self):
+        found = []
+        for seed in self.SEEDS:
+            candles_1h, candles_5m = self.candles(seed)
+            series = {"1h": candles_1h, "5m": candles_5m}
+            closes = candles_5m["close"]
+            # A value area for February only, so March gaps exercise the missing value area
+            february = (float(np.percentile(closes, 60)), float(np.percentile(closes, 40)))
+
+            def value_area(timestamp):
+                return february if pd.Timestamp(timestamp).month == 2 else (None, None)
+
+            data = (self.SYMBOL, None, "futures", datetime(2025, 1, 1, tzinfo=timezone.utc),
+                    datetime.fromtimestamp(self.START_5M / 1000, tz=timezone.utc),
+                    datetime.fromtimestamp((self.START_5M + self.LENGTH_5M * FIVE_MINUTES_MS) / 1000, tz=timezone.utc))
+            module = run_2025_crypto_screener
+            with mock.patch.object(module, "preload_markets"), \
+                    mock.patch.object(module, "get_ticker", return_value={"last": self.CURRENT_PRICE}), \
+                    mock.patch.object(module, "get_ohlcv_data", side_effect=lambda exchange, symbol, timeframe, since: series[timeframe]), \
+                    mock.patch.object(module, "get_monthly_value_area", side_effect=lambda exchange, symbol, timestamp: value_area(timestamp)):
+                setups = module.custom_process_symbol(data)
+
+            df_1h, df_5m = to_frame(candles_1h), to_frame(candles_5m)
+            expected = loop_line_in_range_setups(
+                self.SYMBOL, self.CURRENT_PRICE,
+                loop_pinescript_gaps(df_1h, module.MIN_1H_GAP_PERCENT, len(df_1h)),
+                loop_pinescript_gaps(df_5m, module.MIN_5M_GAP_PERCENT, len(df_5m) - 1),
+                value_area,
+            )
+            self.assertEqual(setups, expected)
+            found.extend(setups)
+        self.assertCovered(found)
+        self.assertInclusiveEdgeHit(found)
+
+    def context(self, seed):
+        candles_1h, candles_5m = self.candles(seed)
+        return strategies.SymbolContext(self.SYMBOL, self.CURRENT_PRICE, candles_1h, candles_5m)
+
+    def strategy_setups(self, context, name):
+        strategy = strategies.STRATEGIES[name]
+        return strategy["align"](context, strategy), strategy
+
+    def test_crossed_line_strategy_matches_loops(self):
+        found, edge_hits = [], 0
+        for seed in self.SEEDS:
+            context = self.context(seed)
+            setups, strategy = self.strategy_setups(context, "crossed_line")
+            expected = loop_three_candle_setups(self.SYMBOL, self.CURRENT_PRICE, to_frame(context.candles["1h"]),
+                                                to_frame(context.candles["5m"]), strategy["min_5m_gap_percent"])
+            self.assertEqual(canonical(setups), canonical(expected))
+            found.extend(setups)
+            edge_hits += self.crossing_edge_hit(context.candles["5m"], setups)
+        self.assertCovered(found)
+        self.assertTrue(edge_hits)
+
+    def pinescript_strategy_case(self, name, loop, value_areas):
+        found = []
+        for seed in self.SEEDS:
+            context = self.context(seed)
+            setups, strategy = self.strategy_setups(context, name)
+            candles_1h = context.candles["1h"]
+
+            def value_area(timestamp):
+                month = int(month_starts([int(pd.Timestamp(timestamp).timestamp() * 1000)])[0])
+                return value_areas(candles_1h, month)
+
+            df_1h, df_5m = to_frame(candles_1h), to_frame(context.candles["5m"])
+            expected = loop(self.SYMBOL, self.CURRENT_PRICE,
+                            loop_pinescript_gaps(df_1h, strategy["min_1h_gap_percent"], len(df_1h)),
+                            loop_pinescript_gaps(df_5m, strategy["min_5m_gap_percent"], len(df_5m)),
+                            value_area)
+            self.assertEqual(canonical(setups), canonical(expected))
+            found.extend(setups)
+        self.assertCovered(found)
+        self.assertInclusiveEdgeHit(found)
+
+    def test_pinescript_va_strategy_matches_loops(self):
+        self.pinescript_strategy_case(
+            "pinescript_va", loop_line_in_range_setups,
+            lambda candles_1h, month: monthly_volume_days_value_areas(candles_1h, [month])[month],
+        )
+
+    def test_either_line_strategy_matches_loops(self):
+        self.pinescript_strategy_case(
+            "either_line", loop_either_line_setups,
+            lambda candles_1h, month: monthly_profile_value_areas(candles_1h, [month], 0.7)[month],
+        )
+
+
+class StubExchange:
+    """
+    Exchange answering fetch_ohlcv like Binance from a synthetic 1h series.
+
+    Pages are capped at `page_cap` bars whatever limit is asked for, and
+    bars exist from `listed_at` up to the one open at `now`.
+    """
+
+    id = "stub"
+
+    def __init__(self, now, listed_at=0, page_cap=500):
+        self.now = now
+        self.listed_at = listed_at
+        self.page_cap = page_cap
+        self.options = {}
+        self.last_response_headers = None
+        self.last_request_url = None
+        self.requests = []
+
+    def milliseconds(self):
+        return self.now
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.requests.append((timeframe, since, limit))
+        step = timeframe_to_ms(timeframe)
+        start = max(since, self.listed_at)
+        start += -start % step
+        count = min(limit or 500, self.page_cap)
+        rows = []
+        for open_time in range(start, self.now, step)[:count]:
+            price = 100.0 + (open_time // step) % 50
+            rows.append([open_time, price, price + 2, price - 1, price + 1, 10.0])
+        return rows
+
+
+class InTemporaryDirectory(SimpleTestCase):
+    """Runs each test in a fresh working directory, where the cache and candle store live."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.reset_manifests()
+
+    def tearDown(self):
+        self.reset_manifests()
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def reset_manifests(self):
+        # Manifests are opened once per process and cache directory name
+        for manifest in (getattr(cache_manifest._local, "manifests", None) or {}).values():
+            manifest.flush_hits()
+            manifest.connection.close()
+        cache_manifest._local.manifests = None
+
+
+class OhlcvCacheTests(InTemporaryDirectory):
+    SYMBOL = "TEST/USDT"
+
+    def assertContinuous(self, candles, since, until):
+        self.assertEqual(int(candles["timestamp"][0]), since)
+        self.assertEqual(int(candles["timestamp"][-1]), until - HOUR_MS)
+        self.assertEqual(set(np.diff(candles["timestamp"]).tolist()), {HOUR_MS})
+
+    def test_capped_pages_are_fetched_up_to_now(self):
+        now = JAN_1_2024 + 120 * 24 * HOUR_MS + HOUR_MS // 2
+        since = now - 90 * 24 * HOUR_MS - HOUR_MS // 2
+        exchange = StubExchange(now)
+
+        candles, outcome = utils.fetch_ohlcv_data(exchange, self.SYMBOL, "1h", since)
+        self.assertEqual(outcome, "miss")
+        # 90 days of closed bars plus the open one, over five capped pages
+        self.assertContinuous(candles, since, now + HOUR_MS // 2)
+        self.assertEqual(len(exchange.requests), 5)
+        entry = cache_manifest.cache_manifest().lookup(self.SYMBOL, "1h")
+        self.assertEqual(entry["closed_until"], now - HOUR_MS // 2)
+
+        # Once the open tail expires, the refresh also pages across everything since closed_until
+        exchange.now += 700 * HOUR_MS
+        with mock.patch.object(cache_manifest, "OPEN_TAIL_TTL", 0):
+            candles, outcome = utils.fetch_ohlcv_data(exchange, self.SYMBOL, "1h", since)
+        self.assertEqual(outcome, "incremental")
+        self.assertContinuous(candles, since, exchange.now + HOUR_MS // 2)
+        self.assertEqual(exchange.requests[5][1], entry["closed_until"])
+
+        # The stub's bars are all closed by the wall clock, so the store holds the same series
+        self.assertEqual(read_candles(self.SYMBOL, "1h").tolist(), candles.tolist())
+
+    def test_closed_until_stops_at_the_last_bar_returned(self):
+        now = JAN_1_2024 + 30 * 24 * HOUR_MS
+        exchange = StubExchange(now)
+        # The exchange has nothing after the first page, e.g. a symbol whose trading halted
+        exchange.fetch_ohlcv = lambda symbol, timeframe, since=None, limit=None: (
+            StubExchange.fetch_ohlcv(exchange, symbol, timeframe, since, limit) if since < JAN_1_2024 + HOUR_MS else [])
+
+        candles, outcome = utils.fetch_ohlcv_data(exchange, self.SYMBOL, "1h", JAN_1_2024)
+        self.assertEqual(outcome, "miss")
+        self.assertEqual(len(candles), 500)
+        entry = cache_manifest.cache_manifest().lookup(self.SYMBOL, "1h")
+        self.assertEqual(entry["closed_until"], JAN_1_2024 + 500 * HOUR_MS)
+        self.assertEqual(entry["covered_until"], JAN_1_2024 + 500 * HOUR_MS)
+
+
+class CacheManifestTests(InTemporaryDirectory):
+    def open_manifest(self, max_bytes=cache_manifest.CACHE_MAX_BYTES):
+        manifest = cache_manifest.CacheManifest("cache", max_bytes)
+        self.addCleanup(manifest.connection.close)
+        return manifest
+
+    def record(self, manifest, symbol, timeframe="1h", nbytes=100):
+        path = utils.cache_file(symbol, timeframe, manifest.cache_dir)
+        with open(path, "wb") as f:
+            f.write(b"x" * nbytes)
+        return manifest.record_fetch(symbol, timeframe, path, JAN_1_2024, JAN_1_2024 + 10 * HOUR_MS,
+                                     JAN_1_2024 + 9 * HOUR_MS, 10, nbytes, 0)
+
+    def test_plan(self):
+        manifest = self.open_manifest()
+        self.record(manifest, "A/USDT")
+        entry = manifest.lookup("A/USDT", "1h")
+        fetched_at = entry["fetched_at"]
+
+        self.assertEqual(manifest.plan(None, JAN_1_2024), "miss")
+        # Requests starting before the covered range, or after its end
+        self.assertEqual(manifest.plan(entry, JAN_1_2024 - HOUR_MS, fetched_at), "miss")
+        self.assertEqual(manifest.plan(entry, JAN_1_2024 + 10 * HOUR_MS, fetched_at), "miss")
+        self.assertEqual(manifest.plan(entry, JAN_1_2024 + 5 * HOUR_MS, fetched_at), "hit")
+        self.assertEqual(manifest.plan(entry, JAN_1_2024, fetched_at + cache_manifest.OPEN_TAIL_TTL - 1), "hit")
+        self.assertEqual(manifest.plan(entry, JAN_1_2024, fetched_at + cache_manifest.OPEN_TAIL_TTL), "incremental")
+
+    def test_least_recently_used_symbols_are_evicted_whole(self):
+        manifest = self.open_manifest(max_bytes=500)
+        self.assertEqual(self.record(manifest, "A/USDT", "1h"), [])
+        self.assertEqual(self.record(manifest, "A/USDT", "5m"), [])
+        self.assertEqual(self.record(manifest, "B/USDT", "1h"), [])
+        self.assertEqual(self.record(manifest, "C/USDT", "1h"), [])
+        # A is touched after B, so B is the least recently used
+        entry = manifest.lookup("A/USDT", "1h")
+        manifest.record_hit(entry, now=entry["last_used"] + cache_manifest.TOUCH_INTERVAL)
+
+        self.assertEqual(self.record(manifest, "D/USDT", "1h", nbytes=150), ["B/USDT"])
+        self.assertIsNone(manifest.lookup("B/USDT", "1h"))
+        self.assertFalse(os.path.exists(utils.cache_file("B/USDT", "1h", "cache")))
+        stats = manifest.stats()
+        self.assertEqual((stats["evictions"], stats["bytes_evicted"]), (1, 100))
+        self.assertEqual((stats["symbols"], stats["bytes"]), (3, 450))
+
+        # The symbol just fetched stays even when it alone exceeds the budget
+        self.assertEqual(self.record(manifest, "E/USDT", "1h", nbytes=600), ["C/USDT", "D/USDT", "A/USDT"])
+        self.assertEqual(manifest.stats()["symbols"], 1)
+        self.assertIsNotNone(manifest.lookup("E/USDT", "1h"))
+
+    def test_hits_are_written_in_batches(self):
+        manifest = self.open_manifest()
+        self.record(manifest, "A/USDT")
+        entry = manifest.lookup("A/USDT", "1h")
+        now = entry["last_used"]
+
+        manifest.record_hit(entry, now=now + 1)
+        manifest.record_hit(entry, now=now + 2)
+        # Another process opening the same manifest does not see the batched hits yet
+        other = self.open_manifest()
+        self.assertEqual(other.stats()["hits"], 0)
+        self.assertEqual(manifest.lookup("A/USDT", "1h")["last_used"], now)
+
+        manifest.record_hit(entry, now=now + cache_manifest.HIT_FLUSH_INTERVAL + 1)
+        self.assertEqual(other.stats()["hits"], 3)
+        self.assertEqual(other.stats()["bytes_saved"], 300)
+        # Flushing alone does not touch the entry
+        self.assertEqual(manifest.lookup("A/USDT", "1h")["last_used"], now)
+
+        baseline = other.stats()
+        manifest.record_hit(entry, now=now + cache_manifest.TOUCH_INTERVAL)
+        self.assertEqual(manifest.lookup("A/USDT", "1h")["last_used"], now + cache_manifest.TOUCH_INTERVAL)
+        stats = other.stats(baseline)
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 0, 1.0))
+
+
+class CacheRepairTests(InTemporaryDirectory):
+    SYMBOL = "TEST/USDT"
+    NOW = JAN_1_2024 + 30 * 24 * HOUR_MS + HOUR_MS // 2
+    SINCE = JAN_1_2024 + 10 * 24 * HOUR_MS
+
+    def setUp(self):
+        super().setUp()
+        self.exchange = StubExchange(self.NOW)
+        self.candles, outcome = utils.fetch_ohlcv_data(self.exchange, self.SYMBOL, "1h", self.SINCE)
+        self.assertEqual(outcome, "miss")
+        self.manifest = cache_manifest.cache_manifest()
+        self.entry = self.manifest.lookup(self.SYMBOL, "1h")
+        # A file cut short, as left by a crash mid-write
+        with open(self.entry["path"], "rb") as f:
+            data = f.read()
+        with open(self.entry["path"], "wb") as f:
+            f.write(data[:len(data) // 2])
+        self.exchange.requests.clear()
+
+    def test_damaged_file_is_rebuilt_from_the_candle_store(self):
+        candles, outcome = utils.fetch_ohlcv_data(self.exchange, self.SYMBOL, "1h", self.SINCE)
+        self.assertEqual(outcome, "incremental")
+        self.assertEqual(candles.tolist(), self.candles.tolist())
+        # Only the bars from the open one at the last fetch are downloaded again
+        self.assertEqual([since for _, since, _ in self.exchange.requests], [self.entry["closed_until"]])
+        stats = self.manifest.stats()
+        self.assertEqual((stats["corrupt"], stats["repaired"]), (1, 1))
+
+        # The rewritten file verifies again
+        entry = self.manifest.lookup(self.SYMBOL, "1h")
+        self.assertEqual(utils.load_cached_data(entry).tolist(), candles.tolist())
+
+    def test_damaged_file_without_stored_candles_is_fetched_again(self):
+        shutil.rmtree("candles")
+        self.assertIsNone(utils.load_cached_data(self.entry))
+
+        candles, outcome = utils.fetch_ohlcv_data(self.exchange, self.SYMBOL, "1h", self.SINCE)
+        self.assertEqual(outcome, "miss")
+        self.assertEqual(candles.tolist(), self.candles.tolist())
+        self.assertEqual(self.exchange.requests[0][1], self.SINCE)
+        stats = self.manifest.stats()
+        self.assertEqual((stats["corrupt"], stats["repaired"]), (1, 0))
+
+
+class SweepLookaheadTests(InTemporaryDirectory):
+    """The sweep pairs gaps the way the live screener and the replay could have seen them."""
+
+    SYMBOL = "TEST/USDT"
+    LOOKBACK_MS = 3 * 24 * HOUR_MS
+
+    def setUp(self):
+        super().setUp()
+        self.candles_1h = grid_candles(3, FEB_20_2025, HOUR_MS, 240)
+        self.candles_5m = grid_candles(103, FEB_27_2025, FIVE_MINUTES_MS, 600)
+        write_candles(self.SYMBOL, "1h", self.candles_1h, "candles")
+        write_candles(self.SYMBOL, "5m", self.candles_5m, "candles")
+        self.start_ms, self.end_ms = FEB_27_2025, FEB_27_2025 + 600 * FIVE_MINUTES_MS
+
+    def loop_pairs(self, lookahead=False):
+        """(5M gap, 1H gap percent) of every aligned pair, by checking each pair in turn."""
+        gaps_1h = detect_gaps(self.candles_1h[self.candles_1h["timestamp"] < self.end_ms])
+        gaps_5m = detect_gaps(self.candles_5m)
+        pairs = []
+        for i in range(len(gaps_5m["bullish"])):
+            known_5m = gaps_5m["timestamp"][i] + 2 * FIVE_MINUTES_MS
+            for j in range(len(gaps_1h["bullish"])):
+                line = gaps_1h["lower_line" if gaps_5m["bullish"][i] else "upper_line"][j]
+                if not gaps_5m["lower_line"][i] <= line <= gaps_5m["upper_line"][i]:
+                    continue
+                if lookahead or (gaps_1h["timestamp"][j] + 2 * HOUR_MS <= known_5m and
+                                 gaps_1h["timestamp"][j] >= known_5m - self.LOOKBACK_MS):
+                    pairs.append((i, float(gaps_1h["gap_percent"][j])))
+        return sorted(pairs), gaps_5m
+
+    def test_pairs_only_gaps_known_within_the_lookback(self):
+        candidates = sweep.find_candidates(self.SYMBOL, self.start_ms, self.end_ms, store_dir="candles",
+                                           backtest=False, lookback_ms=self.LOOKBACK_MS)
+        expected, gaps_5m = self.loop_pairs()
+        found = sorted(zip(candidates["gap_index"].tolist(), candidates["gap_percent_1h"].tolist()))
+        self.assertEqual(found, expected)
+        # The fixture has pairs the guard has to drop
+        self.assertGreater(len(self.loop_pairs(lookahead=True)[0]), len(expected))
+
+        # Value areas only use the days that had closed before each 5M gap
+        stats = sweep.evaluate_grid(candidates, [0.0], [0.0], [None, 0.7])
+        self.assertEqual(stats[0, 0, 0, sweep.STAT_FIELDS.index("setups")], len(expected))
+        beyond = 0
+        for i, _ in expected:
+            day = gaps_5m["timestamp"][i] - gaps_5m["timestamp"][i] % (24 * HOUR_MS)
+            va_high, va_low = value_area_as_of(self.candles_1h, day, 70)
+            if gaps_5m["bullish"][i]:
+                beyond += va_low is not None and gaps_5m["upper_line"][i] < va_low
+            else:
+                beyond += va_high is not None and gaps_5m["lower_line"][i] > va_high
+        self.assertEqual(stats[1, 0, 0, sweep.STAT_FIELDS.index("setups")], beyond)
+        self.assertGreater(beyond, 0)
+
+
+def loop_backtest(setups, candles, timeframe_ms, max_bars=None):
+    """backtest_symbol as a loop over each setup and each candle after its entry."""
+    timestamps = candles["timestamp"].tolist()
+    results = []
+    for setup in setups.itertuples():
+        gap_ms = int(setup.fvg_5m_timestamp.timestamp() * 1000)
+        if gap_ms + timeframe_ms not in timestamps:
+            results.append((backtest.INVALID, np.nan, np.nan, np.nan, np.nan))
+            continue
+        entry_index = timestamps.index(gap_ms + timeframe_ms)
+        entry = candles["close"][entry_index]
+        bullish = setup.type == "bullish"
+        reward = 2.0 if pd.isna(setup.risk_reward) else setup.risk_reward
+        risk = entry - setup.stop_loss if bullish else setup.stop_loss - entry
+        if not risk > 0:
+            results.append((backtest.INVALID, entry, np.nan, np.nan, np.nan))
+            continue
+        target = entry + reward * risk if bullish else entry - reward * risk
+        end = len(candles) if max_bars is None else min(len(candles), entry_index + 1 + max_bars)
+        result = (backtest.OPEN, entry, target, np.nan, np.nan)
+        for index in range(entry_index + 1, end):
+            high, low = candles["high"][index], candles["low"][index]
+            # The stop wins when one candle touches both
+            if (low <= setup.stop_loss) if bullish else (high >= setup.stop_loss):
+                result = (backtest.LOSS, entry, target, -1.0, index - entry_index)
+                break
+            if (high >= target) if bullish else (low <= target):
+                result = (backtest.WIN, entry, target, reward, index - entry_index)
+                break
+        results.append(result)
+    return results
+
+
+def outcome_rows(result):
+    return list(zip(result["outcome"], result["entry"], result["target"], result["r_multiple"],
+                    result["bars_to_resolution"]))
+
+
+def setup_frame(rows, start=FEB_27_2025):
+    """Setups from (type, stop_loss, risk_reward, 5M candle of the gap's middle candle) rows."""
+    return pd.DataFrame({
+        "type": [row[0] for row in rows],
+        "stop_loss": [row[1] for row in rows],
+        "risk_reward": [row[2] for row in rows],
+        "fvg_5m_timestamp": pd.to_datetime([start + row[3] * FIVE_MINUTES_MS for row in rows], unit="ms", utc=True),
+    })
+
+
+class BacktestTests(SimpleTestCase):
+    def assertSameOutcomes(self, found, expected):
+        for row, expected_row in zip(outcome_rows(found), expected):
+            self.assertEqual(row[0], expected_row[0])
+            np.testing.assert_allclose(np.array(row[1:], dtype="f8"), np.array(expected_row[1:], dtype="f8"))
+        self.assertEqual(len(found), len(expected))
+
+    def test_first_hit_matches_a_scan(self):
+        rng = np.random.default_rng(7)
+        for n in (1, 2, 5, 8, 13, 64, 100):
+            values = rng.integers(0, 20, n).astype("f8")
+            table = backtest.build_range_max_table(values)
+            starts = rng.integers(0, n + 1, 200)
+            thresholds = rng.integers(0, 22, 200).astype("f8")
+            expected = [next((index for index in range(start, n) if values[index] >= threshold), n)
+                        for start, threshold in zip(starts, thresholds)]
+            self.assertEqual(backtest.first_hit(table, starts, thresholds).tolist(), expected)
+
+    def test_hand_made_setups(self):
+        # Candle 1 completes a gap opening at candle 0 and touches everything; candle 3 touches
+        # both the stop and the target of setups A and B; candle 4 is the last one
+        candles = to_candles([
+            [FEB_27_2025 + 0 * FIVE_MINUTES_MS, 100, 101, 99, 100, 1],
+            [FEB_27_2025 + 1 * FIVE_MINUTES_MS, 100, 130, 70, 100, 1],
+            [FEB_27_2025 + 2 * FIVE_MINUTES_MS, 100, 101, 99, 100, 1],
+            [FEB_27_2025 + 3 * FIVE_MINUTES_MS, 100, 111, 94, 105, 1],
+            [FEB_27_2025 + 4 * FIVE_MINUTES_MS, 100, 112, 99, 100, 1],
+        ])
+        setups = setup_frame([
+            ("bullish", 95.0, 2, 0),      # A: both on candle 3 -> loss, not decided by the entry candle
+            ("bullish", 95.0, 1, 0),      # B: both on candle 3 -> loss
+            ("bullish", 80.0, 0.1, 0),    # C: target 102 on candle 3 -> win
+            ("bearish", 104.0, np.nan, 0),  # D: risk_reward defaults to 2, stop on candle 3 -> loss
+            ("bearish", 120.0, 0.35, 0),  # E: target 93 never reached, stop 120 only on the entry candle -> open
+            ("bullish", 95.0, 2, 3),      # F: entry on the last candle, nothing after it -> open
+            ("bullish", 95.0, 2, 4),      # G: no candle completes the gap -> invalid
+            ("bullish", 101.0, 2, 0),     # H: stop above entry -> invalid
+        ])
+        timeframe_ms = FIVE_MINUTES_MS
+        result = backtest.backtest_symbol(setups, candles, timeframe_ms)
+        self.assertEqual(result["outcome"].tolist(), [backtest.LOSS, backtest.LOSS, backtest.WIN, backtest.LOSS,
+                                                      backtest.OPEN, backtest.OPEN, backtest.INVALID, backtest.INVALID])
+        self.assertEqual(result["bars_to_resolution"].tolist()[:4], [2.0, 2.0, 2.0, 2.0])
+        self.assertEqual(result["r_multiple"].tolist()[:4], [-1.0, -1.0, 0.1, -1.0])
+        self.assertEqual(result["resolved_at"][0], pd.Timestamp(FEB_27_2025 + 3 * FIVE_MINUTES_MS, unit="ms", tz="UTC"))
+        self.assertSameOutcomes(result, loop_backtest(setups, candles, timeframe_ms))
+
+        # Expired after one candle past the entry: candle 3 is never checked
+        expired = backtest.backtest_symbol(setups, candles, timeframe_ms, max_bars=1)
+        self.assertEqual(expired["outcome"].tolist()[:6], [backtest.OPEN] * 6)
+        self.assertSameOutcomes(expired, loop_backtest(setups, candles, timeframe_ms, max_bars=1))
+        self.assertEqual(backtest.backtest_symbol(setups, candles, timeframe_ms, max_bars=2)["outcome"].tolist()[:4],
+                         [backtest.LOSS, backtest.LOSS, backtest.WIN, backtest.LOSS])
+
+    def test_random_setups_match_a_loop(self):
+        rng = np.random.default_rng(11)
+        candles = grid_candles(5, FEB_27_2025, FIVE_MINUTES_MS, 300)
+        rows = []
+        for _ in range(400):
+            gap = int(rng.integers(-2, 302))
+            entry = candles["close"][min(max(gap + 1, 0), 299)]
+            bullish = bool(rng.integers(0, 2))
+            # Stops on the coarse price grid, a few on the wrong side of entry
+            offset = PRICE_TICK * int(rng.integers(-1, 8))
+            rows.append(("bullish" if bullish else "bearish", entry - offset if bullish else entry + offset,
+                         rng.choice([1.0, 2.0, 3.0, np.nan]), gap))
+        setups = setup_frame(rows)
+        for max_bars in (None, 1, 5, 40):
+            result = backtest.backtest_symbol(setups, candles, FIVE_MINUTES_MS, max_bars)
+            expected = loop_backtest(setups, candles, FIVE_MINUTES_MS, max_bars)
+            self.assertSameOutcomes(result, expected)
+            self.assertEqual({row[0] for row in expected},
+                             {backtest.WIN, backtest.LOSS, backtest.OPEN, backtest.INVALID})
+
+
+def write_hour_blocks(worker):
+    """Store candles for ten blocks of ten hours owned by one writer - for a process pool."""
+    for block in range(10):
+        hours = range(worker * 100 + block * 10, worker * 100 + block * 10 + 10)
+        rows = [[JAN_1_2024 + hour * HOUR_MS, 1.0, 2.0, 0.5, 1.5, 1.0] for hour in hours]
+        store_candles("TEST/USDT", "1h", rows, "candles")
+
+
+class CandleStoreWriteTests(InTemporaryDirectory):
+    def test_concurrent_writers_keep_each_others_candles(self):
+        with multiprocessing.get_context("fork").Pool(8) as pool:
+            pool.map(write_hour_blocks, range(8))
+        stored = read_candles("TEST/USDT", "1h", store_dir="candles")
+        self.assertEqual(stored["timestamp"].tolist(), [JAN_1_2024 + hour * HOUR_MS for hour in range(800)])
+
+
+class SharedCandlesTests(InTemporaryDirectory):
+    SINCE = JAN_1_2024 + 10 * HOUR_MS
+    UNTIL = JAN_1_2024 + 40 * HOUR_MS
+
+    def setUp(self):
+        super().setUp()
+        for symbol in ("A/USDT", "B/USDT"):
+            rows = [[JAN_1_2024 + hour * HOUR_MS, hour, hour + 1.0, hour - 1.0, hour + 0.5, 1.0] for hour in range(50)]
+            store_candles(symbol, "1h", rows, "candles")
+            store_candles(symbol, "4h", rows[::4], "candles")
+        self.shared = SharedCandles.create(["A/USDT", "B/USDT", "C/USDT"],
+                                           {"1h": (self.SINCE, self.UNTIL), "4h": (None, None)}, store_dir="candles")
+        self.addCleanup(self.shared.close)
+
+    def test_ranges_inside_the_held_one_are_views(self):
+        for since, until in [(self.SINCE, self.UNTIL), (self.SINCE + HOUR_MS, self.UNTIL - HOUR_MS),
+                             (self.SINCE + HOUR_MS // 2, self.SINCE + 3 * HOUR_MS), (self.SINCE, self.SINCE)]:
+            candles = self.shared.get("B/USDT", "1h", since, until)
+            self.assertEqual(candles.tolist(), read_candles("B/USDT", "1h", since, until, "candles").tolist())
+            self.assertTrue(len(candles) == 0 or np.shares_memory(candles, self.shared.records))
+        # A series held without bounds serves any range
+        self.assertEqual(self.shared.get("A/USDT", "4h").tolist(), read_candles("A/USDT", "4h", store_dir="candles").tolist())
+        self.assertEqual(len(self.shared.get("A/USDT", "4h", JAN_1_2024 + 4 * HOUR_MS, JAN_1_2024 + 12 * HOUR_MS)), 2)
+
+    def test_ranges_reaching_outside_the_held_one_are_not_served(self):
+        for since, until in [(None, self.UNTIL), (self.SINCE, None), (None, None),
+                             (self.SINCE - 1, self.UNTIL), (self.SINCE, self.UNTIL + 1)]:
+            self.assertIsNone(self.shared.get("A/USDT", "1h", since, until))
+        self.assertIsNone(self.shared.get("C/USDT", "1h", self.SINCE, self.UNTIL))
+        self.assertIsNone(self.shared.get("A/USDT", "5m", self.SINCE, self.UNTIL))
+
+    def test_workers_read_the_block_and_fall_back_to_the_store(self):
+        requests = [("A/USDT", "1h", self.SINCE + HOUR_MS, self.UNTIL), ("A/USDT", "1h", JAN_1_2024, self.UNTIL),
+                    ("B/USDT", "4h", None, None)]
+        with multiprocessing.get_context("fork").Pool(2, initializer=attach_shared_candles,
+                                                      initargs=(self.shared.handle(),)) as pool:
+            results = pool.starmap(read_shared_candles, [request + ("candles",) for request in requests])
+        for request, candles in zip(requests, results):
+            self.assertEqual(candles.tolist(), read_candles(*request, store_dir="candles").tolist())
+
+
+def screened_setup(symbol, setup_type, day):
+    """A minimal setup found on a day of February 2025."""
+    timestamp = pd.Timestamp(FEB_20_2025, unit="ms", tz="UTC") + pd.Timedelta(days=day)
+    return {"symbol": symbol, "type": setup_type, "fvg_1h": {"timestamp": timestamp}, "fvg_5m": {"timestamp": timestamp}}
+
+
+class AnalyzeResultsTests(InTemporaryDirectory):
+    def write_run(self, results_dir, setups, name="screener_20250227_120000"):
+        with ResultsWriter(results_dir, "screener") as writer:
+            writer.write_setups(setups)
+        path = os.path.join(results_dir, name + ".ndjson")
+        os.replace(writer.path, path)
+        os.replace(writer.meta_path, meta_path_for(path))
+        return path
+
+    def test_same_named_runs_in_different_directories_stay_apart(self):
+        current = self.write_run("results", [screened_setup("AAA/USDT", "bullish", 0),
+                                             screened_setup("BBB/USDT", "bearish", 1)])
+        archived = self.write_run(os.path.join("archive", "2025"), [screened_setup("AAA/USDT", "bullish", 0)])
+        paths = [archived, current]
+
+        names = analyze_results.run_names(paths)
+        self.assertEqual(names, [os.path.join("archive", "2025", "screener_20250227_120000"),
+                                 os.path.join("results", "screener_20250227_120000")])
+        cube = analyze_results.load_runs(paths, max_workers=1)
+        self.assertEqual(analyze_results.breakdown(cube, "run").to_dict(), dict(zip(names, [1, 2])))
+        diffs = analyze_results.run_diffs(cube, "symbol", names)
+        self.assertEqual(diffs[f"diff_{names[1]}"].to_dict(), {"AAA/USDT": 0, "BBB/USDT": 1})
+
+    def test_run_names_within_one_directory(self):
+        self.assertEqual(analyze_results.run_names(["results/a.ndjson", "results/b.json"]), ["a", "b"])
+        # Two formats of one run keep their extensions
+        self.assertEqual(analyze_results.run_names(["results/a.ndjson", "results/a.json"]), ["a.ndjson", "a.json"])
+
+
+def pandas_resample(candles, rule, source_timeframe=None):
+    """resample_candles with pandas, dropping buckets without candles (and incomplete ones given the source)."""
+    frame = pd.DataFrame(candles).set_index(pd.to_datetime(candles["timestamp"], unit="ms"))
+    bars = frame.resample(rule, label="left", closed="left").agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum", "timestamp": "count"})
+    counts = bars.pop("timestamp")
+    keep = counts > 0
+    if source_timeframe is not None:
+        spans = (bars.index + pd.tseries.frequencies.to_offset(rule) - bars.index) // pd.Timedelta(source_timeframe)
+        keep &= counts == spans
+    bars = bars[keep]
+    return [[int(timestamp.value // 10**6), *row] for timestamp, row in zip(bars.index, bars.values.tolist())]
+
+
+def loop_missing_ranges(timestamps, step_ms, since, until):
+    """Open times in [since, until) without a candle, grouped into consecutive ranges."""
+    ranges = []
+    for open_time in range(since, until, step_ms):
+        if open_time in timestamps:
+            continue
+        if ranges and ranges[-1][1] == open_time:
+            ranges[-1] = (ranges[-1][0], open_time + step_ms)
+        else:
+            ranges.append((open_time, open_time + step_ms))
+    return ranges
+
+
+class ResampleTests(SimpleTestCase):
+    RULES = {"4h": "4h", "1d": "1D", "1w": "W-MON", "1M": "MS"}
+
+    def holed_candles(self, seed, length):
+        candles = grid_candles(seed, JAN_1_2024 + 11 * HOUR_MS, HOUR_MS, length)
+        keep = np.random.default_rng(seed).random(length) > 0.02
+        return candles[keep]
+
+    def test_matches_pandas(self):
+        for seed in range(3):
+            candles = self.holed_candles(seed, 24 * 80)
+            for timeframe, rule in self.RULES.items():
+                with self.subTest(seed=seed, timeframe=timeframe):
+                    self.assertEqual(resample_candles(candles, timeframe).tolist(),
+                                     [tuple(row) for row in pandas_resample(candles, rule)])
+                    self.assertEqual(resample_candles(candles, timeframe, "1h").tolist(),
+                                     [tuple(row) for row in pandas_resample(candles, rule, "1h")])
+
+    def test_complete_bars_only_with_a_source(self):
+        candles = grid_candles(1, JAN_1_2024 + 2 * HOUR_MS, HOUR_MS, 24)
+        # Hours 2-3 of the first bar and 0-1 of the last are missing
+        self.assertEqual(resample_candles(candles, "4h")["timestamp"].tolist(),
+                         [JAN_1_2024 + hour * HOUR_MS for hour in range(0, 28, 4)])
+        self.assertEqual(resample_candles(candles, "4h", "1h")["timestamp"].tolist(),
+                         [JAN_1_2024 + hour * HOUR_MS for hour in range(4, 24, 4)])
+        self.assertEqual(len(resample_candles(candles[:0], "4h")), 0)
+
+    def test_missing_ranges_match_a_loop(self):
+        rng = np.random.default_rng(2)
+        for _ in range(200):
+            length = int(rng.integers(0, 40))
+            timestamps = np.sort(rng.choice(60, length, replace=False)) * HOUR_MS + JAN_1_2024
+            since = JAN_1_2024 + int(rng.integers(0, 10)) * HOUR_MS
+            until = since + int(rng.integers(1, 60)) * HOUR_MS
+            held = timestamps[(timestamps >= since) & (timestamps < until)]
+            candles = to_candles([[timestamp, 1.0, 1.0, 1.0, 1.0, 1.0] for timestamp in held])
+            self.assertEqual(missing_ranges(candles, "1h", since, until),
+                             loop_missing_ranges(set(held.tolist()), HOUR_MS, since, until))
+
+
+class CandleSourceTests(InTemporaryDirectory):
+    SYMBOL = "TEST/USDT"
+    NOW = JAN_1_2024 + 200 * 24 * HOUR_MS
+    SINCE = NOW - 90 * 24 * HOUR_MS
+
+    def store(self, timeframe, since, until):
+        step = timeframe_to_ms(timeframe)
+        rows = [[open_time, 1.0, 2.0, 0.5, 1.5, 1.0] for open_time in range(since, until, step)]
+        store_candles(self.SYMBOL, timeframe, rows, "candles")
+
+    def test_fine_source_with_a_large_hole_loses_to_the_target(self):
+        # One day of 5M candles at each end of the range, 88 days missing in between
+        self.store("5m", self.SINCE, self.SINCE + 24 * HOUR_MS)
+        self.store("5m", self.NOW - 24 * HOUR_MS, self.NOW)
+        self.assertEqual(resample_source(self.SYMBOL, "4h", self.SINCE, self.NOW, "candles"), "4h")
+
+        exchange = StubExchange(self.NOW)
+        candles = build_candles(exchange, self.SYMBOL, "4h", self.SINCE, self.NOW, False, self.NOW, "candles")
+        self.assertEqual(len(candles), 90 * 6)
+        # Two capped 4H pages instead of 88 days of 5M pages
+        self.assertEqual([timeframe for timeframe, _, _ in exchange.requests], ["4h", "4h"])
+
+    def test_coarser_stored_source_without_holes_wins(self):
+        self.store("5m", self.SINCE, self.SINCE + 24 * HOUR_MS)
+        self.store("1h", self.SINCE, self.NOW)
+        self.assertEqual(resample_source(self.SYMBOL, "4h", self.SINCE, self.NOW, "candles"), "1h")
+        # With nothing to fetch either way, the finer series is used
+        self.store("5m", self.SINCE, self.NOW)
+        self.assertEqual(resample_source(self.SYMBOL, "4h", self.SINCE, self.NOW, "candles"), "5m")
+
+    def test_time_before_listing_is_only_requested_once(self):
+        listed_at = self.SINCE + 10 * 24 * HOUR_MS
+        exchange = StubExchange(self.NOW, listed_at=listed_at)
+        candles = build_candles(exchange, self.SYMBOL, "1h", self.SINCE, self.NOW, False, self.NOW, "candles")
+        self.assertEqual(int(candles["timestamp"][0]), listed_at)
+        self.assertEqual(stored_head(self.SYMBOL, "1h", "candles"), listed_at)
+
+        exchange.requests.clear()
+        again = build_candles(exchange, self.SYMBOL, "1h", self.SINCE, self.NOW, False, self.NOW, "candles")
+        self.assertEqual(exchange.requests, [])
+        self.assertEqual(again.tolist(), candles.tolist())
+
+    def test_holes_after_stored_candles_are_not_heads(self):
+        # The exchange has nothing in the first ten days, but the store holds older candles
+        self.store("1h", self.SINCE - 24 * HOUR_MS, self.SINCE)
+        exchange = StubExchange(self.NOW, listed_at=self.SINCE + 10 * 24 * HOUR_MS)
+        build_candles(exchange, self.SYMBOL, "1h", self.SINCE, self.NOW, False, self.NOW, "candles")
+        self.assertIsNone(stored_head(self.SYMBOL, "1h", "candles"))
+
+        record_head(self.SYMBOL, "1h", self.SINCE, "candles")
+        self.assertEqual(stored_head(self.SYMBOL, "1h", "candles"), self.SINCE)
+
+
+class ValueAreaCheckTests(TestCase):
+    """The rollup answers like the count over every result of the last 24 hours."""
+
+    NOW = datetime(2025, 3, 1, 14, 37, 12, 500000, tzinfo=timezone.utc)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch.object(views, "METRICS_DIR", directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save_result(self, symbol, timestamp, price=1.0):
+        result = ValueAreaResult.objects.create(symbol=symbol, current_price=price, vah=price + 1, val=price - 1)
+        # timestamp is set on insert
+        ValueAreaResult.objects.filter(pk=result.pk).update(timestamp=timestamp)
+        result.refresh_from_db()
+        ValueAreaHourlyRollup.add_result(result)
+
+    def check(self):
+        with mock.patch("django.utils.timezone.now", return_value=self.NOW):
+            response = views.ValueAreaCheckView.as_view()(RequestFactory().get("/value-area-check/"))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def count_query(self):
+        """The view's query before the rollup, with ties broken by symbol."""
+        results = (ValueAreaResult.objects
+                   .filter(timestamp__gte=self.NOW - timedelta(hours=24))
+                   .values('symbol')
+                   .annotate(symbol_count=Count('symbol')))
+        return [result['symbol'] for result in sorted(results, key=lambda r: (-r['symbol_count'], r['symbol']))]
+
+    def test_matches_the_count_query(self):
+        rng = np.random.default_rng(5)
+        start = self.NOW - timedelta(hours=30)
+        for position in range(400):
+            symbol = f"COIN{rng.integers(0, 8)}/USDT"
+            self.save_result(symbol, start + timedelta(seconds=float(rng.uniform(0, 30 * 3600))))
+        # On both sides of the window start, inside the hour it falls in
+        window_start = self.NOW - timedelta(hours=24)
+        self.save_result("EDGE/USDT", window_start)
+        self.save_result("EDGE/USDT", window_start)
+        self.save_result("EDGE/USDT", window_start - timedelta(microseconds=1))
+        self.save_result("OLD/USDT", window_start - timedelta(microseconds=1))
+
+        symbols = self.check()
+        self.assertEqual(symbols, self.count_query())
+        self.assertIn("EDGE/USDT", symbols)
+        self.assertNotIn("OLD/USDT", symbols)
+
+    def test_rollup_keeps_the_latest_prices_of_the_hour(self):
+        hour = datetime(2025, 3, 1, 10, tzinfo=timezone.utc)
+        self.save_result("A/USDT", hour + timedelta(minutes=5), price=1.0)
+        self.save_result("A/USDT", hour + timedelta(minutes=50), price=2.0)
+        self.save_result("A/USDT", hour + timedelta(hours=1), price=3.0)
+
+        rollups = list(ValueAreaHourlyRollup.objects.filter(symbol="A/USDT").order_by("hour"))
+        self.assertEqual([(rollup.hour, rollup.hits) for rollup in rollups], [(hour, 2), (hour + timedelta(hours=1), 1)])
+        self.assertEqual((rollups[0].current_price, rollups[0].vah, rollups[0].val), (2.0, 3.0, 1.0))
+
+
+def market(symbol, market_type, active=True, tick=0.01):
+    """A ccxt market entry for a unified symbol."""
+    pair, _, settle = symbol.partition(":")
+    base, quote = pair.split("/")
+    return {"symbol": symbol, "id": pair.replace("/", "") + ("_" + settle if settle else ""), "type": market_type,
+            "base": base, "quote": quote, "active": active, "precision": {"price": tick}}
+
+
+class SymbolRegistryTests(SimpleTestCase):
+    def test_split_multiplier(self):
+        spot_bases = {"PEPE", "1000SATS", "1INCH", "LADYS", "BABYDOGE"}
+        cases = {
+            "1000PEPE": ("PEPE", 1000),
+            "1000SATS": ("1000SATS", 1),        # listed on spot as-is
+            "1INCH": ("1INCH", 1),
+            "10000LADYS": ("LADYS", 10000),
+            "1MBABYDOGE": ("BABYDOGE", 1000000),
+            "100XYZ": ("100XYZ", 1),            # plain digits before an asset spot does not know
+            "1000XEC": ("XEC", 1000),
+            "BTC": ("BTC", 1),
+        }
+        for base, expected in cases.items():
+            self.assertEqual(split_multiplier(base, spot_bases), expected, base)
+        # Without spot bases, every prefix is a multiplier
+        self.assertEqual(split_multiplier("100XYZ"), ("XYZ", 100))
+        self.assertEqual(split_multiplier("1000SATS"), ("SATS", 1000))
+
+    def test_spot_and_futures_mapping(self):
+        markets = [
+            market("BTC/USDT", "spot"), market("BTC/USDT:USDT", "swap", tick=0.1),
+            market("BTC/USDT:USDT-250328", "future"), market("BTC/USD:BTC", "swap"),
+            market("PEPE/USDT", "spot"), market("1000PEPE/USDT:USDT", "swap"),
+            market("1000SATS/USDT", "spot"), market("1000SATS/USDT:USDT", "swap"),
+            market("FTT/USDT", "spot"), market("FTT/USDT:USDT", "swap"),
+            market("OLD/USDT", "spot", active=False), market("OLD/USDT:USDT", "swap"),
+            market("ONLY/USDT:USDT", "swap"), market("BTC/USDT:USDT-250328-90000-C", "option"),
+        ]
+        registry = SymbolRegistry.from_markets({entry["symbol"]: entry for entry in markets})
+
+        self.assertEqual(len(registry), 13)
+        self.assertNotIn("BTC/USDT:USDT-250328-90000-C", registry)
+        self.assertEqual(registry.futures_symbol("PEPE/USDT"), "1000PEPE/USDT:USDT")
+        self.assertEqual(registry.spot_symbol("1000PEPE/USDT:USDT"), "PEPE/USDT")
+        self.assertEqual(registry.futures_symbol("1000SATS/USDT"), "1000SATS/USDT:USDT")
+        # Delivery and inverse contracts are not the perpetual of a spot pair
+        self.assertEqual(registry.futures_symbol("BTC/USDT"), "BTC/USDT:USDT")
+        self.assertEqual(registry.futures_symbol("BTC/USD:BTC"), None)
+        self.assertEqual(registry.spot_symbol("ONLY/USDT:USDT"), None)
+        self.assertEqual(registry.spot_symbol("MISSING/USDT"), None)
+
+        pepe = registry.get("1000PEPE/USDT:USDT")
+        self.assertEqual((pepe.base_asset, pepe.multiplier, pepe.pair), ("PEPE", 1000, "1000PEPE/USDT"))
+        ids = registry.ids_of(["BTC/USDT:USDT", "MISSING/USDT", "1000PEPE/USDT:USDT"])
+        self.assertEqual(ids[1], -1)
+        self.assertEqual(registry.tick_sizes[ids[0]], 0.1)
+        self.assertEqual(registry.multipliers[ids[2]], 1000)
+
+        # FTT is on the delisted list and OLD is inactive on spot
+        self.assertFalse(registry.listed[registry.id_of("FTT/USDT:USDT")])
+        self.assertFalse(registry.get("OLD/USDT").listed)
+        self.assertEqual(registry.futures_pairs(quote="USDT"),
+                         ["1000PEPE/USDT", "1000SATS/USDT", "BTC/USDT", "OLD/USDT", "ONLY/USDT"])
+        self.assertEqual(registry.matching_futures_symbols(),
+                         ["1000PEPE/USDT:USDT", "1000SATS/USDT:USDT", "BTC/USDT:USDT", "OLD/USDT:USDT"])
+        self.assertEqual(registry.symbols("spot", listed_only=True), ["1000SATS/USDT", "BTC/USDT", "PEPE/USDT"])
+
+
+class MemoryCacheTests(SimpleTestCase):
+    def test_lru_evicts_by_bytes_and_recency(self):
+        cache = LRUCache(max_bytes=3 * 800)
+        for key in "abc":
+            cache.put(key, np.zeros(100))
+        self.assertEqual(cache.get("a").nbytes, 800)
+        cache.put("d", np.zeros(100))
+        # "a" was used after "b", so "b" goes
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(sorted(cache._entries), ["a", "c", "d"])
+        # Replacing a key does not count it twice, and values over the budget are not kept
+        cache.put("a", np.zeros(200))
+        self.assertEqual((len(cache), cache.bytes), (2, 2400))
+        cache.put("e", np.zeros(400))
+        self.assertIsNone(cache.get("e"))
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_expired_entries_are_misses(self):
+        cache = LRUCache()
+        cache.put("a", 1, ttl=60)
+        cache.put("b", 2)
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), 2)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+
+    def test_single_flight_shares_one_call(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "value"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", fetch)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        while flight.shared < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual((calls, results), ([1], ["value"] * 5))
+
+        # An error reaches the caller and is not kept for the next call
+        def fail():
+            raise ValueError("down")
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: "again"), "again")
+
+    def test_cached_does_not_keep_none(self):
+        cache = LRUCache()
+        fetches = []
+        for _ in range(2):
+            cached(("none",), lambda: fetches.append(1), cache=cache)
+            cached(("one",), lambda: fetches.append(1) or 1, cache=cache)
+        self.assertEqual(len(fetches), 3)
+
+
+class MetricsRenderTests(InTemporaryDirectory):
+    def test_render(self):
+        sink = MetricsSink("cache")
+        self.addCleanup(sink.connection.close)
+        for seconds in (0.03, 0.3, 20.0):
+            sink.observe("screener_http_request_duration_seconds", seconds, view="value_area_check", status="200")
+        sink.inc("screener_api_requests_total", pool="spot")
+        sink.inc("screener_api_requests_total", 2, pool="spot")
+        sink.set("screener_symbols_screened", 5, job='say "hi"\\')
+        sink.set("screener_symbols_screened", 7, job='say "hi"\\')
+        sink.inc("not_a_known_metric")
+
+        text = render(sink.samples(), [("screener_extra", "gauge", "Computed at scrape time", [({}, 1)])])
+        labels = 'status="200",view="value_area_check"'
+        buckets = [f'screener_http_request_duration_seconds_bucket{{le="{bound}",{labels}}} {count}'
+                   for bound, count in [("0.005", "0.0"), ("0.01", "0.0"), ("0.025", "0.0"), ("0.05", "1.0"),
+                                        ("0.1", "1.0"), ("0.25", "1.0"), ("0.5", "2.0"), ("1.0", "2.0"),
+                                        ("2.5", "2.0"), ("5.0", "2.0"), ("10.0", "2.0"), ("+Inf", "3.0")]]
+        self.assertEqual(text.splitlines(), [
+            "# HELP screener_api_requests_total Exchange API requests by weight pool",
+            "# TYPE screener_api_requests_total counter",
+            'screener_api_requests_total{pool="spot"} 3.0',
+            "# HELP screener_http_request_duration_seconds Latency of the API views",
+            "# TYPE screener_http_request_duration_seconds histogram",
+            *buckets,
+            f"screener_http_request_duration_seconds_count{{{labels}}} 3.0",
+            f"screener_http_request_duration_seconds_sum{{{labels}}} 20.33",
+            "# HELP screener_symbols_screened Symbols screened by the last run of a job",
+            "# TYPE screener_symbols_screened gauge",
+            'screener_symbols_screened{job="say \\"hi\\"\\\\"} 7.0',
+            "# HELP screener_extra Computed at scrape time",
+            "# TYPE screener_extra gauge",
+            "screener_extra 1.0",
+        ])
+
+
+class FakeClock:
+    """time.time and time.sleep for code waiting on shared state: sleeping moves the clock."""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+        self.sleeps = []
+        self.on_sleep = None  # called before each sleep, e.g. to act as another process
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if self.on_sleep is not None:
+            self.on_sleep()
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def patch(self, test):
+        for name in ("time", "sleep"):
+            patcher = mock.patch(f"time.{name}", getattr(self, name))
+            patcher.start()
+            test.addCleanup(patcher.stop)
+
+
+class RateLimitTests(InTemporaryDirectory):
+    KLINES = {"cost": 0.4, "byLimit": [[99, 0.2], [499, 0.4], [1000, 0.8], [10000, 2]]}
+    FUTURES_KLINES = {"cost": 1, "byLimit": [[99, 1], [499, 2], [1000, 5], [10000, 10]]}
+
+    def test_request_weight(self):
+        self.assertEqual(request_weight("public", {"symbol": "BTCUSDT", "limit": 1000}, self.KLINES), ("spot", 4.0))
+        # Without a limit, Binance returns 500 candles
+        self.assertEqual(request_weight("public", {"symbol": "BTCUSDT"}, self.KLINES), ("spot", 4.0))
+        self.assertEqual(request_weight("public", {"symbol": "BTCUSDT", "limit": 499}, self.KLINES), ("spot", 2.0))
+        self.assertEqual(request_weight(["fapiPublic", "get"], {"limit": 499}, self.FUTURES_KLINES), ("futures", 2))
+        self.assertEqual(request_weight("dapiPublic", {}, 5), ("delivery", 5))
+        # The 24h ticker of every symbol weighs 40 instead of 1
+        tickers = {"cost": 0.2, "noSymbol": 8}
+        self.assertEqual(request_weight("public", {}, tickers), ("spot", 40))
+        self.assertEqual(request_weight("public", {"symbol": "BTCUSDT"}, tickers), ("spot", 1.0))
+
+    def test_buckets_on_one_file_share_the_budget(self):
+        clock = FakeClock()
+        clock.patch(self)
+        # Two processes' views of one bucket: 10 tokens, 5 per second
+        first = SharedTokenBucket("bucket.state", capacity=10, rate=5)
+        second = SharedTokenBucket("bucket.state", capacity=10, rate=5)
+        self.assertEqual(first.acquire(6), 0.0)
+        self.assertEqual(second.acquire(4), 0.0)
+        self.assertEqual(first.acquire(5), 1.0)
+        clock.now += 1
+        self.assertEqual(second.acquire(5), 0.0)
+        # Refills stop at the capacity, and larger requests wait for a full bucket
+        clock.now += 60
+        self.assertEqual(first.acquire(10), 0.0)
+        self.assertEqual(second.acquire(50), 2.0)
+
+    def test_installed_limiter_counts_weight_per_pool(self):
+        clock = FakeClock()
+        clock.patch(self)
+        exchange = mock.Mock(id="binance", spec=["id"])
+        state_dir = os.path.join(self.directory, "limits")
+        limiter = install_rate_limiter(exchange, state_dir=state_dir, share=0.5)
+        self.assertIs(install_rate_limiter(exchange, state_dir=state_dir), limiter)
+        # Half of 2400 per minute is 20 per second, 200 in the bucket
+        for _ in range(21):
+            self.assertEqual(limiter(["fapiPublic", "get"], "GET", "klines", {"limit": 1500}, self.FUTURES_KLINES), 0)
+        self.assertEqual(limiter.weight_used, {"futures": 210})
+        self.assertEqual(limiter.waited, 0.5)
+        self.assertTrue(os.path.exists(os.path.join(state_dir, "rate_limit_binance_futures.state")))
+
+        # Requests are batched into the metrics sink next to the bucket state
+        flush()
+        sink = MetricsSink(state_dir)
+        self.addCleanup(sink.connection.close)
+        self.assertEqual(sorted(sink.samples()), [
+            ("screener_api_requests_total", {"pool": "futures"}, 21.0),
+            ("screener_api_wait_seconds_total", {"pool": "futures"}, 0.5),
+            ("screener_api_weight_total", {"pool": "futures"}, 210.0),
+        ])
+
+
+def take_slot(path):
+    """Take a concurrency slot and exit without releasing it - in a child process."""
+    AdaptiveConcurrency(path).acquire()
+
+
+class ConcurrencyTests(InTemporaryDirectory):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.clock.patch(self)
+        self.controller = AdaptiveConcurrency("concurrency.state")
+
+    def test_window_grows_on_healthy_responses_and_halves_once_per_round_trip(self):
+        for _ in range(INITIAL_WINDOW):
+            lease, waited = self.controller.acquire()
+            self.controller.release(lease, 0.5)
+        self.assertAlmostEqual(self.controller.stats()["window"], 4.0 + 1 / 4 + 1 / 4.25 + 1 / 4.485 + 1 / 4.708,
+                               places=2)
+
+        # Responses in flight when the exchange throttles do not each halve the window
+        window = self.controller.stats()["window"]
+        leases = [self.controller.acquire()[0] for _ in range(3)]
+        self.controller.release(leases[0], 0.5, throttled=True, retry_after=5)
+        self.controller.release(leases[1], 0.5, throttled=True)
+        self.assertEqual(self.controller.stats()["window"], window / 2)
+        self.clock.now += 1
+        self.controller.release(leases[2], 0.5, used_weight=2300, weight_limit=2400)
+        self.assertEqual(self.controller.stats()["window"], window / 4)
+        self.assertEqual(self.controller.page_limit(1500), 499)
+
+        # Everyone waits out the throttling pause
+        stats = self.controller.stats()
+        self.assertEqual((stats["in_flight"], stats["used_weight"], stats["paused_for"]), (0, 2300, 9.0))
+        lease, waited = self.controller.acquire()
+        self.assertEqual(waited, 9.0)
+
+    def test_full_window_waits_for_a_release(self):
+        leases = [self.controller.acquire()[0] for _ in range(INITIAL_WINDOW)]
+        self.clock.on_sleep = lambda: self.controller.release(leases[0], 0.5)
+        lease, waited = self.controller.acquire()
+        self.assertEqual(self.clock.sleeps, [0.05])
+        self.assertEqual(self.controller.stats()["in_flight"], INITIAL_WINDOW)
+
+    def test_leases_of_dead_or_hung_holders_are_reclaimed(self):
+        process = multiprocessing.get_context("fork").Process(target=take_slot, args=("concurrency.state",))
+        process.start()
+        process.join()
+        self.assertEqual(self.controller.stats()["in_flight"], 0)
+
+        stale, _ = self.controller.acquire()
+        self.clock.now += LEASE_SECONDS + 1
+        self.assertEqual(self.controller.stats()["in_flight"], 0)
+        # Releasing a reclaimed lease leaves the slot's new holder alone
+        self.controller.acquire()
+        self.controller.release(stale, 0.5)
+        self.assertEqual(self.controller.stats()["in_flight"], 1)
+
+
+class MarketsExchange:
+    """Exchange whose load_markets() returns fixed markets and counts the calls."""
+
+    id = "stub"
+
+    def __init__(self, symbols=("BTC/USDT", "ETH/USDT")):
+        self.symbols = symbols
+        self.markets = None
+        self.currencies = None
+        self.options = {}
+        self.loads = 0
+        self.last_response_headers = None
+        self.last_request_url = None
+
+    def set_markets(self, markets, currencies=None):
+        self.markets, self.currencies = markets, currencies
+
+    def load_markets(self, reload=False):
+        self.loads += 1
+        self.set_markets({symbol: market(symbol, "spot") for symbol in self.symbols}, {"USDT": {"id": "USDT"}})
+        return self.markets
+
+
+class MarketsSnapshotTests(InTemporaryDirectory):
+    def test_one_load_serves_every_exchange_until_the_snapshot_is_stale(self):
+        first = MarketsExchange()
+        markets = preload_markets(first)
+        self.assertEqual(first.loads, 1)
+        path = snapshot_path("stub")
+        self.assertEqual(read_markets_snapshot(path)["markets"], markets)
+
+        second = MarketsExchange()
+        self.assertEqual(preload_markets(second), markets)
+        self.assertEqual((second.loads, second.currencies), (0, {"USDT": {"id": "USDT"}}))
+        # Unpickled once per process while the file is unchanged
+        self.assertIs(read_markets_snapshot(path), read_markets_snapshot(path))
+
+        stale = time.time() - 7 * 3600
+        os.utime(path, (stale, stale))
+        self.assertIsNone(read_markets_snapshot(path))
+        self.assertIsNotNone(read_markets_snapshot(path, ttl=None))
+        third = MarketsExchange(symbols=("BTC/USDT", "SOL/USDT"))
+        preload_markets(third)
+        self.assertEqual(third.loads, 1)
+        self.assertEqual(sorted(read_markets_snapshot(path)["markets"]), ["BTC/USDT", "SOL/USDT"])
+        self.assertEqual(diff_symbols(markets, third.markets), {"listed": ["SOL/USDT"], "delisted": ["ETH/USDT"]})
+
+    def test_damaged_snapshot_is_reloaded(self):
+        os.makedirs("cache")
+        with open(snapshot_path("stub"), "wb") as f:
+            f.write(b"not a pickle")
+        exchange = MarketsExchange()
+        preload_markets(exchange)
+        self.assertEqual(exchange.loads, 1)
+        self.assertEqual(sorted(read_markets_snapshot(snapshot_path("stub"))["markets"]), ["BTC/USDT", "ETH/USDT"])
+
+
+class PrefilterTests(InTemporaryDirectory):
+    def test_stages(self):
+        exchange = MarketsExchange()
+        tickers = {
+            "CHEAP/USDT": {"last": 0.0005, "high": 0.001, "low": 0.0001, "quoteVolume": 10 ** 7},
+            "THIN/USDT": {"last": 1.0, "high": 1.2, "low": 0.9, "quoteVolume": 1000},
+            "FLAT/USDT": {"last": 1.0, "high": 1.001, "low": 0.999, "quoteVolume": 10 ** 7},
+            "GOOD/USDT": {"last": 2.0, "high": 2.2, "low": 1.9, "quoteVolume": 10 ** 7},
+            "NOVOLUME/USDT": {"last": 3.0, "high": 3.3, "low": 2.9},
+            "NOPRICE/USDT": {"last": None},
+        }
+        exchange.fetch_tickers = lambda symbols: tickers
+        symbols = list(tickers) + ["MISSING/USDT"]
+
+        kept, prices, discarded = utils.prefilter_symbols(exchange, symbols)
+        self.assertEqual(kept, ["GOOD/USDT", "NOVOLUME/USDT", "NOPRICE/USDT", "MISSING/USDT"])
+        self.assertEqual(prices, {"GOOD/USDT": 2.0, "NOVOLUME/USDT": 3.0})
+        self.assertEqual(discarded, {"low_price": 1, "low_volume": 1, "flat_24h": 1})
+        # Markets were loaded on a copy, so the exchange sent to the workers stays small
+        self.assertIsNone(exchange.markets)
+
+    def test_failed_ticker_request_keeps_every_symbol(self):
+        exchange = MarketsExchange()
+        exchange.fetch_tickers = mock.Mock(side_effect=RuntimeError("down"))
+        with mock.patch("builtins.print"):
+            kept, prices, discarded = utils.prefilter_symbols(exchange, ["A/USDT", "B/USDT"])
+        self.assertEqual((kept, prices), (["A/USDT", "B/USDT"], {}))
+        self.assertEqual(sum(discarded.values()), 0)
+
+
+class ResultsStoreTests(InTemporaryDirectory):
+    def setups(self):
+        timestamp = pd.Timestamp(FEB_27_2025, unit="ms", tz="UTC")
+        return [
+            {"symbol": "AAA/USDT", "type": "bullish", "current_price": np.float64(1.5), "stop_loss": 1.2,
+             "risk_reward": 2, "alignment_type": "lower", "va_high": 2.0, "va_low": 1.0,
+             "fvg_1h": {"type": "bullish", "upper_line": 1.4, "lower_line": 1.3, "timestamp": timestamp,
+                        "gap_percent": 0.5},
+             "fvg_5m": {"upper_line": 1.45, "lower_line": 1.44, "gap_size": 0.01, "gap_percent": np.float32(0.25),
+                        "timestamp": timestamp + pd.Timedelta(minutes=5)}},
+            {"symbol": "BBB/USDT", "type": "bearish", "current_price": None, "stop_loss": 3.0,
+             "fvg_1h": {"type": "bearish", "upper_line": 2.4, "lower_line": 2.3, "timestamp": timestamp,
+                        "gap_percent": 0.7},
+             "fvg_5m": {"upper_line": 2.45, "lower_line": 2.44, "timestamp": timestamp}},
+        ]
+
+    def test_setups_round_trip(self):
+        setups = self.setups()
+        with ResultsWriter("results", "screener", {"market_type": "spot"}) as writer:
+            writer.write_setups(setups[:1])
+            # Rows are on disk as soon as a symbol is written
+            self.assertEqual(len(list(iter_setups(writer.path))), 1)
+            self.assertFalse(load_metadata(writer.path)["complete"])
+            writer.write_setups(setups[1:])
+
+        metadata = load_metadata(writer.path)
+        self.assertEqual((metadata["complete"], metadata["total_setups"], metadata["market_type"]), (True, 2, "spot"))
+        nested = list(iter_setups(writer.path, nested=True))
+        self.assertEqual(nested[0]["fvg_1h"]["timestamp"], "2025-02-27T00:00:00+00:00")
+        self.assertEqual(nested[0]["fvg_5m"]["gap_percent"], 0.25)
+        self.assertEqual(nested[1]["current_price"], None)
+        self.assertEqual(set(nested[0]), set(setups[0]))
+
+        frame = load_setups_frame(writer.path)
+        self.assertEqual(str(frame["symbol"].dtype), "category")
+        self.assertEqual(str(frame["fvg_5m_timestamp"].dtype), "datetime64[ns, UTC]")
+        self.assertEqual(frame["fvg_5m_timestamp"][0], setups[0]["fvg_5m"]["timestamp"])
+        self.assertTrue(np.isnan(frame["current_price"][1]))
+        self.assertEqual(list(load_setups_frame(writer.path, columns=["symbol", "missing"]).columns),
+                         ["symbol", "missing"])
+
+    def test_crashed_run(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with ResultsWriter("results", "screener") as writer:
+                writer.write_setups(self.setups())
+                raise KeyboardInterrupt
+        metadata = load_metadata(writer.path)
+        self.assertEqual((metadata["complete"], metadata["error"]), (False, "KeyboardInterrupt"))
+
+        # A partial last line is skipped
+        with open(writer.path, "a") as f:
+            f.write('{"symbol": "CC')
+        self.assertEqual([setup["symbol"] for setup in iter_setups(writer.path)], ["AAA/USDT", "BBB/USDT"])
+
+    def test_legacy_json_files(self):
+        setups = self.setups()
+        with open("legacy.json", "w") as f:
+            json.dump({"timestamp": "2025-02-27", "total_setups": 2, "setups": setups}, f, default=str)
+        self.assertEqual(load_metadata("legacy.json"), {"timestamp": "2025-02-27", "total_setups": 2})
+        flat = list(iter_setups("legacy.json"))
+        self.assertEqual(flat[0]["fvg_1h_upper_line"], 1.4)
+        self.assertEqual(list(iter_setups("legacy.json", nested=True))[1]["fvg_5m"], json.loads(json.dumps(
+            setups[1]["fvg_5m"], default=str)))
+        self.assertEqual(len(load_setups_frame("legacy.json")), 2)
+
+
+def random_setup_records(seed, count, extra=()):
+    """A setup array with random levels, directions, alignments and timestamps."""
+    rng = np.random.default_rng(seed)
+    records = new_setups(count, "TEST/USDT", extra=extra)
+    for name in records.dtype.names:
+        kind = records.dtype[name].kind
+        if kind == "f":
+            records[name] = rng.uniform(50, 150, count).round(int(rng.integers(1, 9)))
+        elif kind == "b":
+            records[name] = rng.random(count) < 0.5
+        elif kind == "i" and name != "alignment":
+            records[name] = FEB_27_2025 + rng.integers(0, 10 ** 9, count)
+    records["alignment"] = rng.integers(-1, len(ALIGNMENT_TYPES), count)
+    records["current_price"][::3] = np.nan
+    return records
+
+
+class SetupArrayTests(InTemporaryDirectory):
+    def test_written_records_match_written_dicts(self):
+        extra = (("confirmed_at", "i8"), ("score", "f8"))
+        for layout in ("pinescript", "three_candle"):
+            records = random_setup_records(1, 50, extra)
+            with ResultsWriter(layout, "from_records") as from_records:
+                from_records.write_records(records[:20], layout)
+                from_records.write_records(records[20:], layout)
+            with ResultsWriter(layout, "from_dicts") as from_dicts:
+                from_dicts.write_setups(setups_to_dicts(records, layout))
+            with open(from_records.path) as f, open(from_dicts.path) as g:
+                self.assertEqual(f.read(), g.read(), layout)
+            self.assertEqual(load_metadata(from_records.path)["total_setups"], 50)
+
+        with self.assertRaises(ValueError):
+            setups_to_dicts(records, "unknown")
+
+
+class ReplayTests(InTemporaryDirectory):
+    SYMBOL = "TEST/USDT"
+    AS_OF = FEB_27_2025 + 360 * FIVE_MINUTES_MS
+    WINDOW_MS = 12 * HOUR_MS
+    LOOKBACK_MS = 3 * 24 * HOUR_MS
+
+    def setUp(self):
+        super().setUp()
+        write_candles(self.SYMBOL, "1h", grid_candles(7, FEB_20_2025, HOUR_MS, 240), "candles")
+        write_candles(self.SYMBOL, "5m", grid_candles(107, FEB_27_2025, FIVE_MINUTES_MS, 600), "candles")
+
+    def replay(self):
+        records = replay.screen_as_of_records(self.SYMBOL, self.AS_OF, self.WINDOW_MS, self.LOOKBACK_MS, "candles")
+        return sorted(zip(records["fvg_5m_timestamp"].tolist(), records["fvg_1h_timestamp"].tolist(),
+                          records["bullish"].tolist(), records["va_high"].tolist(), records["va_low"].tolist()))
+
+    def loop_setups(self):
+        """Setups from the candles closed at AS_OF, checking each pair of gaps in turn."""
+        candles_1h = read_candles(self.SYMBOL, "1h", self.AS_OF - self.LOOKBACK_MS, self.AS_OF - HOUR_MS + 1, "candles")
+        candles_5m = read_candles(self.SYMBOL, "5m", self.AS_OF - self.WINDOW_MS, self.AS_OF - FIVE_MINUTES_MS + 1,
+                                  "candles")
+        gaps_1h = detect_gaps(candles_1h, replay.MIN_1H_GAP_PERCENT)
+        gaps_5m = detect_gaps(candles_5m, replay.MIN_5M_GAP_PERCENT)
+        setups = []
+        for i in range(len(gaps_5m["bullish"])):
+            bullish = bool(gaps_5m["bullish"][i])
+            day = gaps_5m["timestamp"][i] - gaps_5m["timestamp"][i] % (24 * HOUR_MS)
+            va_high, va_low = value_area_as_of(candles_1h, day)
+            if va_high is None or not (gaps_5m["upper_line"][i] < va_low if bullish else gaps_5m["lower_line"][i] > va_high):
+                continue
+            for j in range(len(gaps_1h["bullish"])):
+                line = gaps_1h["lower_line" if bullish else "upper_line"][j]
+                if gaps_5m["lower_line"][i] <= line <= gaps_5m["upper_line"][i] and \
+                        gaps_1h["timestamp"][j] + 2 * HOUR_MS <= gaps_5m["timestamp"][i] + 2 * FIVE_MINUTES_MS:
+                    setups.append((int(gaps_5m["timestamp"][i]), int(gaps_1h["timestamp"][j]), bullish,
+                                   float(va_high), float(va_low)))
+        return sorted(setups)
+
+    def test_matches_a_loop_and_ignores_later_candles(self):
+        setups = self.replay()
+        self.assertEqual(setups, self.loop_setups())
+        self.assertGreater(len(setups), 0)
+
+        # Rewriting every candle after AS_OF changes nothing
+        write_candles(self.SYMBOL, "1h", grid_candles(8, self.AS_OF, HOUR_MS, 48), "candles")
+        write_candles(self.SYMBOL, "5m", grid_candles(108, self.AS_OF, FIVE_MINUTES_MS, 240), "candles")
+        self.assertEqual(self.replay(), setups)
+
+    def test_as_of_points(self):
+        start = datetime(2025, 2, 1, tzinfo=timezone.utc)
+        points = replay.as_of_points(start, start + timedelta(days=3), timedelta(days=1), timedelta(hours=12))
+        self.assertEqual(points, [start + timedelta(hours=12 + 24 * day) for day in range(3)])
+
+
+def random_gaps(rng, count, start, step_ms):
+    """detect_gaps-like arrays of random gaps on PRICE_TICK, one per candle at most."""
+    lower = 100 + PRICE_TICK * rng.integers(-20, 20, count)
+    return {
+        "bullish": rng.random(count) < 0.5,
+        "lower_line": lower,
+        "upper_line": lower + PRICE_TICK * rng.integers(1, 8, count),
+        "timestamp": start + np.sort(rng.choice(100, count, replace=False)) * step_ms,
+    }
+
+
+def loop_confluences(gaps, timeframes, containing_price=None, same_direction=False):
+    """find_confluences by checking every combination of one gap per level."""
+    known = [level["timestamp"] + 2 * timeframe_to_ms(timeframe) for level, timeframe in zip(gaps, timeframes)]
+    paths = []
+    for path in itertools.product(*(range(len(level["bullish"])) for level in gaps)):
+        top = gaps[0]
+        if containing_price is not None and not top["lower_line"][path[0]] < containing_price < top["upper_line"][path[0]]:
+            continue
+        for level in range(1, len(gaps)):
+            parent, child, i, j = gaps[level - 1], gaps[level], path[level - 1], path[level]
+            line = parent["lower_line" if child["bullish"][j] else "upper_line"][i]
+            if not child["lower_line"][j] <= line <= child["upper_line"][j] or known[level - 1][i] > known[level][j]:
+                break
+            if same_direction and parent["bullish"][i] != child["bullish"][j]:
+                break
+        else:
+            paths.append(path)
+    return sorted(paths)
+
+
+class ConfluenceTests(InTemporaryDirectory):
+    def test_paths_match_a_loop(self):
+        timeframes = ["4h", "1h", "5m"]
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            gaps = [random_gaps(rng, int(rng.integers(0, 15)), FEB_27_2025 - 150 * HOUR_MS, timeframe_to_ms("4h")),
+                    random_gaps(rng, int(rng.integers(0, 25)), FEB_27_2025 - 100 * HOUR_MS, HOUR_MS),
+                    random_gaps(rng, int(rng.integers(0, 25)), FEB_27_2025 - 100 * FIVE_MINUTES_MS, 6 * FIVE_MINUTES_MS)]
+            for containing_price, same_direction in [(None, False), (None, True), (101.25, False)]:
+                paths = confluence.find_confluences(gaps, timeframes, containing_price, same_direction)
+                self.assertEqual(sorted(map(tuple, paths.tolist())),
+                                 loop_confluences(gaps, timeframes, containing_price, same_direction))
+                self.assertEqual(paths.shape[1], 3)
+
+    def test_missing_levels_are_resampled_from_closed_candles(self):
+        store_candles("TEST/USDT", "1h", grid_candles(3, FEB_20_2025, HOUR_MS, 240), "candles")
+        store_candles("TEST/USDT", "5m", grid_candles(103, FEB_27_2025, FIVE_MINUTES_MS, 600), "candles")
+        as_of = FEB_27_2025 + 6 * HOUR_MS
+        lookbacks = [7 * 24 * HOUR_MS, 7 * 24 * HOUR_MS, 12 * HOUR_MS]
+        levels, sources = confluence.load_chain("TEST/USDT", ["4h", "1h", "5m"], as_of, lookbacks, "candles")
+        self.assertEqual(sources, ["1h resampled", "1h", "5m"])
+        # Only complete 4H bars: the lookback starts at 06:00 on the first day, and the bar
+        # opening at 04:00 on the last one is still open at 06:00
+        self.assertEqual(int(levels[0]["timestamp"][0]), FEB_20_2025 + 8 * HOUR_MS)
+        self.assertEqual(int(levels[0]["timestamp"][-1]), FEB_27_2025)
+        self.assertEqual(int(levels[1]["timestamp"][-1]), as_of - HOUR_MS)
+        self.assertEqual(len(levels[2]), 72)
+
+
+class StrategyPassTests(SimpleTestCase):
+    def context(self, seed=3, current_price=100.0):
+        """The VectorizedAlignmentTests fixtures, where every strategy finds setups for some seed."""
+        fixtures = VectorizedAlignmentTests
+        candles_1h = grid_candles(seed, fixtures.START_1H, HOUR_MS, fixtures.LENGTH_1H)
+        candles_5m = grid_candles(seed + 100, fixtures.START_5M, FIVE_MINUTES_MS, fixtures.LENGTH_5M)
+        return strategies.SymbolContext("TEST/USDT", current_price, candles_1h, candles_5m)
+
+    def test_one_pass_runs_every_strategy_on_shared_primitives(self):
+        found = set()
+        for seed in VectorizedAlignmentTests.SEEDS:
+            expected = []
+            for name, strategy in strategies.STRATEGIES.items():
+                expected += [dict(setup, strategy=name) for setup in strategy["align"](self.context(seed), strategy)]
+            found |= {setup["strategy"] for setup in expected}
+
+            context = self.context(seed)
+            detectors = {name: mock.Mock(wraps=detector) for name, detector in context.DETECTORS.items()}
+            with mock.patch.object(strategies.SymbolContext, "DETECTORS", detectors):
+                setups = strategies.evaluate_strategies(context)
+            self.assertEqual(canonical(setups), canonical(expected))
+            # Each detector runs once per timeframe, whatever the number of strategies using it
+            self.assertEqual([detector.call_count for detector in detectors.values()], [2, 2])
+            self.assertEqual(strategies.evaluate_strategies(self.context(seed), ["either_line"]),
+                             [setup for setup in expected if setup["strategy"] == "either_line"])
+        self.assertEqual(found, set(strategies.STRATEGIES))
+
+    def test_price_and_range_gates(self):
+        cheap = [name for name, strategy in strategies.STRATEGIES.items() if strategy["min_price"] > 0.0005]
+        ranged = [name for name, strategy in strategies.STRATEGIES.items() if strategy["min_range"]]
+        names = {setup["strategy"] for setup in strategies.evaluate_strategies(self.context())}
+        self.assertTrue(names & set(cheap) and names & set(ranged))
+
+        names = {setup["strategy"] for setup in strategies.evaluate_strategies(self.context(current_price=0.0005))}
+        self.assertFalse(names & set(cheap))
+
+        # The same candles against a minimum range just above theirs
+        candles_1h = self.context().candles["1h"]
+        price_range = (candles_1h["high"].max() - candles_1h["low"].min()) / candles_1h["low"].min()
+        with mock.patch.dict(strategies.STRATEGIES, {
+                name: dict(strategies.STRATEGIES[name], min_range=price_range * 1.01) for name in ranged}):
+            names = {setup["strategy"] for setup in strategies.evaluate_strategies(self.context())}
+        self.assertFalse(names & set(ranged))
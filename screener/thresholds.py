@@ -0,0 +1,13 @@
+# Minimum gap sizes in %, per screener. Library modules (strategies, replay,
+# confluence) read them from here rather than importing the scripts.
+
+# utils.process_symbol: 3-candle gaps on 1H and 5M
+MIN_GAP_PERCENT = 0.42
+
+# run_2025_crypto_screener.custom_process_symbol: PineScript gaps
+PINESCRIPT_MIN_1H_GAP_PERCENT = 0.4
+PINESCRIPT_MIN_5M_GAP_PERCENT = 0.1
+
+# test_fvg_detection / test_fvg_alignment: PineScript gaps, either line aligned
+ALIGNMENT_MIN_1H_GAP_PERCENT = 0.042
+ALIGNMENT_MIN_5M_GAP_PERCENT = 0.01
@@ -3,50 +3,87 @@ import numpy as np
 from datetime import datetime, timezone, timedelta
 import os
 import json
+import zlib
 import ccxt
-import time
+import copy
+import itertools
+from collections import Counter
 from concurrent.futures import ProcessPoolExecutor
 
-# Minimum gap percentage for FVGs (0.42%)
-MIN_GAP_PERCENT = 0.42
-
-def get_value_area_pairs(exchange, symbols, market_type, start_of_month, percentage=0.84):
+try:
+    from screener.candle_store import (write_candles, load_candles, read_candles, fetch_candles, timeframe_to_ms,
+                                       to_candles, bucket_starts, merge_candles, missing_ranges)
+    from screener.cache_manifest import CACHE_DIR, cache_manifest
+    from screener.instrumentation import RunTimings, count, format_stages, measured, timed
+    from screener.markets_snapshot import preload_markets
+    from screener.symbol_registry import load_registry
+    from screener.concurrency import pool_workers, request_slot
+    from screener.memory_cache import cached, key_lock
+    from screener.detection import detect_price_gaps, detect_three_candle_gaps, lines_in_ranges
+    from screener.zones import (new_setups, set_zones, setups_to_dicts, three_candle_bounds,
+                                three_candle_zones, zones_from_three_candle_gaps)
+    from screener.thresholds import MIN_GAP_PERCENT
+except ImportError:
+    from candle_store import (write_candles, load_candles, read_candles, fetch_candles, timeframe_to_ms,
+                              to_candles, bucket_starts, merge_candles, missing_ranges)
+    from cache_manifest import CACHE_DIR, cache_manifest
+    from instrumentation import RunTimings, count, format_stages, measured, timed
+    from markets_snapshot import preload_markets
+    from symbol_registry import load_registry
+    from concurrency import pool_workers, request_slot
+    from memory_cache import cached, key_lock
+    from detection import detect_price_gaps, detect_three_candle_gaps, lines_in_ranges
+    from zones import (new_setups, set_zones, setups_to_dicts, three_candle_bounds,
+                       three_candle_zones, zones_from_three_candle_gaps)
+    from thresholds import MIN_GAP_PERCENT
+
+HOUR_MS = timeframe_to_ms("1h")
+
+# Bulk 24h ticker pre-filter, applied before any candles are downloaded
+MIN_PRICE = 0.001  # Symbols priced lower often have lower liquidity
+MIN_24H_QUOTE_VOLUME = 500000  # Quote currency (USDT) traded in the last 24h
+MIN_24H_RANGE = 0.005  # Less than 0.5% high/low range in 24h is flat
+
+# Stages that can discard a symbol, in the order they run
+SCREENING_STAGES = [
+    "low_price",               # 24h ticker: last price below MIN_PRICE
+    "low_volume",              # 24h ticker: quote volume below MIN_24H_QUOTE_VOLUME
+    "flat_24h",                # 24h ticker: high/low range below MIN_24H_RANGE
+    "no_1h_data",
+    "flat_90d",                # 1H: less than 5% range over 3 months
+    "no_1h_fvg",
+    "no_zone_in_5m_window",    # 1H: no zone line inside the 5M window's high/low
+    "no_5m_data",
+    "error",
+]
+
+def get_value_area_pairs(exchange, symbols, market_type, start_of_month, percentage=0.84, registry=None):
     vah_val_results = []
+    if registry is None:
+        registry = load_registry(exchange)
 
     for symbol in symbols:
         try:
             since = int(start_of_month.timestamp() * 1000)
             
             if market_type == "spot":
-                symbol = symbol.split(':')[0]  # Remove ':USDT' part for spot market
-                if symbol.startswith('1000'):
-                    symbol = symbol[4:]  # Remove '1000' prefix
+                # Spot market of the same asset, e.g. PEPE/USDT for 1000PEPE/USDT:USDT
+                symbol = registry.spot_symbol(symbol)
+                if symbol is None:
+                    continue
             elif market_type == "futures":
                 symbol = symbol  # Keep the symbol as is for futures market
 
-            # Fetch OHLCV data
-            ohlcv = exchange.fetch_ohlcv(symbol, "4h", since)
-            if not ohlcv:
-                continue
-
-            # Convert to DataFrame with all OHLCV columns
-            df = pd.DataFrame(
-                ohlcv, columns=["Timestamp", "Open", "High", "Low", "Close", "Volume"]
-            )
-            df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit="ms")
-            df.set_index("Timestamp", inplace=True)
-
-            # Ensure DataFrame has the correct index and columns
-            if not all(
-                col in df.columns for col in ["Open", "High", "Low", "Close", "Volume"]
-            ):
+            # Get 4H OHLCV data, resampled from stored candles where possible
+            candles = load_candles(exchange, symbol, "4h", since)
+            if len(candles) == 0:
                 continue
 
-            # Calculate VAH and VAL using TA-Lib
-            vah, val = calculate_value_area(df, percentage)
+            # Calculate VAH and VAL straight from the candle arrays
+            vah, val = calculate_value_area(candles, percentage)
 
             # Get the current price
-            ticker = exchange.fetch_ticker(symbol)
+            ticker = get_ticker(exchange, symbol)
             current_price = ticker["last"]
 
             # Check if the current price is above VAH or below VAL
@@ -64,20 +101,26 @@ def get_value_area_pairs(exchange, symbols, market_type, start_of_month, percent
 
     return vah_val_results
 
-def calculate_value_area(df, percentage=0.84, bins=100):
+def calculate_value_area(candles, percentage=0.84, bins=100):
     """
     Calculates the value area based on volume.
 
     Args:
-        df (pd.DataFrame): The price and volume data.
+        candles (np.ndarray): Candle records (candle_store.CANDLE_DTYPE); a
+            DataFrame with Close/Volume columns is also accepted.
         percentage (float): The percentage of total volume.
         bins (int): The number of bins for the histogram.
 
     Returns:
         tuple: (value_area_high, value_area_low)
     """
+    if isinstance(candles, pd.DataFrame):
+        closes, volumes = candles['Close'].to_numpy(), candles['Volume'].to_numpy()
+    else:
+        closes, volumes = candles['close'], candles['volume']
+
     # Create a histogram of volume distribution
-    histogram, bin_edges = np.histogram(df['Close'], bins=bins, weights=df['Volume'])
+    histogram, bin_edges = np.histogram(closes, bins=bins, weights=volumes)
 
     # Find the point of control (POC)
     poc_index = np.argmax(histogram)
@@ -124,116 +167,200 @@ def is_price_within_fvg(exchange, symbol, current_price, min_gap=0, consider_ope
         start_of_last_year = datetime(now.year - 1, 1, 1, tzinfo=timezone.utc)
         since = int(start_of_last_year.timestamp() * 1000)
 
-        # Fetch OHLCV data for the 1-day timeframe from the beginning of last year
-        ohlcv = exchange.fetch_ohlcv(symbol, '1d', since)
-        if not ohlcv:
+        # Get 1-day OHLCV data from the beginning of last year, resampled from stored candles where possible
+        candles = load_candles(exchange, symbol, '1d', since)
+        if len(candles) == 0:
             return False
 
-        # Convert to DataFrame
-        df = pd.DataFrame(ohlcv, columns=["Timestamp", "Open", "High", "Low", "Close", "Volume"])
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit="ms")
-        df.set_index("Timestamp", inplace=True)
-
         # Identify FVGs
-        fvg_list = []
-        for i in range(1, len(df) - 1):
-            prev_high = df.iloc[i - 1]["High"]
-            curr_low = df.iloc[i]["Low"]
-            next_low = df.iloc[i + 1]["Low"]
-
-            # Check for FVG
-            if curr_low > prev_high and (curr_low - prev_high) >= min_gap:
-                fvg_list.append((prev_high, curr_low))
-            elif next_low > curr_low and (next_low - curr_low) >= min_gap:
-                fvg_list.append((curr_low, next_low))
+        gaps = detect_price_gaps(candles, min_gap)
+        lower, upper = gaps["lower"], gaps["upper"]
 
         # Check if current price is within any FVG
-        for fvg in fvg_list:
-            if consider_open_close:
-                if fvg[0] <= current_price <= fvg[1]:
-                    return True
-            else:
-                if fvg[0] < current_price < fvg[1]:
-                    return True
-
-        return False
+        if consider_open_close:
+            return bool(np.any((lower <= current_price) & (current_price <= upper)))
+        return bool(np.any((lower < current_price) & (current_price < upper)))
     except Exception as e:
         print(f"Error checking FVG for {symbol}: {e}")
         return False
 
-# Cache expiry time in seconds
-CACHE_EXPIRY = 3600  # 1 hour cache validity
+# Seconds a fetched ticker is reused within a run
+TICKER_TTL = 60
 
-def load_cached_data(symbol, timeframe):
-    """Get OHLCV data from cache if available and not expired."""
-    clean_symbol = symbol.replace('/', '_').replace(':', '_')
-    
-    cache_dir = os.path.join("cache")
-    if not os.path.exists(cache_dir):
-        return None
-    
-    cache_file = os.path.join(cache_dir, f"{clean_symbol}_{timeframe}.json")
-    if os.path.exists(cache_file):
-        # Check if cache is still valid
-        cache_age = time.time() - os.path.getmtime(cache_file)
-        if cache_age < CACHE_EXPIRY:
-            try:
-                df = pd.read_json(cache_file)
-                if not df.empty:
-                    return df
-            except:
-                pass
-    
-    return None
+def get_ticker(exchange, symbol, ttl=TICKER_TTL):
+    """Fetch a ticker, reusing one fetched for the same symbol in the last `ttl` seconds."""
+    def fetch():
+        with request_slot(exchange):
+            return exchange.fetch_ticker(symbol)
+
+    with timed("ticker_fetch"):
+        return cached(("ticker", exchange.id, exchange.options.get("defaultType"), symbol), fetch, ttl)
 
-def save_cached_data(symbol, timeframe, df):
-    """Save OHLCV data to cache."""
+def cache_file(symbol, timeframe, cache_dir=CACHE_DIR):
+    """Path of the OHLCV cache file of a symbol and timeframe."""
     clean_symbol = symbol.replace('/', '_').replace(':', '_')
-    
-    cache_dir = os.path.join("cache")
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    
-    cache_file = os.path.join(cache_dir, f"{clean_symbol}_{timeframe}.json")
+    return os.path.join(cache_dir, f"{clean_symbol}_{timeframe}.json")
+
+def load_cached_data(entry):
+    """
+    Get OHLCV candles from the cache file of a manifest entry.
+
+    Returns None if the file is missing or does not match the entry's
+    checksum, e.g. after a crash mid-write or while another process is
+    replacing it.
+    """
+    def read():
+        try:
+            with open(entry["path"], 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if zlib.crc32(data) != entry["checksum"]:
+            return None
+        with timed("array_build"):
+            rows = json.loads(data)
+            return to_candles(rows) if rows else None
+
+    # Decode and verify each version of the file once per process
+    return cached(("json", entry["path"], entry["fetched_at"], entry["checksum"]), read)
+
+def save_cached_data(symbol, timeframe, candles):
+    """
+    Save OHLCV candles to cache as ccxt-style [timestamp, open, high, low, close, volume] rows.
+
+    The file is written under a temporary name and renamed into place, so
+    readers in other processes see either the old or the new file, never
+    a partial one. Callers hold the key's lock (memory_cache.key_lock).
+
+    Returns:
+        tuple: (path, bytes written, CRC-32), or None if the file could not be written
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_file(symbol, timeframe)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    data = json.dumps(candles.tolist()).encode()
     try:
-        df_copy = df.copy()
-        df_copy.to_json(cache_file, date_format='iso')
-    except:
-        pass  # If saving fails, just continue without caching
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"\rProcessing symbol {symbol} - Error caching candles: {str(e)}", end="")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return None
+    return path, len(data), zlib.crc32(data)
+
+def repair_cached_data(symbol, timeframe, entry):
+    """
+    Closed bars of a damaged cache entry, rebuilt from the candle store.
+
+    Returns:
+        np.ndarray: Candle records in [covered_since, closed_until), or None
+            if the store does not hold all of them
+    """
+    candles = read_candles(symbol, timeframe, entry["covered_since"], entry["closed_until"])
+    # The range starts at the first bar opening at or after covered_since
+    if len(candles) == 0 or candles["timestamp"][0] - entry["covered_since"] >= timeframe_to_ms(timeframe) or \
+            missing_ranges(candles, timeframe, int(candles["timestamp"][0]), entry["closed_until"]):
+        return None
+    return np.asarray(candles)
 
 def get_ohlcv_data(exchange, symbol, timeframe, since):
-    """Get OHLCV data, using cache if available."""
+    """
+    Get OHLCV candles, using cache if available.
+
+    The cache manifest (cache_manifest.CacheManifest) decides how much has to
+    be downloaded: nothing while the open tail is fresh, only the bars from
+    the first one open at the last fetch once it has expired, and everything
+    for symbols not cached from `since`.
+
+    Returns:
+        np.ndarray: Candle records (candle_store.CANDLE_DTYPE) ordered by
+            time, or None if nothing could be fetched
+    """
+    # Timed as "ohlcv_fetch.<outcome>": hit, incremental, miss, empty or error
+    with timed("ohlcv_fetch") as timer:
+        candles, outcome = fetch_ohlcv_data(exchange, symbol, timeframe, since)
+        timer.stage = f"ohlcv_fetch.{outcome}"
+    count(f"ohlcv_{outcome}")
+    return candles
+
+def fetch_ohlcv_data(exchange, symbol, timeframe, since):
+    """
+    get_ohlcv_data without instrumentation.
+
+    Returns:
+        tuple: (candle records or None, outcome)
+    """
+    manifest = cache_manifest()
+
     # Try to load from cache first
-    cached_df = load_cached_data(symbol, timeframe)
-    if cached_df is not None:
-        # Check if we need to fetch more recent data
-        latest_cached = cached_df.index.max()
-        latest_required = pd.Timestamp(since, unit='ms', tz='UTC')
-        
-        if latest_cached >= latest_required:
-            # Only keep needed columns to save memory
-            needed_columns = ['Open', 'High', 'Low', 'Close']
-            return cached_df[needed_columns]
+    entry = manifest.lookup(symbol, timeframe)
+    if manifest.plan(entry, since) == "hit":
+        cached_candles = load_cached_data(entry)
+        if cached_candles is not None:
+            manifest.record_hit(entry)
+            return cached_candles, "hit"
     
-    # If no cache or cache is old, fetch new data
+    # If no cache or its open tail is old, fetch what is missing
     try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since)
-        if not ohlcv:
-            return None
-        
-        df = pd.DataFrame(ohlcv, columns=["Timestamp", "Open", "High", "Low", "Close", "Volume"])
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit="ms", utc=True)
-        df.set_index("Timestamp", inplace=True)
+        # Workers missing the same data at once take turns; later ones reuse the first one's cache file
+        with key_lock(("ohlcv", symbol, timeframe)):
+            # Another process may have committed a fresh entry while this one waited
+            entry = manifest.lookup(symbol, timeframe)
+            plan = manifest.plan(entry, since)
+            cached_candles = load_cached_data(entry) if plan != "miss" else None
+            if cached_candles is not None and plan == "hit":
+                manifest.record_hit(entry)
+                return cached_candles, "hit"
+            if plan != "miss" and cached_candles is None:
+                # Nobody else is writing this key, so the file is damaged: rebuild its
+                # closed bars from the candle store and only fetch the tail
+                cached_candles = repair_cached_data(symbol, timeframe, entry)
+                manifest.record_corrupt(entry, cached_candles is not None)
+                plan = "incremental" if cached_candles is not None else "miss"
+
+            timeframe_ms = timeframe_to_ms(timeframe)
+            open_since = int(bucket_starts([exchange.milliseconds()], timeframe)[0])
+            # Page up to and including the open bar: a single request stops at the exchange's page size
+            if plan == "incremental":
+                # Bars closed at the last fetch never change; only refetch from the first open one
+                fetched = fetch_candles(exchange, symbol, timeframe, entry["closed_until"], open_since + timeframe_ms)
+                timestamps = cached_candles["timestamp"]
+                kept = cached_candles[(timestamps >= since) & (timestamps < entry["closed_until"])]
+                with timed("array_build"):
+                    candles = merge_candles(kept, fetched) if len(fetched) else kept
+                kept_rows = len(kept)
+            else:
+                candles = fetch_candles(exchange, symbol, timeframe, since, open_since + timeframe_ms)
+                kept_rows = 0
+            if len(candles) == 0:
+                return None, "empty"
+
+            # Bars after the last one the exchange returned are not closed in the cache, whatever the clock says
+            covered_until = int(candles["timestamp"][-1]) + timeframe_ms
+            closed_until = min(open_since, covered_until)
+
+            # Save to cache and register the covered range
+            saved = save_cached_data(symbol, timeframe, candles)
+            if saved is not None:
+                manifest.record_fetch(
+                    symbol, timeframe, saved[0], since, covered_until, closed_until,
+                    len(candles), saved[1], saved[2], kept_rows=kept_rows, previous=entry,
+                )
         
-        # Save to cache
-        save_cached_data(symbol, timeframe, df)
+            # Keep the full history in the candle store for backtests and replays
+            try:
+                write_candles(symbol, timeframe, candles)
+            except Exception as e:
+                print(f"\rProcessing symbol {symbol} - Error storing candles: {str(e)}", end="")
         
-        # Only keep needed columns to save memory
-        needed_columns = ['Open', 'High', 'Low', 'Close']
-        return df[needed_columns]
+            return candles, plan
     except Exception as e:
         print(f"\rProcessing symbol {symbol} - Error: {str(e)}", end="")
-        return None
+        return None, "error"
 
 def check_fvg(exchange, symbol, timeframe="1h", consider_open_close=True):
     """
@@ -250,206 +377,200 @@ def check_fvg(exchange, symbol, timeframe="1h", consider_open_close=True):
     """
     try:
         # Get current price
-        ticker = exchange.fetch_ticker(symbol)
+        ticker = get_ticker(exchange, symbol)
         current_price = ticker['last']
         
         # Get OHLCV data for the symbol
         since = int((datetime.now(timezone.utc) - timedelta(days=90)).timestamp() * 1000)
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since)
+        with request_slot(exchange):
+            ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since)
         
         if len(ohlcv) < 3:
             return False
         
-        # Convert to pandas dataframe
-        df = pd.DataFrame(ohlcv, columns=["Timestamp", "Open", "High", "Low", "Close", "Volume"])
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit="ms", utc=True)
-        df.set_index("Timestamp", inplace=True)
-        
-        # Find FVG patterns
-        fvg_list = []
-        min_gap = 0  # Can filter out small FVGs
-        
-        for i in range(1, len(df)-1):
-            prev_high = df.iloc[i-1]["High"]
-            prev_low = df.iloc[i-1]["Low"]
-            curr_high = df.iloc[i]["High"]
-            curr_low = df.iloc[i]["Low"]
-            next_high = df.iloc[i+1]["High"]
-            next_low = df.iloc[i+1]["Low"]
-            
-            # Calculate reference price for percentage calculation (closing price of the middle candle)
-            reference_price = df.iloc[i]["Close"]
-
-            # Check for FVG
-            if curr_low > prev_high:
-                gap_size = curr_low - prev_high
-                gap_percent = (gap_size / reference_price) * 100
-                if gap_percent >= MIN_GAP_PERCENT:
-                    fvg_list.append((prev_high, curr_low))
-            elif next_low > curr_low:
-                gap_size = next_low - curr_low
-                gap_percent = (gap_size / reference_price) * 100
-                if gap_percent >= MIN_GAP_PERCENT:
-                    fvg_list.append((curr_low, next_low))
+        # Find FVG patterns, keeping gaps of at least MIN_GAP_PERCENT of the
+        # middle candle's close
+        gaps = detect_price_gaps(to_candles(ohlcv))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gap_percent = (gaps["upper"] - gaps["lower"]) / gaps["reference"] * 100
+        keep = gap_percent >= MIN_GAP_PERCENT
+        lower, upper = gaps["lower"][keep], gaps["upper"][keep]
 
         # Check if current price is within any FVG
-        for fvg in fvg_list:
-            if consider_open_close:
-                if fvg[0] <= current_price <= fvg[1]:
-                    return True
-            else:
-                if fvg[0] < current_price < fvg[1]:
-                    return True
-
-        return False
+        if consider_open_close:
+            return bool(np.any((lower <= current_price) & (current_price <= upper)))
+        return bool(np.any((lower < current_price) & (current_price < upper)))
     except Exception as e:
         print(f"Error checking FVG for {symbol}: {e}")
         return False
 
+def prefilter_symbols(exchange, symbols, min_price=MIN_PRICE, min_quote_volume=MIN_24H_QUOTE_VOLUME,
+                      min_range=MIN_24H_RANGE):
+    """
+    First screening stage: drop cheap, illiquid or flat symbols from one bulk 24h ticker request.
+
+    Symbols missing from the response are kept and checked by the workers.
+
+    Args:
+        exchange (ccxt.Exchange): The exchange object
+        symbols (list): List of trading pair symbols
+        min_price (float): Minimum last price
+        min_quote_volume (float): Minimum 24h volume in the quote currency
+        min_range (float): Minimum 24h (high - low) / low
+
+    Returns:
+        tuple: (kept symbols, {symbol: last price}, {stage: discarded count})
+    """
+    discarded = {"low_price": 0, "low_volume": 0, "flat_24h": 0}
+    try:
+        # Load markets on a copy so the exchange pickled to every worker stays small
+        ticker_exchange = copy.copy(exchange)
+        preload_markets(ticker_exchange)
+        with timed("ticker_fetch"), request_slot(ticker_exchange):
+            tickers = ticker_exchange.fetch_tickers(symbols)
+    except Exception as e:
+        print(f"Error fetching 24h tickers, skipping pre-filter: {e}")
+        return list(symbols), {}, discarded
+
+    kept = []
+    prices = {}
+    for symbol in symbols:
+        ticker = tickers.get(symbol)
+        if not ticker or ticker.get("last") is None:
+            kept.append(symbol)
+            continue
+
+        last, high, low = ticker["last"], ticker.get("high"), ticker.get("low")
+        quote_volume = ticker.get("quoteVolume")
+        if last < min_price:
+            discarded["low_price"] += 1
+        elif quote_volume is not None and quote_volume < min_quote_volume:
+            discarded["low_volume"] += 1
+        elif high and low and (high - low) / low < min_range:
+            discarded["flat_24h"] += 1
+        else:
+            kept.append(symbol)
+            prices[symbol] = last
+    return kept, prices, discarded
+
 def process_symbol(data):
     """Process a single symbol for FVG setups - for parallel processing."""
-    symbol, exchange, market_type, recent_period = data
+    return process_symbol_staged(data)[0]
+
+def process_symbol_staged(data):
+    """
+    Process a single symbol for FVG setups, reporting where it was discarded.
+
+    Args:
+        data (tuple): (symbol, exchange, market_type, recent_period), optionally
+            followed by the current price when it is already known from
+            prefilter_symbols
+
+    Returns:
+        tuple: (setups, stage) where stage is the SCREENING_STAGES entry that
+            discarded the symbol, or None if it was fully screened
+    """
+    symbol, exchange, market_type, recent_period = data[:4]
+    current_price = data[4] if len(data) > 4 else None
     fvg_setups = []
     
     try:
-        # Get current price
-        ticker = exchange.fetch_ticker(symbol)
-        current_price = ticker["last"]
+        # Markets come from the shared snapshot rather than a load_markets() per worker
+        preload_markets(exchange)
+        
+        # Get current price unless the bulk tickers already provided it
+        if current_price is None:
+            ticker = get_ticker(exchange, symbol)
+            current_price = ticker["last"]
         
         # Skip symbols with price too low (often have lower liquidity)
-        if current_price < 0.001:
-            return []
+        if current_price < MIN_PRICE:
+            return [], "low_price"
 
         # Fetch 1H data (3 months)
         since_1h = int((datetime.now(timezone.utc) - timedelta(days=90)).timestamp() * 1000)
-        df_1h = get_ohlcv_data(exchange, symbol, "1h", since_1h)
-        if df_1h is None or len(df_1h) < 3:  # Need at least 3 candles for FVG
-            return []
+        candles_1h = get_ohlcv_data(exchange, symbol, "1h", since_1h)
+        if candles_1h is None or len(candles_1h) < 3:  # Need at least 3 candles for FVG
+            return [], "no_1h_data"
             
         # Check price volatility - skip low volatility coins
-        price_range = (df_1h['High'].max() - df_1h['Low'].min()) / df_1h['Low'].min()
+        lowest = candles_1h['low'].min()
+        price_range = (candles_1h['high'].max() - lowest) / lowest
         if price_range < 0.05:  # Less than 5% range
-            return []
-
-        # Find 1H FVGs using vectorized operations
-        fvg_1h_list = []
-        for i in range(1, len(df_1h) - 1):
-            # Bullish FVG: Gap between i-1 high and i+1 low - with minimum gap filter
-            if df_1h.iloc[i-1]["High"] < df_1h.iloc[i+1]["Low"]:
-                # Calculate gap size as percentage of price
-                gap_size = df_1h.iloc[i+1]["Low"] - df_1h.iloc[i-1]["High"]
-                gap_percent = (gap_size / df_1h.iloc[i-1]["Close"]) * 100
-                
-                # Only include FVGs with gap >= MIN_GAP_PERCENT
-                if gap_percent >= MIN_GAP_PERCENT:
-                    fvg_1h_list.append({
-                        "type": "bullish",
-                        "high": df_1h.iloc[i]["High"],
-                        "low": df_1h.iloc[i+1]["Low"],
-                        "timestamp": df_1h.index[i],
-                        "gap_percent": gap_percent
-                    })
-                    
-            # Bearish FVG: Gap between i+1 high and i-1 low - with minimum gap filter
-            if df_1h.iloc[i+1]["High"] > df_1h.iloc[i-1]["Low"]:
-                # Calculate gap size as percentage of price
-                gap_size = df_1h.iloc[i+1]["High"] - df_1h.iloc[i-1]["Low"]
-                gap_percent = (gap_size / df_1h.iloc[i-1]["Close"]) * 100
-                
-                # Only include FVGs with gap >= MIN_GAP_PERCENT
-                if gap_percent >= MIN_GAP_PERCENT:
-                    fvg_1h_list.append({
-                        "type": "bearish",
-                        "high": df_1h.iloc[i+1]["High"],
-                        "low": df_1h.iloc[i]["Low"],
-                        "timestamp": df_1h.index[i],
-                        "gap_percent": gap_percent
-                    })
+            return [], "flat_90d"
+
+        # Find 1H FVGs on the whole candle array at once
+        with timed("fvg_detection"):
+            zones_1h = zones_from_three_candle_gaps(candles_1h, detect_three_candle_gaps(candles_1h), MIN_GAP_PERCENT)
+        count("fvg_1h", len(zones_1h))
 
         # If no 1H FVGs found, return empty list
-        if not fvg_1h_list:
-            return []
+        if len(zones_1h) == 0:
+            return [], "no_1h_fvg"
+
+        # A setup needs 5M price to cross a 1H zone line, so skip the 5M download
+        # when no line lies inside the window's high/low (known from the 1H candles)
+        window_start = int(recent_period.timestamp() * 1000)
+        recent_1h = candles_1h[candles_1h['timestamp'] >= window_start - window_start % HOUR_MS]
+        if len(recent_1h) == 0:
+            return [], "no_zone_in_5m_window"
+        window_high, window_low = recent_1h['high'].max(), recent_1h['low'].min()
+        zone_high, zone_low = three_candle_bounds(zones_1h)
+        zone_lines = np.where(zones_1h["bullish"], zone_high, zone_low)
+        if not ((zone_lines >= window_low) & (zone_lines <= window_high)).any():
+            return [], "no_zone_in_5m_window"
 
         # Fetch 5M data (for the recent period)
         since_5m = int(recent_period.timestamp() * 1000)
-        df_5m = get_ohlcv_data(exchange, symbol, "5m", since_5m)
-        if df_5m is None or len(df_5m) < 3:  # Need at least 3 candles for FVG
-            return []
-
-        # Check for interactions with any 1H FVG, regardless of when it formed
-        for fvg_1h in fvg_1h_list:
-            # Process all 5M candles
-            for i in range(2, len(df_5m) - 1):  # Start at 2 to allow for i-2 check
-                if fvg_1h["type"] == "bullish":
-                    # Check if this is a bullish 5M FVG formation - with minimum gap filter
-                    bullish_gap = df_5m.iloc[i+1]["Low"] - df_5m.iloc[i-1]["High"]
-                    bullish_gap_percent = (bullish_gap / df_5m.iloc[i-1]["Close"]) * 100
-                    
-                    is_bullish_5m_fvg = (df_5m.iloc[i-1]["High"] < df_5m.iloc[i+1]["Low"] and 
-                                         bullish_gap_percent >= MIN_GAP_PERCENT)
-                    
-                    # Check if price crossed into the upper line of the 1H FVG
-                    crossed_upper_line = (df_5m.iloc[i-2]["High"] < fvg_1h["high"] and 
-                                       df_5m.iloc[i-1]["High"] >= fvg_1h["high"])
-                    
-                    # Check if the 1H FVG line falls within the 5M FVG range
-                    fvg_on_upper_line = df_5m.iloc[i-1]["High"] <= fvg_1h["high"] <= df_5m.iloc[i+1]["Low"]
-                    
-                    if is_bullish_5m_fvg and crossed_upper_line and fvg_on_upper_line:
-                        fvg_setups.append({
-                            "symbol": symbol,
-                            "type": "bullish",
-                            "current_price": current_price,
-                            "fvg_1h": fvg_1h,
-                            "fvg_5m": {
-                                "high": df_5m.iloc[i-1]["High"],
-                                "low": df_5m.iloc[i+1]["Low"],
-                                "gap_size": bullish_gap,
-                                "gap_percent": bullish_gap_percent,
-                                "timestamp": df_5m.index[i]
-                            },
-                            "stop_loss": df_5m.iloc[i]["High"],
-                            "risk_reward": 2  # Default to 2R, can be adjusted
-                        })
-                else:  # bearish
-                    # Check if this is a bearish 5M FVG formation - with minimum gap filter
-                    bearish_gap = df_5m.iloc[i+1]["High"] - df_5m.iloc[i-1]["Low"]
-                    bearish_gap_percent = (bearish_gap / df_5m.iloc[i-1]["Close"]) * 100
-                    
-                    is_bearish_5m_fvg = (df_5m.iloc[i+1]["High"] > df_5m.iloc[i-1]["Low"] and 
-                                         bearish_gap_percent >= MIN_GAP_PERCENT)
-                    
-                    # Check if price crossed into the lower line of the 1H FVG
-                    crossed_lower_line = (df_5m.iloc[i-2]["Low"] > fvg_1h["low"] and 
-                                       df_5m.iloc[i-1]["Low"] <= fvg_1h["low"])
-                    
-                    # Check if the 1H FVG line falls within the 5M FVG range
-                    fvg_on_lower_line = df_5m.iloc[i-1]["Low"] <= fvg_1h["low"] <= df_5m.iloc[i+1]["High"]
-                    
-                    if is_bearish_5m_fvg and crossed_lower_line and fvg_on_lower_line:
-                        fvg_setups.append({
-                            "symbol": symbol,
-                            "type": "bearish",
-                            "current_price": current_price,
-                            "fvg_1h": fvg_1h,
-                            "fvg_5m": {
-                                "high": df_5m.iloc[i+1]["High"],
-                                "low": df_5m.iloc[i-1]["Low"],
-                                "gap_size": bearish_gap,
-                                "gap_percent": bearish_gap_percent,
-                                "timestamp": df_5m.index[i]
-                            },
-                            "stop_loss": df_5m.iloc[i]["Low"],
-                            "risk_reward": 2  # Default to 2R, can be adjusted
-                        })
+        candles_5m = get_ohlcv_data(exchange, symbol, "5m", since_5m)
+        if candles_5m is None or len(candles_5m) < 3:  # Need at least 3 candles for FVG
+            return [], "no_5m_data"
+
+        # Check for interactions with any 1H FVG, regardless of when it formed.
+        # Bullish: 5M candle i-2 is below the zone high, candle i-1 reaches it and
+        # the line sits inside the 5M gap; bearish mirrors this on the zone low.
+        with timed("fvg_detection"):
+            gaps_5m = detect_three_candle_gaps(candles_5m)
+        highs, lows = candles_5m["high"], candles_5m["low"]
+        with timed("alignment"):
+            zone_parts, zones_5m = [], []
+            for direction in ("bullish", "bearish"):
+                zone_index = np.flatnonzero(zones_1h["bullish"] == (direction == "bullish"))
+                gaps = gaps_5m[direction]
+                # Start at i=2 to allow for the i-2 check
+                candidates = (gaps["index"] >= 2) & (gaps["gap_percent"] >= MIN_GAP_PERCENT)
+                i = gaps["index"][candidates]
+                if direction == "bullish":
+                    range_low = np.maximum(highs[i - 1], np.nextafter(highs[i - 2], np.inf))
+                    range_high = np.minimum(highs[i - 1], lows[i + 1])
+                else:
+                    range_low = lows[i - 1]
+                    range_high = np.minimum(highs[i + 1], np.nextafter(lows[i - 2], -np.inf))
+                ranges, lines = lines_in_ranges(zone_lines[zone_index], range_low, range_high)
+                zone_parts.append(zone_index[lines])
+                zones_5m.append(three_candle_zones(candles_5m, gaps_5m, direction, candidates)[ranges])
+
+            # Setups by 1H zone, then by 5M candle
+            zone_index, zones_5m = np.concatenate(zone_parts), np.concatenate(zones_5m)
+            order = np.lexsort((zones_5m["timestamp"], zone_index))
+            zone_index, zones_5m = zone_index[order], zones_5m[order]
+
+            records = new_setups(len(order), symbol)
+            records["bullish"] = zones_5m["bullish"]
+            records["current_price"] = current_price
+            set_zones(records, "1h", zones_1h[zone_index])
+            set_zones(records, "5m", zones_5m)
+            records["stop_loss"] = np.where(zones_5m["bullish"], zones_5m["middle_candle_high"], zones_5m["middle_candle_low"])
+            fvg_setups = setups_to_dicts(records, layout="three_candle")
+        count("setups", len(fvg_setups))
         
-        return fvg_setups
+        return fvg_setups, None
     
     except Exception as e:
         print(f"\rProcessing symbol {symbol} - Error: {str(e)}", end="")
-        return []
+        return [], "error"
 
-def find_fvg_setups(exchange, symbols, market_type):
+def find_fvg_setups(exchange, symbols, market_type, writer=None):
     """
     Screens for Fair Value Gap (FVG) setups on 1H and 5M timeframes.
     All historical 1H FVGs will be considered regardless of when they formed.
@@ -458,39 +579,73 @@ def find_fvg_setups(exchange, symbols, market_type):
         exchange (ccxt.Exchange): The exchange object
         symbols (list): List of trading pair symbols
         market_type (str): Either "spot" or "futures"
+        writer (ResultsWriter, optional): Streams each symbol's setups to disk as
+            soon as they complete instead of keeping them in memory
         
     Returns:
-        list: List of FVG setups
+        list: List of FVG setups (empty when a writer is given)
     """
-    total_symbols = len(symbols)
+    timings = RunTimings()
+
+    # Stage 1: one bulk 24h ticker request instead of a candle download per symbol
+    screened_symbols, prices, discarded = prefilter_symbols(exchange, symbols)
+    discarded = Counter(discarded)
+    
+    total_symbols = len(screened_symbols)
     # We'll still look for 5M FVGs in the recent past (last 7 days) for performance reasons
     recent_period = datetime.now(timezone.utc) - timedelta(days=7)
     
+    print(f"\nPre-filter kept {total_symbols}/{len(symbols)} symbols from 24h tickers")
     print(f"\nProcessing {total_symbols} symbols using parallel processing...")
     print(f"Using minimum FVG gap filter: {MIN_GAP_PERCENT}% of price")
     
-    # Setup for parallel processing
-    max_workers = min(os.cpu_count(), 4)  # Use up to 4 CPU cores
-    
     # Prepare data for parallel processing
-    symbol_data = [(symbol, exchange, market_type, recent_period) for symbol in symbols]
+    symbol_data = [
+        (symbol, exchange, market_type, recent_period, prices.get(symbol))
+        for symbol in screened_symbols
+    ]
     
     all_setups = []
+    total_found = 0
+    cache_before = cache_manifest().stats()
     
     # Process in chunks to avoid memory issues
     chunk_size = 50
     for i in range(0, len(symbol_data), chunk_size):
         chunk = symbol_data[i:i+chunk_size]
         
-        # Process symbols in parallel
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            results = list(executor.map(process_symbol, chunk))
+        # Use up to 4 CPU cores, or more workers while the shared request window is wider
+        max_workers = pool_workers(exchange, min(os.cpu_count(), 4))
         
-        # Flatten results
-        chunk_setups = [setup for symbol_setups in results for setup in symbol_setups]
-        all_setups.extend(chunk_setups)
+        # Process symbols in parallel, handling each symbol's results as they arrive
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(measured, itertools.repeat(process_symbol_staged), chunk)
+            for (symbol_setups, stage), sample in results:
+                timings.add(sample, stage)
+                if stage is not None:
+                    discarded[stage] += 1
+                total_found += len(symbol_setups)
+                if writer is not None:
+                    writer.write_setups(symbol_setups)
+                else:
+                    all_setups.extend(symbol_setups)
         
-        print(f"\rProcessed {min(i+chunk_size, total_symbols)}/{total_symbols} symbols, found {len(all_setups)} setups so far...", end="")
+        print(f"\rProcessed {min(i+chunk_size, total_symbols)}/{total_symbols} symbols, found {total_found} setups so far...", end="")
     
     print("\n\nScreening complete!")
+    print("Symbols discarded per stage:")
+    for stage in SCREENING_STAGES:
+        print(f"- {stage}: {discarded[stage]}")
+    cache_stats = cache_manifest().stats(cache_before)
+    print(f"OHLCV cache: {cache_stats['hit_rate']:.0%} hits, {cache_stats['incremental']} tail refreshes, "
+          f"{cache_stats['misses']} full downloads, {cache_stats['bytes_saved'] / 1e6:.1f} MB saved, "
+          f"{cache_stats['bytes'] / 1e6:.1f}/{cache_stats['max_bytes'] / 1e6:.0f} MB on disk")
+    report = timings.report()
+    print("Time per stage:")
+    for line in format_stages(report):
+        print(line)
+    if writer is not None:
+        writer.metadata["discarded_per_stage"] = {stage: discarded[stage] for stage in SCREENING_STAGES}
+        writer.metadata["ohlcv_cache"] = cache_stats
+        writer.write_timings(report)
     return all_setups
\ No newline at end of file
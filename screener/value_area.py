@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from candle_store import timeframe_to_ms, resample_candles
+from utils import calculate_value_area
+
+HOUR_MS = timeframe_to_ms("1h")
+DAY_MS = timeframe_to_ms("1d")
+
+# Share of monthly volume that makes up the value area, as in get_monthly_value_area
+VALUE_AREA_PERCENT = 70
+
+
+def month_starts(timestamps):
+    """Epoch ms of the first day of the month for each timestamp."""
+    months = np.asarray(timestamps, dtype="datetime64[ms]").astype("datetime64[M]")
+    return months.astype("datetime64[ms]").astype("i8")
+
+
+def month_bounds(month_start):
+    """[start, end) of the month starting at `month_start`, in epoch ms."""
+    month = pd.Timestamp(month_start, unit="ms", tz="UTC")
+    return month_start, int((month + pd.offsets.MonthBegin(1)).timestamp() * 1000)
+
+
+def volume_days_value_area(days, percent=VALUE_AREA_PERCENT):
+    """
+    Value area from the highest-volume days, as in get_monthly_value_area.
+
+    Days are taken in order of volume until they make up `percent` of the
+    total; the value area spans their highs and lows.
+    """
+    order = np.argsort(-days["volume"], kind="stable")
+    volume_percent = np.cumsum(days["volume"][order]) / days["volume"].sum() * 100
+    value_area_days = order[volume_percent <= percent]
+    if len(value_area_days) < 1:
+        value_area_days = order[:1]
+    return float(days["high"][value_area_days].max()), float(days["low"][value_area_days].min())
+
+
+def range_value_area(high, low, percent=VALUE_AREA_PERCENT):
+    """Fallback value area: `percent` of the range centered on its middle."""
+    mid_price = (high + low) / 2
+    va_range = (high - low) * percent / 100
+    return min(mid_price + va_range / 2, high), max(mid_price - va_range / 2, low)
+
+
+def monthly_volume_days_value_areas(candles_1h, months, percent=VALUE_AREA_PERCENT):
+    """
+    Daily-volume value area per month start (epoch ms), from stored 1H candles.
+
+    Months with fewer than 3 days of data fall back to the range of the
+    month, like the monthly-candle fallback of get_monthly_value_area.
+    """
+    areas = {}
+    timestamps = candles_1h["timestamp"]
+    for month_start in np.unique(months):
+        start_ms, end_ms = month_bounds(month_start)
+        start = np.searchsorted(timestamps, start_ms, side="left")
+        end = np.searchsorted(timestamps, end_ms, side="left")
+        if end <= start:
+            areas[month_start] = (None, None)
+            continue
+        days = resample_candles(candles_1h[start:end], "1d")
+        if len(days["timestamp"]) < 3:
+            areas[month_start] = range_value_area(float(days["high"].max()), float(days["low"].min()), percent)
+        else:
+            areas[month_start] = volume_days_value_area(days, percent)
+    return areas
+
+
+def monthly_profile_value_areas(candles_1h, months, percentage, min_candles=24):
+    """Volume-profile value area (calculate_value_area) per month start, from 1H candles."""
+    areas = {}
+    timestamps = candles_1h["timestamp"]
+    for month_start in np.unique(months):
+        start_ms, end_ms = month_bounds(month_start)
+        start = np.searchsorted(timestamps, start_ms, side="left")
+        end = np.searchsorted(timestamps, end_ms, side="left")
+        if end - start < min_candles:
+            areas[month_start] = (None, None)
+            continue
+        areas[month_start] = calculate_value_area(candles_1h[start:end], percentage=percentage, bins=100)
+    return areas
+
+
+def value_area_as_of(candles_1h, as_of_ms, percent=VALUE_AREA_PERCENT):
+    """
+    Monthly value area as it could have been computed at a point in time.
+
+    Mirrors get_monthly_value_area, but only uses days of the month that had
+    closed by `as_of_ms`. Early in the month, with fewer than 3 closed days,
+    it falls back to the month-to-date range of closed 1H candles.
+
+    Returns:
+        tuple: (va_high, va_low), or (None, None) if there is no data yet
+    """
+    as_of = pd.Timestamp(as_of_ms, unit="ms", tz="UTC")
+    month_start = int(datetime(as_of.year, as_of.month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    day_start = as_of_ms - as_of_ms % DAY_MS
+
+    timestamps = candles_1h["timestamp"]
+    start = np.searchsorted(timestamps, month_start, side="left")
+    end = np.searchsorted(timestamps, day_start, side="left")
+    days = resample_candles(candles_1h[start:end], "1d") if end > start else None
+
+    if days is None or len(days["timestamp"]) < 3:
+        end = np.searchsorted(timestamps, as_of_ms - HOUR_MS, side="right")
+        if end <= start:
+            return None, None
+        return range_value_area(float(np.max(candles_1h["high"][start:end])),
+                                float(np.min(candles_1h["low"][start:end])), percent)
+
+    return volume_days_value_area(days, percent)
+
+
+def value_area_arrays(areas, keys):
+    """Look up (va_high, va_low) arrays for a key per item, with NaN where unknown."""
+    va_high = np.array([np.nan if areas[key][0] is None else areas[key][0] for key in keys], dtype="f8")
+    va_low = np.array([np.nan if areas[key][1] is None else areas[key][1] for key in keys], dtype="f8")
+    return va_high, va_low
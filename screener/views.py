@@ -1,26 +1,82 @@
-from django.http import JsonResponse
+import os
+import time
+from collections import Counter
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.views import View
-from django.db.models import Count
+from django.db.models import Count, Max, Sum
 from django.utils import timezone
 from datetime import timedelta
-from .models import ValueAreaResult
+from .models import ValueAreaHourlyRollup, ValueAreaResult
+from .cache_manifest import MANIFEST_NAME, cache_manifest
+from .metrics import metrics_sink, record, render
+
+# Metrics sink and OHLCV cache shared with the cron commands
+METRICS_DIR = os.path.join(settings.BASE_DIR, 'cache')
+
+class LatencyMetricsMixin:
+    """Records each request's latency in the metrics sink, labelled by view and status."""
+    metrics_name = None
+
+    def dispatch(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        record(METRICS_DIR, "observe", "screener_http_request_duration_seconds", time.perf_counter() - start,
+               view=self.metrics_name or type(self).__name__, status=str(response.status_code))
+        return response
+
+class ValueAreaCheckView(LatencyMetricsMixin, View):
+    metrics_name = 'value_area_check'
 
-class ValueAreaCheckView(View):
     def get(self, request, *args, **kwargs):
         try:
             # Calculate the timestamp for 24 hours ago
             last_24_hours = timezone.now() - timedelta(hours=24)
+            first_full_hour = last_24_hours.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            
+            # Sum the hourly rollup over the hours fully inside the window
+            counts = Counter()
+            for result in (ValueAreaHourlyRollup.objects
+                           .filter(hour__gte=first_full_hour)
+                           .values('symbol')
+                           .annotate(symbol_count=Sum('hits'))):
+                counts[result['symbol']] += result['symbol_count']
             
-            # Filter results from the last 24 hours, annotate with count, and order by count
-            results = (ValueAreaResult.objects
-                       .filter(timestamp__gte=last_24_hours)
-                       .values('symbol')
-                       .annotate(symbol_count=Count('symbol'))
-                       .order_by('-symbol_count'))
+            # and count the results of the partial hour the window starts in
+            for result in (ValueAreaResult.objects
+                           .filter(timestamp__gte=last_24_hours, timestamp__lt=first_full_hour)
+                           .values('symbol')
+                           .annotate(symbol_count=Count('symbol'))):
+                counts[result['symbol']] += result['symbol_count']
             
-            # Extract the symbols from the results
-            symbols = [result['symbol'] for result in results]
+            # Order the symbols by count
+            symbols = [symbol for symbol, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
             
             return JsonResponse(symbols, safe=False)
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+            return JsonResponse({'error': str(e)}, status=500)
+
+class MetricsView(View):
+    """Prometheus text exposition of the metrics sink, plus cache and data freshness read at scrape time."""
+
+    def get(self, request, *args, **kwargs):
+        extra = []
+
+        # OHLCV cache counters live in the cache manifest rather than the sink
+        if os.path.exists(os.path.join(METRICS_DIR, MANIFEST_NAME)):
+            stats = cache_manifest(METRICS_DIR).stats()
+            extra.append(('screener_ohlcv_cache_requests_total', 'counter', 'OHLCV cache lookups by outcome',
+                          [({'outcome': outcome}, stats[outcome]) for outcome in ('hits', 'incremental', 'misses')]))
+            extra.append(('screener_ohlcv_cache_hit_ratio', 'gauge', 'Share of OHLCV cache lookups served without a download',
+                          [({}, stats['hit_rate'])]))
+            extra.append(('screener_ohlcv_cache_bytes', 'gauge', 'Bytes of cached OHLCV files',
+                          [({}, stats['bytes'])]))
+
+        # How stale the data behind the value area API is
+        latest = ValueAreaResult.objects.aggregate(latest=Max('timestamp'))['latest']
+        if latest is not None:
+            extra.append(('screener_value_area_latest_result_timestamp_seconds', 'gauge',
+                          'Unix time of the newest value area result', [({}, latest.timestamp())]))
+
+        body = render(metrics_sink(METRICS_DIR).samples(), extra)
+        return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
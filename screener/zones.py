@@ -0,0 +1,342 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+# Prices are stored as float64 by default; float32 halves the size of large
+# zone/setup arrays at the cost of ~7 significant digits
+PRICE_DTYPE = "f8"
+
+# One FVG zone. Lines are the gap boundaries, the middle candle high/low
+# are kept for stops, timestamps are epoch ms of the middle candle.
+ZONE_FIELDS = (
+    ("bullish", "?"),
+    ("upper_line", None),
+    ("lower_line", None),
+    ("middle_candle_high", None),
+    ("middle_candle_low", None),
+    ("gap_percent", "f8"),
+    ("timestamp", "i8"),
+)
+
+# alignment_type values of pinescript-style setups, stored as an index
+ALIGNMENT_TYPES = ("lower", "upper", "bullish_1h_with_5m", "bearish_1h_with_5m")
+
+# Every screener so far uses a fixed 2R target
+RISK_REWARD = 2
+
+# Setup dict layouts the converters can produce:
+#   "pinescript"   - custom_process_symbol, replay and the PineScript strategies
+#   "three_candle" - utils.process_symbol and the crossed_line strategy
+LAYOUTS = ("pinescript", "three_candle")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def zone_dtype(price_dtype=PRICE_DTYPE):
+    """Structured dtype of a zone array with prices stored as `price_dtype`."""
+    return np.dtype([(name, dtype or price_dtype) for name, dtype in ZONE_FIELDS])
+
+
+def setup_dtype(price_dtype=PRICE_DTYPE, extra=()):
+    """
+    Structured dtype of a setup array: one 1H and one 5M zone plus trade levels.
+
+    Args:
+        price_dtype (str): "f8" or "f4"
+        extra (iterable): Additional (name, dtype) fields appended at the end;
+            int64 fields are written out as timestamps
+    """
+    fields = [
+        ("symbol", "U32"),
+        ("bullish", "?"),
+        ("alignment", "i1"),  # index into ALIGNMENT_TYPES, -1 if none
+        ("current_price", price_dtype),
+        ("stop_loss", price_dtype),
+        ("va_high", price_dtype),
+        ("va_low", price_dtype),
+    ]
+    for timeframe in ("1h", "5m"):
+        fields += [(f"fvg_{timeframe}_{name}", dtype or price_dtype) for name, dtype in ZONE_FIELDS]
+    return np.dtype(fields + list(extra))
+
+
+ZONE_DTYPE = zone_dtype()
+SETUP_DTYPE = setup_dtype()
+
+
+def zones_from_gaps(gaps, keep=None, price_dtype=PRICE_DTYPE):
+    """
+    Zone array from detection.detect_gaps output.
+
+    Args:
+        gaps (dict): Gap arrays keyed by detection.GAP_FIELDS
+        keep (np.ndarray, optional): Boolean mask or indices of gaps to keep
+        price_dtype (str): Price storage type
+    """
+    def pick(values):
+        return values if keep is None else values[keep]
+
+    zones = np.empty(len(pick(gaps["timestamp"])), dtype=zone_dtype(price_dtype))
+    zones["bullish"] = pick(gaps["bullish"])
+    zones["upper_line"] = pick(gaps["upper_line"])
+    zones["lower_line"] = pick(gaps["lower_line"])
+    zones["middle_candle_high"] = pick(gaps["middle_high"])
+    zones["middle_candle_low"] = pick(gaps["middle_low"])
+    zones["gap_percent"] = pick(gaps["gap_percent"])
+    zones["timestamp"] = pick(gaps["timestamp"])
+    return zones
+
+
+def three_candle_zones(candles, gaps, direction, keep=None, price_dtype=PRICE_DTYPE):
+    """
+    Zone array of one direction from detection.detect_three_candle_gaps output.
+
+    A bullish gap runs from the high before the middle candle up to the low
+    after it; a bearish one from the low before up to the high after it.
+
+    Args:
+        candles (np.ndarray): Candle records the gaps were detected on
+        gaps (dict): {"bullish": {...}, "bearish": {...}} gap arrays
+        direction (str): "bullish" or "bearish"
+        keep (np.ndarray, optional): Boolean mask or indices of gaps to keep
+        price_dtype (str): Price storage type
+    """
+    found = gaps[direction]
+    index = found["index"] if keep is None else found["index"][keep]
+    highs, lows = np.asarray(candles["high"], dtype="f8"), np.asarray(candles["low"], dtype="f8")
+
+    zones = np.empty(len(index), dtype=zone_dtype(price_dtype))
+    zones["bullish"] = direction == "bullish"
+    if direction == "bullish":
+        zones["upper_line"], zones["lower_line"] = lows[index + 1], highs[index - 1]
+    else:
+        zones["upper_line"], zones["lower_line"] = highs[index + 1], lows[index - 1]
+    zones["middle_candle_high"] = highs[index]
+    zones["middle_candle_low"] = lows[index]
+    zones["gap_percent"] = found["gap_percent"] if keep is None else found["gap_percent"][keep]
+    zones["timestamp"] = found["timestamp"] if keep is None else found["timestamp"][keep]
+    return zones
+
+
+def zones_from_three_candle_gaps(candles, gaps, min_gap_percent=0.0, price_dtype=PRICE_DTYPE):
+    """
+    Zone array of both directions from detection.detect_three_candle_gaps output.
+
+    Zones come out in the order utils.process_symbol finds them: by middle
+    candle, a bullish zone before a bearish one on the same candle.
+    """
+    index, zones = [], []
+    for direction in ("bullish", "bearish"):
+        keep = gaps[direction]["gap_percent"] >= min_gap_percent
+        index.append(gaps[direction]["index"][keep])
+        zones.append(three_candle_zones(candles, gaps, direction, keep, price_dtype))
+    # Stable sort keeps bullish ahead of bearish on the same candle
+    return np.concatenate(zones)[np.argsort(np.concatenate(index), kind="stable")]
+
+
+def three_candle_bounds(zones):
+    """
+    (high, low) of three-candle zones as utils.process_symbol reports them.
+
+    A bullish zone spans the middle candle high and the low after it; a
+    bearish one the high after the middle candle and its low.
+    """
+    bullish = zones["bullish"]
+    high = np.where(bullish, zones["middle_candle_high"], zones["upper_line"])
+    low = np.where(bullish, zones["upper_line"], zones["middle_candle_low"])
+    return high, low
+
+
+def new_setups(count, symbol, price_dtype=PRICE_DTYPE, extra=()):
+    """Empty setup array for one symbol; fields default to NaN/-1 where optional."""
+    setups = np.zeros(count, dtype=setup_dtype(price_dtype, extra))
+    setups["symbol"] = symbol
+    setups["alignment"] = -1
+    setups["va_high"] = np.nan
+    setups["va_low"] = np.nan
+    return setups
+
+
+def set_zones(setups, timeframe, zones):
+    """Copy zone records into the fvg_<timeframe>_* fields of a setup array."""
+    for name, _ in ZONE_FIELDS:
+        setups[f"fvg_{timeframe}_{name}"] = zones[name]
+
+
+class RecordView:
+    """
+    Attribute access to one record of a zone or setup array.
+
+    Holds only the array and a position, so single items can be passed
+    around without copying them into dicts.
+    """
+
+    __slots__ = ("records", "position")
+
+    def __init__(self, records, position):
+        self.records = records
+        self.position = position
+
+    def __getattr__(self, name):
+        if name in RecordView.__slots__:
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name):
+        try:
+            value = self.records[name][self.position]
+        except (KeyError, ValueError):
+            raise KeyError(name) from None
+        return value.item() if isinstance(value, np.generic) else value
+
+    @property
+    def type(self):
+        return "bullish" if self.records["bullish"][self.position] else "bearish"
+
+    def as_dict(self):
+        """Plain dict of the record's fields."""
+        return {name: self[name] for name in self.records.dtype.names}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()})"
+
+
+def iter_records(records):
+    """RecordView for each record of an array."""
+    for position in range(len(records)):
+        yield RecordView(records, position)
+
+
+def _timestamp(ms):
+    return pd.Timestamp(ms, unit="ms", tz="UTC")
+
+
+def _isoformat(ms):
+    return (EPOCH + timedelta(milliseconds=ms)).isoformat()
+
+
+def zones_to_dicts(zones):
+    """Zone dicts with type, upper/lower line, timestamp and gap percent, as the PineScript screeners list them."""
+    return [
+        {
+            "type": "bullish" if bullish else "bearish",
+            "upper_line": upper_line,
+            "lower_line": lower_line,
+            "timestamp": _timestamp(timestamp),
+            "gap_percent": gap_percent
+        }
+        for bullish, upper_line, lower_line, gap_percent, timestamp in zip(
+            zones["bullish"].tolist(), zones["upper_line"].tolist(), zones["lower_line"].tolist(),
+            zones["gap_percent"].tolist(), zones["timestamp"].tolist())
+    ]
+
+
+def _nested_setups(records, layout, timestamp):
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown setup layout: {layout}")
+    names = records.dtype.names
+    extra = [(name, records.dtype[name].kind == "i") for name in names[names.index("fvg_5m_timestamp") + 1:]]
+
+    setups = []
+    for values in records.tolist():
+        row = dict(zip(names, values))
+        bullish = row["bullish"]
+        direction = "bullish" if bullish else "bearish"
+        current_price = row["current_price"]
+        if current_price != current_price:  # NaN: price unknown
+            current_price = None
+        upper_5m, lower_5m = row["fvg_5m_upper_line"], row["fvg_5m_lower_line"]
+
+        if layout == "pinescript":
+            setup = {
+                "symbol": row["symbol"],
+                "type": direction,
+                "current_price": current_price,
+                "fvg_1h": {
+                    "type": "bullish" if row["fvg_1h_bullish"] else "bearish",
+                    "upper_line": row["fvg_1h_upper_line"],
+                    "lower_line": row["fvg_1h_lower_line"],
+                    "timestamp": timestamp(row["fvg_1h_timestamp"]),
+                    "gap_percent": row["fvg_1h_gap_percent"]
+                },
+                "fvg_5m": {
+                    "upper_line": upper_5m,
+                    "lower_line": lower_5m,
+                    "middle_candle_high": row["fvg_5m_middle_candle_high"],
+                    "middle_candle_low": row["fvg_5m_middle_candle_low"],
+                    "gap_size": upper_5m - lower_5m,
+                    "gap_percent": row["fvg_5m_gap_percent"],
+                    "timestamp": timestamp(row["fvg_5m_timestamp"])
+                },
+                "stop_loss": row["stop_loss"],
+                "risk_reward": RISK_REWARD,
+                "alignment_type": ALIGNMENT_TYPES[row["alignment"]] if row["alignment"] >= 0 else None,
+                "va_high": row["va_high"],
+                "va_low": row["va_low"]
+            }
+        else:
+            zone_bullish = row["fvg_1h_bullish"]
+            setup = {
+                "symbol": row["symbol"],
+                "type": direction,
+                "current_price": current_price,
+                "fvg_1h": {
+                    "type": "bullish" if zone_bullish else "bearish",
+                    "high": row["fvg_1h_middle_candle_high"] if zone_bullish else row["fvg_1h_upper_line"],
+                    "low": row["fvg_1h_upper_line"] if zone_bullish else row["fvg_1h_middle_candle_low"],
+                    "timestamp": timestamp(row["fvg_1h_timestamp"]),
+                    "gap_percent": row["fvg_1h_gap_percent"]
+                },
+                "fvg_5m": {
+                    "high": lower_5m if bullish else upper_5m,
+                    "low": upper_5m if bullish else lower_5m,
+                    "gap_size": upper_5m - lower_5m,
+                    "gap_percent": row["fvg_5m_gap_percent"],
+                    "timestamp": timestamp(row["fvg_5m_timestamp"])
+                },
+                "stop_loss": row["stop_loss"],
+                "risk_reward": RISK_REWARD
+            }
+
+        for name, is_timestamp in extra:
+            setup[name] = timestamp(row[name]) if is_timestamp else row[name]
+        setups.append(setup)
+    return setups
+
+
+def setups_to_dicts(records, layout="pinescript"):
+    """
+    Setup dicts, in the shape the screeners have always built, from a setup array.
+
+    Args:
+        records (np.ndarray): Setup array (see setup_dtype)
+        layout (str): One of LAYOUTS
+
+    Returns:
+        list: Nested setup dicts with pd.Timestamp timestamps
+    """
+    return _nested_setups(records, layout, _timestamp)
+
+
+def setup_rows(records, layout="pinescript"):
+    """
+    Flattened, JSON-ready rows from a setup array.
+
+    Same rows results_store.flatten_setup makes from setups_to_dicts(),
+    without building Timestamps along the way.
+    """
+    rows = []
+    for setup in _nested_setups(records, layout, _isoformat):
+        row = {}
+        for key, value in setup.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    row[f"{key}_{sub_key}"] = sub_value
+            else:
+                row[key] = value
+        rows.append(row)
+    return rows